@@ -0,0 +1,110 @@
+import glob
+import os
+import tempfile
+from functools import partial
+
+import pandas as pd
+
+from src.col_tests.utils.column_tests import get_all_test_results, get_test_results
+from src.col_tests.utils.read_input import parse_template
+from src.comparison_factors.utils.build_factors import build_factors
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+from src.lake_modelling.utils.reference_data import _abs_path, lime_product_table
+from src.lake_modelling.utils.run_products import run_multiple_products
+
+COLUMN_TESTS_DIR = "data/column_tests_2023"
+
+# Registered benchmark cases {name: (setup, number, repeat)}. See 'benchmark'
+CASES = {}
+
+
+def benchmark(name, number=10, repeat=5):
+    """Register a benchmark case. The decorated function performs any setup
+    (not timed) and returns a callable with no arguments, which is timed.
+
+    Args
+        name:   Str. Unique name of the case
+        number: Int. Number of calls per timing
+        repeat: Int. Number of timings
+    """
+
+    def register(setup):
+        assert name not in CASES, f"Benchmark '{name}' is already registered."
+        CASES[name] = (setup, number, repeat)
+        return setup
+
+    return register
+
+
+@benchmark("lake.monthly_flows", number=1000)
+def lake_monthly_flows():
+    lake = Lake()
+    return lambda: lake.monthly_flows
+
+
+@benchmark("lime_product.init", number=1000)
+def lime_product_init():
+    return lambda: LimeProduct("Microdol1")
+
+
+def _model_run(n_months, dt, solver):
+    model = Model(Lake(), LimeProduct("Microdol1"), n_months=n_months)
+    return lambda: model.run(dt=dt, solver=solver)
+
+
+for n_months, dt in ((12, 0.01), (24, 0.01), (60, 0.01), (60, 0.1)):
+    for solver in ("odeint", "fast"):
+        benchmark(f"model.run[n_months={n_months},dt={dt},{solver}]")(
+            partial(_model_run, n_months, dt, solver)
+        )
+
+
+@benchmark("run_multiple_products[all]", number=1)
+def run_all_products():
+    products = sorted(lime_product_table().names)
+    model_params = (10, 7, "wet", 0.5, 1, 0.1, 0.1, 8.5, 12)
+    lake = Lake()
+    return lambda: run_multiple_products(lake, products, model_params)
+
+
+@benchmark("col_tests.get_test_results[column_tests_2023]", number=1, repeat=3)
+def column_test_results():
+    tests = []
+    for path in sorted(glob.glob(os.path.join(_abs_path(COLUMN_TESTS_DIR), "*.xlsx"))):
+        par = pd.read_excel(path, sheet_name="parameters", index_col=0)["Value"]
+        for sheet, test_type in (
+            ("instantaneous_dissolution_data", "instantaneous"),
+            ("overdosing_data", "overdosing"),
+        ):
+            df = pd.read_excel(path, sheet_name=sheet).fillna(0)
+            for element in ("Ca", "Mg"):
+                element_prop = par[f"lime_prod_{element.lower()}_pct"] / 100
+                tests.append((df, element, element_prop, test_type))
+
+    def run():
+        for df, element, element_prop, test_type in tests:
+            get_test_results(df.copy(), element, element_prop, test_type)
+
+    return run
+
+
+@benchmark("col_tests.get_all_test_results[column_tests_2023]", number=1, repeat=3)
+def column_test_all_results():
+    templates = [
+        parse_template(path)
+        for path in sorted(glob.glob(os.path.join(_abs_path(COLUMN_TESTS_DIR), "*.xlsx")))
+    ]
+
+    def run():
+        for par_df, inst_df, od_df in templates:
+            get_all_test_results(par_df.to_dict()["Value"], inst_df, od_df)
+
+    return run
+
+
+@benchmark("comparison_factors.build_factors[grid]", number=1, repeat=1)
+def factor_grid():
+    tmp_dir = tempfile.mkdtemp()
+    csv_path = os.path.join(tmp_dir, "omregningsfaktorer.csv")
+    cache_path = os.path.join(tmp_dir, "omregningsfaktorer_cache.json")
+    return lambda: build_factors(csv_path, cache_path, workers=1, force=True)
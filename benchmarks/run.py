@@ -0,0 +1,110 @@
+"""Run the benchmark suite.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run [--output results.json] [--baseline baseline.json]
+                             [--threshold 0.2] [--filter model.run]
+
+Each case is timed with 'timeit'. The best time per call over all repeats is
+reported. If a baseline file (the output of a previous run) is given, the
+script exits with status 1 when any case is slower than the baseline by more
+than 'threshold' (as a fraction).
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+from datetime import datetime
+
+from benchmarks.cases import CASES
+
+# Default allowed slow-down relative to the baseline (fraction)
+REGRESSION_THRESHOLD = 0.2
+
+
+def run_case(name):
+    """Time benchmark case 'name'.
+
+    Returns
+        Dict with the best and median time per call (s), 'number' and 'repeat'.
+    """
+    setup, number, repeat = CASES[name]
+    func = setup()
+    times = sorted(t / number for t in timeit.repeat(func, number=number, repeat=repeat))
+
+    return {
+        "best": times[0],
+        "median": times[len(times) // 2],
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Compare results with a baseline.
+
+    Args
+        results:   Dict. {case: timings} as returned by 'run_case'
+        baseline:  Dict. As 'results', from an earlier run
+        threshold: Float. Allowed slow-down as a fraction of the baseline time
+
+    Returns
+        List of (case, baseline_time, time) for cases that have regressed.
+    """
+    regressions = []
+    for name, res in results.items():
+        if name in baseline:
+            base_time = baseline[name]["best"]
+            if res["best"] > base_time * (1 + threshold):
+                regressions.append((name, base_time, res["best"]))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument("--output", help="Path to save the results as JSON.")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="Allowed slow-down relative to the baseline (fraction).",
+    )
+    parser.add_argument("--filter", default="", help="Only run cases containing this text.")
+    args = parser.parse_args()
+
+    results = {}
+    for name in CASES:
+        if args.filter in name:
+            results[name] = run_case(name)
+            print(f"{name:<55} {1000 * results[name]['best']:>10.3f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, base_time, new_time in regressions:
+            print(
+                f"REGRESSION {name}: {1000 * base_time:.3f} ms -> {1000 * new_time:.3f} ms"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,22 @@
-from src.col_tests.utils.inst_dissolution import get_inst_dissolution
+from src.col_tests.utils.inst_dissolution import (
+    get_all_inst_dissolution,
+    get_inst_dissolution,
+)
+
+
+def _format_results(res_df, test_type):
+    """Adjust dissolution results from 'get_inst_dissolution' to the output of
+    'get_test_results'.
+    """
+    # Adjust the dissolution to overdosing factor if needed
+    if (test_type == 'overdosing'):
+        res_df["Overdosing factor (-)"] = (
+            res_df["Dissolution (%)"].max() / res_df["Dissolution (%)"]
+        )
+        res_df.sort_values("Overdosing factor (-)", inplace=True)
+        del res_df["Dissolution (%)"]
+
+    return res_df.round(1)
 
 
 def get_test_results(df, element, element_prop, test_type="instantaneous", method="trapezoidal"):
@@ -28,14 +46,36 @@ def get_test_results(df, element, element_prop, test_type="instantaneous", metho
 
     res_df = get_inst_dissolution(df, element, element_prop, test_type, method)
 
-    # Adjust the dissolution to overdosing factor if needed
-    if (test_type == 'overdosing'):
-        res_df["Overdosing factor (-)"] = (
-            res_df["Dissolution (%)"].max() / res_df["Dissolution (%)"]
-        )
-        res_df.sort_values("Overdosing factor (-)", inplace=True)
-        del res_df["Dissolution (%)"]
+    return _format_results(res_df, test_type)
+
+
+def get_all_test_results(par_val_dict, inst_df, od_df, method="trapezoidal"):
+    """Calculate results for both column tests, for Ca and (if there are any Mg
+    data) Mg.
+
+    Args
+        par_val_dict: Dict. Dictionary of parameter values from parameter worksheet
+        inst_df:      DataFrame. Data from the instantaneous dissolution worksheet
+        od_df:        DataFrame. Data from the overdosing worksheet
+        method:       Str. Default 'trapezoidal'. See 'get_test_results'
+
+    Returns
+        Dict {(element, test_type): results dataframe}. See 'get_test_results'.
+    """
+    elements = ["Ca"]
+    if inst_df["Mg_mg/l"].sum() != 0:
+        elements.append("Mg")
+
+    element_props = {
+        element: par_val_dict[f"lime_prod_{element.lower()}_pct"] / 100
+        for element in elements
+    }
 
-    res_df = res_df.round(1)
+    # Each worksheet is integrated once for all elements
+    results = {}
+    for test_type, df in (("instantaneous", inst_df), ("overdosing", od_df)):
+        res_dfs = get_all_inst_dissolution(df, element_props, test_type, method)
+        for element, res_df in res_dfs.items():
+            results[(element, test_type)] = _format_results(res_df, test_type)
 
-    return res_df
+    return results
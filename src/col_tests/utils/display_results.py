@@ -81,7 +81,14 @@ def make_chart(df, x_col, y_col, title):
     return chart
 
 
-def display_results(par_val, df, element="Ca", test_type="instantaneous", method="trapezoidal"):
+def display_results(
+    par_val,
+    df,
+    element="Ca",
+    test_type="instantaneous",
+    method="trapezoidal",
+    results_df=None,
+):
     """Display results for either the instantaneous dissolution or
     overdosing factor column tests. Two methods are supported.
 
@@ -92,6 +99,8 @@ def display_results(par_val, df, element="Ca", test_type="instantaneous", method
         element:    Str. Default 'Ca'. Either 'Ca' or 'Mg'.
         test_type:  Str. Default 'instantaneous'. Either 'instantaneous' or 'overdosing'.
         method:     Str. Default 'trapezoidal'. Either 'trapezoidal' or 'simpson'.
+        results_df: DataFrame. Optional precomputed results from 'get_test_results'.
+                    Default None calculates them from 'df'.
 
     Returns
         None
@@ -123,6 +132,7 @@ def display_results(par_val, df, element="Ca", test_type="instantaneous", method
         st.markdown(f"### {test_title}")
         st.markdown(f"**Kolonne pH:** {df['pH'].iloc[0]}")
 
-    results_df = get_test_results(df, element, element_prop, test_type, method)
+    if results_df is None:
+        results_df = get_test_results(df, element, element_prop, test_type, method)
 
     plot_and_table(results_df, f"{test_title} test")
@@ -0,0 +1,266 @@
+"""Ingest a directory of completed column-test templates into the lime product
+database.
+
+Usage (from the repository root):
+
+    python -m src.col_tests.utils.ingest data/column_tests_2023 [--workers N] [--dry-run] [--force]
+
+Each template is checked and integrated as on the 'column_test' page, and the
+results are written to 'lime_products.xlsx' as the product's 'IDph*' and 'OD*'
+properties, together with 'CaPct' and 'MgPct' from the parameters sheet.
+Results are cached under the SHA-256 digest of each template, so re-running
+only processes new or changed files. If there are several templates for the
+same product, the last in filename order is used (so
+'coltest_x_2023_retest.xlsx' supersedes 'coltest_x_2023.xlsx').
+"""
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from src.col_tests.utils.column_tests import get_all_test_results
+from src.col_tests.utils.read_input import parse_template, template_errors
+from src.lake_modelling.utils.lake_model import MM_Ca, MM_Mg
+from src.lake_modelling.utils.reference_data import (
+    ID_PHS,
+    LIME_PRODUCTS_DATA,
+    OD_DOSES,
+    REFERENCE_DATA,
+    _file_digest,
+)
+
+INGEST_CACHE = r"./data/column_tests_ingested.json"
+
+# Properties not measured by the column tests, and the optional template
+# parameters that set them. Templates for products that are not in the
+# database yet must include these parameters
+EXTRA_PARAMS = {"DryFac": "lime_prod_dry_fac", "ColDepth": "col_depth_m"}
+
+
+def template_properties(path):
+    """Check and integrate the column-test template at 'path'.
+
+    Results for Ca and Mg are combined as in the lime product database. The
+    instantaneous dissolution is the mean of the two, weighted by the
+    Ca-equivalent content of each element, and the overdosing factor is the
+    larger of the two.
+
+    Args
+        path: Str. Path to completed Excel template
+
+    Returns
+        Dict {"product": name, "properties": {property: value}} using the
+        property names in the lime product database. Properties in
+        'EXTRA_PARAMS' are only included if the template gives them. Raises
+        ValueError if the template is not valid.
+    """
+    par_df, inst_df, od_df = parse_template(path)
+    errors = template_errors(inst_df, od_df)
+    if errors:
+        raise ValueError(f"Invalid template '{path}': " + " ".join(errors))
+
+    par_val_dict = par_df.to_dict()["Value"]
+    results = get_all_test_results(par_val_dict, inst_df, od_df)
+    elements = [element for element, test_type in results if test_type == "overdosing"]
+    weights = {
+        "Ca": par_val_dict["lime_prod_ca_pct"],
+        "Mg": par_val_dict["lime_prod_mg_pct"] * MM_Ca / MM_Mg,
+    }
+    id_pct = sum(
+        weights[element]
+        * results[(element, "instantaneous")].set_index("pH (-)")["Dissolution (%)"]
+        for element in elements
+    ) / sum(weights[element] for element in elements)
+    od_fac = pd.concat(
+        [
+            results[(element, "overdosing")].set_index("Lime added (mg/l)")[
+                "Overdosing factor (-)"
+            ]
+            for element in elements
+        ],
+        axis=1,
+    ).max(axis=1)
+
+    props = {
+        "CaPct": float(par_val_dict["lime_prod_ca_pct"]),
+        "MgPct": float(par_val_dict["lime_prod_mg_pct"]),
+    }
+    for prop, param in EXTRA_PARAMS.items():
+        if par_val_dict.get(param, 0) != 0:
+            props[prop] = float(par_val_dict[param])
+    props.update({f"IDph{ph}": round(float(id_pct[ph / 10]), 1) for ph in ID_PHS})
+    props.update({f"OD{dose}": float(od_fac[dose]) for dose in OD_DOSES})
+
+    return {"product": str(par_val_dict["lime_product_name"]).strip(), "properties": props}
+
+
+def _ingest_file(path):
+    """Worker for 'ingest'. Returns (record, None), or (None, error message) if
+    the template is not valid.
+    """
+    try:
+        return template_properties(path), None
+    except (ValueError, KeyError) as err:
+        return None, f"{os.path.basename(path)}: {err}"
+
+
+def _read_cache(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_cache(cache, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _write_products(df, path):
+    """Write the product database to 'path' atomically, so readers never see a
+    partly written workbook.
+    """
+    tmp_path = path + ".tmp.xlsx"
+    df.to_excel(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def product_table_diff(old_df, new_df):
+    """Changes between two versions of the lime product database.
+
+    Args
+        old_df: Dataframe. 'lime_products.xlsx' read with 'index_col=0'
+        new_df: Dataframe. As 'old_df'. May have extra product columns
+
+    Returns
+        Dataframe with columns 'product', 'property', 'old' and 'new', with one
+        row per changed value. 'old' is NaN for new products.
+    """
+    rows = []
+    for name in new_df.columns.drop("Description"):
+        for prop, new in new_df[name].items():
+            old = old_df[name][prop] if name in old_df.columns else float("nan")
+            if not old == new:
+                rows.append({"product": name, "property": prop, "old": old, "new": new})
+
+    return pd.DataFrame(rows, columns=["product", "property", "old", "new"])
+
+
+def ingest(
+    template_dir,
+    products_path=LIME_PRODUCTS_DATA,
+    cache_path=INGEST_CACHE,
+    workers=None,
+    force=False,
+    dry_run=False,
+):
+    """Update the lime product database from all templates in 'template_dir'.
+
+    Args
+        template_dir:  Str. Directory of completed column-test templates (*.xlsx)
+        products_path: Str. Path to the lime product database
+        cache_path:    Str. Path to the cache of results per template
+        workers:       Int or None. Number of worker processes. Default is the
+                       number of CPUs
+        force:         Bool. Re-process all templates, ignoring the cache
+        dry_run:       Bool. Report the changes without updating the database
+
+    Returns
+        Tuple (diff, errors, n_processed). 'diff' is a dataframe of the changes
+        to the database (see 'product_table_diff'); 'errors' is a list of
+        messages for templates that could not be ingested; 'n_processed' is the
+        number of templates that were not in the cache.
+    """
+    paths = sorted(
+        path
+        for path in glob.glob(os.path.join(template_dir, "*.xlsx"))
+        if not os.path.basename(path).startswith("~$")
+    )
+    digests = {os.path.basename(path): _file_digest(path) for path in paths}
+
+    cache = {} if force else _read_cache(cache_path)
+    cache = {
+        fname: entry
+        for fname, entry in cache.items()
+        if entry["digest"] == digests.get(fname)
+    }
+    todo = [path for path in paths if os.path.basename(path) not in cache]
+
+    errors = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, (record, error) in zip(todo, pool.map(_ingest_file, todo)):
+                if error is None:
+                    cache[os.path.basename(path)] = {
+                        "digest": digests[os.path.basename(path)],
+                        **record,
+                    }
+                else:
+                    errors.append(error)
+        _write_cache(cache, cache_path)
+
+    old_df = pd.read_excel(products_path, index_col=0)
+    new_df = old_df.copy()
+    for fname in sorted(cache):
+        name, props = cache[fname]["product"], cache[fname]["properties"]
+        if name not in new_df.columns:
+            missing = [prop for prop in new_df.index if prop not in props]
+            if missing:
+                errors.append(
+                    f"{fname}: '{name}' is not in the database, so the template "
+                    f"must give {[EXTRA_PARAMS.get(prop, prop) for prop in missing]}."
+                )
+                continue
+            new_df[name] = float("nan")
+        for prop, value in props.items():
+            new_df.loc[prop, name] = value
+
+    diff = product_table_diff(old_df, new_df)
+    if not dry_run and len(diff) > 0:
+        _write_products(new_df, products_path)
+        REFERENCE_DATA.invalidate("lime_products")
+
+    return diff, errors, len(todo)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Update the lime product database from column-test templates."
+    )
+    parser.add_argument("template_dir", help="Directory of completed templates.")
+    parser.add_argument(
+        "--products", default=LIME_PRODUCTS_DATA, help="Lime product database path."
+    )
+    parser.add_argument("--cache", default=INGEST_CACHE, help="Cache file path.")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Re-process all templates, ignoring the cache."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Show the changes without saving them."
+    )
+    args = parser.parse_args()
+
+    diff, errors, n_processed = ingest(
+        args.template_dir, args.products, args.cache, args.workers, args.force, args.dry_run
+    )
+    print(f"Processed {n_processed} new or changed templates.")
+    for error in errors:
+        print(f"Skipped {error}")
+    if len(diff) == 0:
+        print("Lime product database is up to date.")
+    else:
+        print(diff.to_string(index=False))
+        action = "Would update" if args.dry_run else "Updated"
+        print(f"{action} {len(diff)} values in '{args.products}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from numpy import trapz
 from scipy.integrate import simpson
@@ -5,7 +6,7 @@ from scipy.integrate import simpson
 from src.col_tests.utils.test_settings import get_test_settings
 
 
-def integrate(y, x, method):
+def integrate(y, x, method, axis=-1):
     """ Approximates integral for inst. dissolution equation.
 
     Args
@@ -18,46 +19,102 @@ def integrate(y, x, method):
                         https://en.wikipedia.org/wiki/Simpson%27s_rule
                     for details.
 
+        axis:       Int. Default -1. Axis of 'y' along which to integrate
+
     Returns
-        res:        Float. Approximated integral value
+        res:        Float, or array with 'axis' removed. Approximated integral value
     """
     if method == "trapezoidal":
-        res = trapz(y, x)
+        res = trapz(y, x, axis=axis)
     else:
-        res = simpson(y, x)
+        res = simpson(y, x=x, axis=axis)
 
     return res
 
 
-def calculate_inst_dissolution(col_groups, element, element_prop, test_type, method):
-    """ Calculates instantaneous dissolution for test columns.
+def pivot_test_data(df, elements):
+    """ Pivots a worksheet of long-format test data to an array of
+    concentrations, once for all elements.
 
     Args
-        col_groups:     DataFrameGroupBy. DataFrame of input data grouped by test columns
-        element:        Str. Chemical element for which to calculate. Either 'Ca' or 'Mg'
-        element_prop:   Float. Proportion of the element in lime by mass
+        df:         DataFrame of original input data (worksheet of the template)
+        elements:   List of str. Chemical elements, e.g. ['Ca', 'Mg']
+
+    Returns
+        Tuple (cols, depths, conc). Arrays of test column IDs and of sample
+        depths (sorted), and array of concentrations (mg/l) with shape
+        (len(cols), len(depths), len(elements)).
+    """
+    value_cols = [f"{element}_mg/l" for element in elements]
+    wide = df.pivot(index="Column", columns="Depth_m", values=value_cols)
+    depths = wide[value_cols[0]].columns.values.astype(float)
+    conc = np.stack([wide[col].values for col in value_cols], axis=-1).astype(float)
+
+    return wide.index.values, depths, conc
+
+
+def calculate_inst_dissolution(df, element_props, test_type, method):
+    """ Calculates instantaneous dissolution for all test columns and elements,
+    integrating over depth in a single call.
+
+    Args
+        df:             DataFrame of original input data (worksheet of the template)
+        element_props:  Dict {element: proportion of the element in lime by mass}
         test_type:      Str. Type of the test. Either 'instantaneous' or 'overdosing'
         method:         Str. Approximation rule. Either 'trapezoidal' or 'simpson'
 
     Returns
-        inst_dist_list: List of instantaneous dissolution values for each test column
+        Tuple (cols, inst_diss_pct). Array of test column IDs, and array of
+        instantaneous dissolution (%) with shape (len(cols), len(element_props)).
     """
-
-    inst_diss_list = []
     param_settings = get_test_settings(test_type)
+    cols, depths, conc = pivot_test_data(df, list(element_props))
+    lime_dose = np.array([param_settings['lime_dose'][col] for col in cols])
+    element_prop = np.array(list(element_props.values()))
+
+    res = integrate(conc, depths, method, axis=1)
+    inst_diss_pct = 100 * res / (
+        lime_dose[:, np.newaxis] * element_prop * (depths[-1] - depths[0])
+    )
+
+    return cols, inst_diss_pct
+
 
-    for col, col_df in col_groups:
-        lime_dose = param_settings['lime_dose'][col]
-        col_df.sort_values("Depth_m", inplace=True)
-        ys = col_df[element + "_mg/l"].values
-        xs = col_df["Depth_m"].values
-        xmin, xmax = xs.min(), xs.max()
+def get_all_inst_dissolution(df, element_props, test_type, method):
+    """ Creates DataFrames of instantaneous dissolution results for several
+    elements at once.
 
-        res = integrate(ys, xs, method)
-        inst_diss_pct = 100 * res / (lime_dose * element_prop * (xmax - xmin))
-        inst_diss_list.append(inst_diss_pct)
+    Args
+        df:             DataFrame of original input data (worksheet of the template)
+        element_props:  Dict {element: proportion of the element in lime by mass}
+        test_type:      Str. Type of the test. Either 'instantaneous' or 'overdosing'
+        method:         Str. Approximation rule. Either 'trapezoidal' or 'simpson'
+
+    Returns
+        Dict {element: res_df}. See 'get_inst_dissolution'.
+    """
+    param_settings = get_test_settings(test_type)
+    cols, inst_diss_pct = calculate_inst_dissolution(df, element_props, test_type, method)
+    x_vals = (
+        df.drop_duplicates("Column")
+        .set_index("Column")[param_settings['col_name']]
+        .loc[cols]
+        .values
+    )
 
-    return inst_diss_list
+    results = {}
+    for idx, element in enumerate(element_props):
+        res_df = pd.DataFrame(
+            {
+                "Column": cols,
+                param_settings['xlabel']: x_vals,
+                "Dissolution (%)": inst_diss_pct[:, idx],
+            }
+        )
+        res_df.set_index("Column", inplace=True)
+        results[element] = res_df
+
+    return results
 
 
 def get_inst_dissolution(df, element, element_prop, test_type, method):
@@ -73,22 +130,4 @@ def get_inst_dissolution(df, element, element_prop, test_type, method):
     Returns
         res_df:     Resulting DataFrame of dissolution value for each test column
     """
-
-    param_settings = get_test_settings(test_type)
-
-    col_groups = df.groupby("Column")
-    col_list = df["Column"].unique().tolist()
-    x_list = df[param_settings['col_name']].unique().tolist()
-
-    inst_diss_list_pct = calculate_inst_dissolution(col_groups, element, element_prop, test_type, method)
-
-    res_df = pd.DataFrame(
-        {
-            "Column": col_list,
-            param_settings['xlabel']: x_list,
-            "Dissolution (%)": inst_diss_list_pct,
-        }
-    )
-    res_df.set_index("Column", inplace=True)
-
-    return res_df
+    return get_all_inst_dissolution(df, {element: element_prop}, test_type, method)[element]
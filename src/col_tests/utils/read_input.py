@@ -2,7 +2,7 @@ import pandas as pd
 import streamlit as st
 
 
-def check_column_values(df, col_name, expected_set):
+def column_value_error(df, col_name, expected_set):
     """Checks the unique values in 'df' column 'col_name' are equal
     to the set 'expected_set.'
 
@@ -12,56 +12,84 @@ def check_column_values(df, col_name, expected_set):
         expected_set: Set of expected values
 
     Returns
-        Stops Streamlit with an error if the the unique values are not as
-        expected. Otherwise None.
+        Str. Error message if the unique values are not as expected.
+        Otherwise None.
     """
     assert isinstance(expected_set, set), "'expected_set' must be a set."
     unique_vals = set(df[col_name].unique())
     if unique_vals != expected_set:
-        msg = f"{col_name} must only contain values {expected_set} (not {unique_vals})."
+        return f"{col_name} must only contain values {expected_set} (not {unique_vals})."
+    else:
+        return None
+
+
+def check_column_values(df, col_name, expected_set):
+    """As 'column_value_error', but stops Streamlit with an error if the unique
+    values are not as expected. Otherwise returns None.
+    """
+    msg = column_value_error(df, col_name, expected_set)
+    if msg is not None:
         st.error(msg)
         st.stop()
     else:
         return None
 
 
+INST_UNIQUE_VALS = {
+    "Column": ("A", "B", "C", "D", "E"),
+    "pH": (4.0, 4.5, 5.0, 5.5, 6.0),
+    "Depth_m": (0.0, 0.4, 0.8, 1.2, 1.6),
+}
+OD_UNIQUE_VALS = {
+    "Column": ("A", "B", "C", "D", "E"),
+    "pH": (4.6,),
+    "Lime_added_mg/l": (10, 20, 35, 50, 85),
+    "Depth_m": (0.0, 0.4, 0.8, 1.2, 1.6),
+}
+
+
+def template_errors(inst_df, od_df):
+    """List of error messages for the data worksheets of a template (empty if
+    the template is valid). See 'column_value_error'.
+    """
+    errors = []
+    for df, unique_vals in ((inst_df, INST_UNIQUE_VALS), (od_df, OD_UNIQUE_VALS)):
+        for key, val in unique_vals.items():
+            msg = column_value_error(df, key, set(val))
+            if msg is not None:
+                errors.append(msg)
+
+    return errors
+
+
+def parse_template(template_path):
+    """Reads a data template without checking it. See 'read_template'."""
+    # Open the workbook once and read all three sheets from it
+    with pd.ExcelFile(template_path) as xl:
+        par_df = xl.parse(sheet_name="parameters", index_col=0).fillna(0)
+        inst_df = xl.parse(sheet_name="instantaneous_dissolution_data").fillna(0)
+        od_df = xl.parse(sheet_name="overdosing_data").fillna(0)
+
+    return par_df, inst_df, od_df
+
+
 def read_template(template_path):
-    """Reads a data template supplied by user and add results to the session state.
+    """Reads and checks a data template supplied by user.
 
     Args
-        template_path: Str. Path to completed Excel template
+        template_path: Str or file-like. Path to completed Excel template, or the
+                       uploaded file
 
     Returns
-        None. Values are added to the session state.
+        Tuple of dataframes (par_df, inst_df, od_df) from the 'parameters',
+        'instantaneous_dissolution_data' and 'overdosing_data' worksheets. Stops
+        Streamlit with an error if the template is not valid.
     """
-    par_df = pd.read_excel(template_path, sheet_name="parameters", index_col=0).fillna(
-        0
-    )
-    inst_df = pd.read_excel(
-        template_path, sheet_name="instantaneous_dissolution_data"
-    ).fillna(0)
-    od_df = pd.read_excel(template_path, sheet_name="overdosing_data").fillna(0)
+    par_df, inst_df, od_df = parse_template(template_path)
 
     # Check input template
-    inst_unique_vals = {
-        "Column": ("A", "B", "C", "D", "E"),
-        "pH": (4.0, 4.5, 5.0, 5.5, 6.0),
-        "Depth_m": (0.0, 0.4, 0.8, 1.2, 1.6),
-    }
-    for key, val in inst_unique_vals.items():
-        check_column_values(inst_df, key, set(val))
-
-    od_unique_vals = {
-        "Column": ("A", "B", "C", "D", "E"),
-        "pH": (4.6,),
-        "Lime_added_mg/l": (10, 20, 35, 50, 85),
-        "Depth_m": (0.0, 0.4, 0.8, 1.2, 1.6),
-    }
-    for key, val in od_unique_vals.items():
-        check_column_values(od_df, key, set(val))
-
-    st.session_state["par_df"] = par_df
-    st.session_state["inst_df"] = inst_df
-    st.session_state["od_df"] = od_df
-
-    return None
+    for msg in template_errors(inst_df, od_df):
+        st.error(msg)
+        st.stop()
+
+    return par_df, inst_df, od_df
@@ -0,0 +1,156 @@
+import os
+import shutil
+
+import pandas as pd
+
+from src.col_tests.utils.ingest import ingest, product_table_diff, template_properties
+from src.col_tests.utils.read_input import parse_template
+from src.lake_modelling.utils.reference_data import (
+    LIME_PRODUCTS_DATA,
+    _abs_path,
+    _file_digest,
+    lime_product_table,
+)
+
+TEMPLATE_DIR = _abs_path("data/column_tests_2023")
+
+# Templates the database entries were calculated from
+DB_TEMPLATES = {
+    "Microdol1": "coltest_microdol1_2023_retest.xlsx",
+    "Microdol5": "coltest_microdol5_2023_retest.xlsx",
+    "Miljøkalk EY3": "coltest_miljokalk-ey3_2023.xlsx",
+    "Miljøkalk VK3": "coltest_miljokalk-vk3_2023.xlsx",
+}
+
+
+def make_dirs(tmp_path, fnames):
+    """Copy the product database and the templates 'fnames' to 'tmp_path'."""
+    template_dir = tmp_path / "templates"
+    template_dir.mkdir()
+    for fname in fnames:
+        shutil.copy(os.path.join(TEMPLATE_DIR, fname), template_dir)
+    products_path = str(tmp_path / "lime_products.xlsx")
+    shutil.copy(_abs_path(LIME_PRODUCTS_DATA), products_path)
+
+    return str(template_dir), products_path, str(tmp_path / "cache.json")
+
+
+class TestIngest:
+    def test_template_properties_match_database(self):
+        table = lime_product_table()
+        for name, fname in DB_TEMPLATES.items():
+            record = template_properties(os.path.join(TEMPLATE_DIR, fname))
+
+            assert record["product"] == name
+            assert set(record["properties"]) == set(table.properties) - {
+                "DryFac",
+                "ColDepth",
+            }
+            for prop, value in record["properties"].items():
+                assert value == table.value(prop, name), (name, prop)
+
+    def test_retests_reproduce_database(self, tmp_path):
+        template_dir, products_path, cache_path = make_dirs(
+            tmp_path, sorted(os.listdir(TEMPLATE_DIR))
+        )
+        diff, errors, n_processed = ingest(
+            template_dir, products_path, cache_path, workers=2
+        )
+
+        assert len(diff) == 0
+        assert errors == []
+        assert n_processed == len(os.listdir(template_dir))
+
+    def test_cache_and_force(self, tmp_path):
+        template_dir, products_path, cache_path = make_dirs(
+            tmp_path, list(DB_TEMPLATES.values())
+        )
+        ingest(template_dir, products_path, cache_path, workers=1)
+
+        diff, errors, n_processed = ingest(
+            template_dir, products_path, cache_path, workers=1
+        )
+        assert n_processed == 0
+        assert len(diff) == 0
+
+        shutil.copy(
+            os.path.join(TEMPLATE_DIR, "coltest_microdol1_2023.xlsx"),
+            os.path.join(template_dir, "coltest_microdol1_2023_retest.xlsx"),
+        )
+        diff, errors, n_processed = ingest(
+            template_dir, products_path, cache_path, workers=1, dry_run=True
+        )
+        assert n_processed == 1
+        assert set(diff["product"]) == {"Microdol1"}
+
+        diff, errors, n_processed = ingest(
+            template_dir, products_path, cache_path, workers=1, force=True
+        )
+        assert n_processed == len(DB_TEMPLATES)
+
+    def test_dry_run_leaves_database_unchanged(self, tmp_path):
+        template_dir, products_path, cache_path = make_dirs(
+            tmp_path, ["coltest_microdol1_2023.xlsx"]
+        )
+        digest = _file_digest(products_path)
+        diff, errors, n_processed = ingest(
+            template_dir, products_path, cache_path, workers=1, dry_run=True
+        )
+
+        assert len(diff) > 0
+        assert _file_digest(products_path) == digest
+
+        ingest(template_dir, products_path, cache_path, workers=1)
+        df = pd.read_excel(products_path, index_col=0)
+        for _, row in diff.iterrows():
+            assert df.loc[row["property"], row["product"]] == row["new"]
+
+    def test_invalid_templates_are_reported(self, tmp_path):
+        template_dir, products_path, cache_path = make_dirs(
+            tmp_path, list(DB_TEMPLATES.values())
+        )
+        par_df, inst_df, od_df = parse_template(
+            os.path.join(TEMPLATE_DIR, DB_TEMPLATES["Microdol1"])
+        )
+        inst_df["pH"] = inst_df["pH"] + 0.1
+        with pd.ExcelWriter(os.path.join(template_dir, "coltest_invalid.xlsx")) as writer:
+            par_df.to_excel(writer, sheet_name="parameters")
+            inst_df.to_excel(writer, sheet_name="instantaneous_dissolution_data", index=False)
+            od_df.to_excel(writer, sheet_name="overdosing_data", index=False)
+
+        # A new product must give the properties not measured by the tests
+        new_dir = tmp_path / "new"
+        new_dir.mkdir()
+        par_df.loc["lime_product_name", "Value"] = "New product"
+        with pd.ExcelWriter(str(new_dir / "coltest_new.xlsx")) as writer:
+            par_df.to_excel(writer, sheet_name="parameters")
+            inst_df.assign(pH=inst_df["pH"] - 0.1).to_excel(
+                writer, sheet_name="instantaneous_dissolution_data", index=False
+            )
+            od_df.to_excel(writer, sheet_name="overdosing_data", index=False)
+
+        diff, errors, n_processed = ingest(
+            template_dir, products_path, cache_path, workers=1
+        )
+        assert len(diff) == 0
+        assert len(errors) == 1
+        assert errors[0].startswith("coltest_invalid.xlsx")
+
+        diff, errors, n_processed = ingest(
+            str(new_dir), products_path, str(tmp_path / "new.json"), workers=1
+        )
+        assert len(diff) == 0
+        assert len(errors) == 1
+        assert "lime_prod_dry_fac" in errors[0]
+
+    def test_product_table_diff(self):
+        old_df = pd.DataFrame(
+            {"Description": ["a", "b"], "P1": [1.0, 2.0]}, index=["CaPct", "MgPct"]
+        )
+        new_df = old_df.assign(P1=[1.0, 3.0], P2=[4.0, 5.0])
+        diff = product_table_diff(old_df, new_df)
+
+        assert diff["product"].tolist() == ["P1", "P2", "P2"]
+        assert diff["property"].tolist() == ["MgPct", "CaPct", "MgPct"]
+        assert diff["new"].tolist() == [3.0, 4.0, 5.0]
+        assert diff["old"].isna().tolist() == [False, True, True]
@@ -0,0 +1,174 @@
+"""Regenerate 'omregningsfaktorer.csv' from the lime product database.
+
+Usage (from the repository root):
+
+    python -m src.comparison_factors.utils.build_factors [--workers N] [--force]
+
+The required dose for each (product, depth, residence time) cell is cached
+under a hash of the product's properties, the model parameters and the
+reference data versions, so re-running after a change to the product database
+only recomputes the affected cells.
+"""
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+from src.lake_modelling.utils.reference_data import REFERENCE_DATA, lime_product_table
+
+OMFAC_CSV = r"./data/omregningsfaktorer.csv"
+OMFAC_CACHE = r"./data/omregningsfaktorer_cache.json"
+
+REF_PRODUCT = "Standard Kalk Kat3"
+DEPTHS = (5, 10, 15, 20)
+TAUS = (0.3, 0.5, 0.7, 1, 1.5, 2)
+
+# Lake and liming assumptions used for all cells. See the documentation and
+# 'notebooks/05_omregningsfaktorer.ipynb'
+LAKE_PARAMS = {
+    "area": 0.2,
+    "flow_prof": "fjell",
+    "pH_lake0": 5.8,
+    "pH_inflow": 5,
+    "toc_lake0": 4,
+}
+MODEL_PARAMS = {
+    "lime_month": 7,
+    "spr_meth": "wet",
+    "spr_prop": 1,
+    "F_sol": 1,
+    "rate_const": 0.1,
+    "activity_const": 0.1,
+    "ca_aq_sat": 8.5,
+    "n_months": 12,
+}
+TARGET_PARAMS = {"target_ph": 6, "criterion": "final"}
+
+
+def cell_key(product_props, depth, tau):
+    """Hash identifying the inputs to one cell of the factor table.
+
+    Args
+        product_props: Dict. {property: value} for the product, as in
+                       'LimeProductTable.to_dict'
+        depth:         Float. Lake mean depth (m)
+        tau:           Float. Lake water residence time (years)
+
+    Returns
+        Str. Hex SHA-256 digest.
+    """
+    inputs = {
+        "product": product_props,
+        "depth": depth,
+        "tau": tau,
+        "lake": LAKE_PARAMS,
+        "model": MODEL_PARAMS,
+        "target": TARGET_PARAMS,
+        "flow_typologies": REFERENCE_DATA.version("flow_typologies"),
+        "titration_curves": REFERENCE_DATA.version("titration_curves"),
+    }
+    blob = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def required_dose(product, depth, tau):
+    """Lime dose (mg/l) of 'product' needed to meet 'TARGET_PARAMS' for a lake
+    with the specified depth and residence time. See 'Model.find_dose'.
+    """
+    lake = Lake(depth=depth, tau=tau, **LAKE_PARAMS)
+    model = Model(lake, LimeProduct(product), **MODEL_PARAMS)
+
+    return model.find_dose(**TARGET_PARAMS)
+
+
+def _read_cache(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_cache(cache, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def build_factors(
+    csv_path=OMFAC_CSV, cache_path=OMFAC_CACHE, workers=None, force=False
+):
+    """Compute the factor table for all products in the database and save it to
+    'csv_path'. Cells already in the cache at 'cache_path' are not recomputed.
+
+    Args
+        csv_path:   Str. Output CSV path
+        cache_path: Str. JSON file of cached doses {cell_key: dose}
+        workers:    Int. Number of worker processes. Default None uses the
+                    number of CPUs
+        force:      Bool. If True, ignore the cache and recompute all cells
+
+    Returns
+        Tuple (dataframe, n_computed). Dataframe with columns 'Dybde (m)',
+        'Oppholdstid (år)', 'Produkt' and 'Faktor (-)', and the number of cells
+        that were recomputed.
+    """
+    products = lime_product_table().to_dict()
+    assert REF_PRODUCT in products, f"'{REF_PRODUCT}' is not in the product database."
+    cells = [
+        (name, depth, tau) for name in products for depth in DEPTHS for tau in TAUS
+    ]
+    keys = [cell_key(products[name], depth, tau) for name, depth, tau in cells]
+
+    cache = {} if force else _read_cache(cache_path)
+    todo = [idx for idx, key in enumerate(keys) if key not in cache]
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            doses = pool.map(required_dose, *zip(*[cells[idx] for idx in todo]))
+            for idx, dose in zip(todo, doses):
+                cache[keys[idx]] = dose
+
+    # Drop entries for cells that are no longer in the table
+    cache = {key: cache[key] for key in keys}
+    _write_cache(cache, cache_path)
+
+    df = pd.DataFrame(cells, columns=["Produkt", "Dybde (m)", "Oppholdstid (år)"])
+    df["dose"] = [cache[key] for key in keys]
+    ref_df = df.query("Produkt == @REF_PRODUCT").drop(columns="Produkt")
+    df = df.query("Produkt != @REF_PRODUCT").merge(
+        ref_df, on=["Dybde (m)", "Oppholdstid (år)"], suffixes=("", "_ref")
+    )
+    df["Faktor (-)"] = (df["dose"] / df["dose_ref"]).round(3)
+    df = df[["Dybde (m)", "Oppholdstid (år)", "Produkt", "Faktor (-)"]]
+    df = df.sort_values(["Produkt", "Dybde (m)", "Oppholdstid (år)"])
+    df.to_csv(csv_path, index=False)
+    REFERENCE_DATA.invalidate("comparison_factors")
+
+    return df, len(todo)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Regenerate the omregningsfaktorer table from the lime product database."
+    )
+    parser.add_argument("--csv", default=OMFAC_CSV, help="Output CSV path.")
+    parser.add_argument("--cache", default=OMFAC_CACHE, help="Cache file path.")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Recompute all cells, ignoring the cache."
+    )
+    args = parser.parse_args()
+
+    df, n_computed = build_factors(args.csv, args.cache, args.workers, args.force)
+    print(f"Recomputed {n_computed} cells. Saved {len(df)} factors to '{args.csv}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,11 @@
 import altair as alt
-import pandas as pd
 
-OMFAC_CSV = r"./data/omregningsfaktorer.csv"
+from src.lake_modelling.utils.reference_data import comparison_factors
 
 
 def read_factors():
     """Read omregningsfactors."""
-    df = pd.read_csv(OMFAC_CSV)
+    df = comparison_factors().copy()
     df["Dybde (m)"] = df["Dybde (m)"].astype(str) + " m"
 
     return df
@@ -59,4 +58,4 @@ def plot_factors():
         .interactive()
     )
 
-    return chart
\ No newline at end of file
+    return chart
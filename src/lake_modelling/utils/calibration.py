@@ -0,0 +1,290 @@
+"""Calibrate the lake-bottom lime parameters against observed lake chemistry.
+
+Usage (from the repository root):
+
+    python -m src.lake_modelling.utils.calibration --lakes ./lakes.csv
+        --obs ./observations.csv --output ./calibration.json
+        [--warm-start ./calibration.json] [--workers N]
+
+'rate_const', 'activity_const' and 'F_sol' are fitted jointly for all lakes by
+least squares on pH. Each iteration evaluates the current parameters and the
+finite-difference perturbations needed for the Jacobian as one vectorised
+batch per lake (see 'Model._solve_draws'). Lakes are distributed across a
+process pool whose workers build their Model objects once, at start-up.
+"""
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+
+from src.lake_modelling.utils.lake_model import (
+    ENSEMBLE_PARAMS,
+    MM_Ca,
+    MM_CaCO3,
+    Lake,
+    LimeProduct,
+    Model,
+)
+from src.lake_modelling.utils.titration import caco3_to_ph
+
+# Fitted parameters, with (lower, upper) bounds
+CALIB_PARAMS = {
+    "rate_const": (0, 2),
+    "activity_const": (0, 2),
+    "F_sol": (0, 1),
+}
+DEFAULT_X0 = {"rate_const": 0.1, "activity_const": 0.1, "F_sol": 1}
+
+# Relative step used for finite-difference derivatives
+DIFF_STEP = 1e-3
+
+# Time resolution (months) of the model runs. Observations are interpolated
+CALIB_DT = 0.05
+
+# Lake and liming assumptions for inputs not in the lakes file
+LAKE_PARAMS = {"flow_prof": "fjell", "toc_lake0": 4}
+MODEL_PARAMS = {
+    "spr_meth": "wet",
+    "spr_prop": 0.5,
+    "ca_aq_sat": 8.5,
+}
+
+
+def simulate_ph(model, params, months, dt=CALIB_DT):
+    """Lake pH at selected times for several parameter sets, evaluated together.
+
+    Args
+        model:  Obj. Model defining the lake and liming scenario
+        params: Dict {param: array of length N}. Values for any of
+                'ENSEMBLE_PARAMS'. Others are fixed at the values for 'model'
+        months: Array of length M. Times (months since liming) between 0 and
+                'model.n_months'
+        dt:     Float between 0 and 1 (months). Time resolution of the model
+
+    Returns
+        Array of shape (M, N).
+    """
+    n = len(next(iter(params.values())))
+    defaults = {
+        "rate_const": model.rate_const,
+        "activity_const": model.activity_const,
+        "F_sol": model.F_sol,
+        "ca_aq_sat": model.ca_aq_sat,
+        "id_scale": 1,
+        "od_scale": 1,
+    }
+    draws = {
+        name: np.broadcast_to(np.asarray(params.get(name, defaults[name]), float), n)
+        for name in ENSEMBLE_PARAMS
+    }
+
+    months = np.asarray(months, dtype=float)
+    assert ((months >= 0) & (months <= model.n_months)).all(), (
+        "'months' must be between 0 and 'n_months'."
+    )
+    ca = np.empty((len(months), n))
+    for month, ti, C_lakes in model._solve_draws(draws, dt):
+        idx = np.flatnonzero((months >= month) & (months <= month + 1))
+        # Linear interpolation on the shared time axis, for all sets at once
+        pos = np.searchsorted(ti, months[idx], side="right") - 1
+        pos = np.clip(pos, 0, len(ti) - 2)
+        w = ((months[idx] - ti[pos]) / (ti[pos + 1] - ti[pos]))[:, np.newaxis]
+        ca[idx] = (1 - w) * C_lakes[pos] + w * C_lakes[pos + 1]
+
+    return caco3_to_ph(ca * MM_CaCO3 / MM_Ca, model.lake.toc_lake0)
+
+
+def build_models(lakes_df):
+    """Create one Model per lake.
+
+    Args
+        lakes_df: Dataframe. One row per lake with columns 'lake', 'product',
+                  'lake_area_m2', 'mean_depth_m', 'tau_years', 'pH_lake0',
+                  'pH_inflow', 'lime_dose' (mg/l), 'lime_month' and 'n_months'
+
+    Returns
+        Dict {lake: Model}.
+    """
+    products = {name: LimeProduct(name) for name in lakes_df["product"].unique()}
+    models = {}
+    for row in lakes_df.itertuples(index=False):
+        lake = Lake(
+            area=row.lake_area_m2 / 1e6,
+            depth=row.mean_depth_m,
+            tau=row.tau_years,
+            pH_lake0=row.pH_lake0,
+            pH_inflow=row.pH_inflow,
+            **LAKE_PARAMS,
+        )
+        models[row.lake] = Model(
+            lake,
+            products[row.product],
+            lime_dose=row.lime_dose,
+            lime_month=int(row.lime_month),
+            n_months=int(row.n_months),
+            **MODEL_PARAMS,
+        )
+
+    return models
+
+
+# Set in each worker by '_init_worker'
+_MODELS = {}
+_OBS = {}
+
+
+def _init_worker(lakes_df, obs):
+    global _MODELS, _OBS
+    _MODELS = build_models(lakes_df)
+    _OBS = obs
+
+
+def _lake_residuals(lake, X):
+    """Residuals (modelled - observed pH) of shape (n_obs, len(X)) for one lake
+    and each row of the parameter array 'X'.
+    """
+    months, ph = _OBS[lake]
+    params = {name: X[:, idx] for idx, name in enumerate(CALIB_PARAMS)}
+
+    return simulate_ph(_MODELS[lake], params, months) - ph[:, np.newaxis]
+
+
+def _diff_steps(x, lb, ub):
+    """Forward-difference steps, reversed where they would cross 'ub'."""
+    h = DIFF_STEP * np.maximum(np.abs(x), 0.1)
+
+    return np.where(x + h > ub, -h, h)
+
+
+def calibrate(lakes_df, obs_df, x0=None, workers=None, diagnostics_path=None):
+    """Fit 'CALIB_PARAMS' jointly for all lakes.
+
+    Args
+        lakes_df:         Dataframe. See 'build_models'
+        obs_df:           Dataframe. Observations with columns 'lake', 'months'
+                          (months since liming) and 'pH'
+        x0:               Dict {param: value}. Starting values, e.g. from a
+                          previous calibration. Default None uses 'DEFAULT_X0'
+        workers:          Int. Number of worker processes. Default None uses the
+                          number of CPUs
+        diagnostics_path: Str. Optional JSON file for the fitted parameters,
+                          convergence history and per-lake RMSE. Rewritten after
+                          every iteration
+
+    Returns
+        Dict. Calibration diagnostics, as saved to 'diagnostics_path'.
+    """
+    x0 = {**DEFAULT_X0, **(x0 or {})}
+    lb, ub = np.array(list(CALIB_PARAMS.values()), dtype=float).T
+    x0 = np.clip([x0[name] for name in CALIB_PARAMS], lb, ub)
+
+    lakes = [lake for lake in lakes_df["lake"] if lake in set(obs_df["lake"])]
+    assert len(lakes) > 0, "No observations for the lakes in 'lakes_df'."
+    obs = {
+        lake: (df["months"].values.astype(float), df["pH"].values.astype(float))
+        for lake, df in obs_df.groupby("lake")
+        if lake in lakes
+    }
+    weights = {lake: 1 / np.sqrt(len(obs[lake][0])) for lake in lakes}
+
+    history = []
+    evaluated = {}
+
+    def write_diagnostics(result):
+        if diagnostics_path is not None:
+            with open(diagnostics_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=1)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(lakes_df[lakes_df["lake"].isin(lakes)], obs),
+    ) as pool:
+
+        def evaluate(x):
+            """Residuals and Jacobian at 'x', from one batch per lake."""
+            key = tuple(x)
+            if key not in evaluated:
+                steps = _diff_steps(x, lb, ub)
+                X = np.vstack([x, x + np.diag(steps)])
+                res_list = list(pool.map(_lake_residuals, lakes, [X] * len(lakes)))
+                res = np.concatenate(
+                    [weights[lake] * r for lake, r in zip(lakes, res_list)]
+                )
+                jac = (res[:, 1:] - res[:, [0]]) / steps
+                evaluated.clear()
+                evaluated[key] = (res[:, 0], jac)
+
+                rmse = {
+                    lake: float(np.sqrt(np.mean(r[:, 0] ** 2)))
+                    for lake, r in zip(lakes, res_list)
+                }
+                history.append(
+                    {
+                        "params": dict(zip(CALIB_PARAMS, x.tolist())),
+                        "cost": float(0.5 * np.sum(res[:, 0] ** 2)),
+                    }
+                )
+                write_diagnostics(
+                    {"status": "running", "history": history, "rmse": rmse}
+                )
+
+            return evaluated[key]
+
+        fit = least_squares(
+            lambda x: evaluate(x)[0],
+            x0,
+            jac=lambda x: evaluate(x)[1],
+            bounds=(lb, ub),
+            x_scale="jac",
+        )
+        res_list = pool.map(_lake_residuals, lakes, [fit.x[np.newaxis]] * len(lakes))
+
+    result = {
+        "status": "converged" if fit.status > 0 else "failed",
+        "message": fit.message,
+        "nfev": int(fit.nfev),
+        "njev": int(fit.njev),
+        "cost": float(fit.cost),
+        "optimality": float(fit.optimality),
+        "params": dict(zip(CALIB_PARAMS, fit.x.tolist())),
+        "rmse": {
+            lake: float(np.sqrt(np.mean(r ** 2))) for lake, r in zip(lakes, res_list)
+        },
+        "history": history,
+    }
+    write_diagnostics(result)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calibrate the lake-bottom lime parameters against observed pH."
+    )
+    parser.add_argument("--lakes", required=True, help="Lake and liming CSV.")
+    parser.add_argument("--obs", required=True, help="Observed pH CSV.")
+    parser.add_argument("--output", required=True, help="Diagnostics JSON path.")
+    parser.add_argument(
+        "--warm-start", help="Diagnostics JSON from a previous calibration."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes."
+    )
+    args = parser.parse_args()
+
+    x0 = None
+    if args.warm_start:
+        with open(args.warm_start, encoding="utf-8") as f:
+            x0 = json.load(f)["params"]
+    result = calibrate(
+        pd.read_csv(args.lakes), pd.read_csv(args.obs), x0, args.workers, args.output
+    )
+    print(f"{result['message']} Parameters: {result['params']}")
+
+
+if __name__ == "__main__":
+    main()
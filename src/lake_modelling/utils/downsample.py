@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# Default maximum number of points per series sent to the browser in charts
+MAX_CHART_POINTS = 400
+
+
+def lttb(x, y, n_out):
+    """Select points to keep when downsampling a line using the
+    Largest-Triangle-Three-Buckets algorithm, which preserves the visual
+    shape (peaks and troughs) of the line much better than regular thinning.
+    See https://skemman.is/handle/1946/15343
+
+    Args
+        x:     Array. Strictly increasing x-values
+        y:     Array. y-values
+        n_out: Int. Number of points to keep. Must be at least 3
+
+    Returns
+        Int array of sorted indices into 'x' and 'y'. Always includes the first
+        and last points.
+    """
+    assert n_out >= 3, "'n_out' must be at least 3."
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+
+    # The first and last points are kept, the others are split into
+    # 'n_out' - 2 buckets that each contribute one point
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    idx = np.empty(n_out, dtype=int)
+    idx[0] = 0
+    idx[-1] = n - 1
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+
+        # Average of the next bucket (or the last point)
+        if bucket < n_out - 3:
+            next_x = x[stop : edges[bucket + 2]].mean()
+            next_y = y[stop : edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        # Keep the point forming the largest triangle with the previously
+        # kept point and the next bucket average
+        prev_x, prev_y = x[idx[bucket]], y[idx[bucket]]
+        area = np.abs(
+            (prev_x - next_x) * (y[start:stop] - prev_y)
+            - (prev_x - x[start:stop]) * (next_y - prev_y)
+        )
+        idx[bucket + 1] = start + np.argmax(area)
+
+    return idx
+
+
+def downsample_series(df, x_col, y_cols, by, max_points=MAX_CHART_POINTS):
+    """Downsample each group of a long-format dataframe for plotting. Points
+    are chosen with 'lttb' separately for each column in 'y_cols', sharing the
+    'max_points' budget, and the union of the chosen rows is kept, so all
+    columns remain aligned.
+
+    Args
+        df:         Dataframe. Long-format data with one line per group
+        x_col:      Str. Column with x-values (numeric or datetime), sorted
+                    within each group
+        y_cols:     List of str. Columns with y-values
+        by:         Str. Column identifying the groups
+        max_points: Int. Maximum number of points per group
+
+    Returns
+        Dataframe with the same columns as 'df'. Rows with missing y-values are
+        dropped.
+    """
+    n_out = max(max_points // len(y_cols), 3)
+    df_list = []
+    for _, grp_df in df.dropna(subset=list(y_cols)).groupby(by, sort=False):
+        x = grp_df[x_col].to_numpy()
+        if np.issubdtype(x.dtype, np.datetime64):
+            x = x.astype("int64")
+        idx = np.unique(
+            np.concatenate([lttb(x, grp_df[col].to_numpy(), n_out) for col in y_cols])
+        )
+        df_list.append(grp_df.iloc[idx])
+
+    return pd.concat(df_list, axis="rows")
@@ -0,0 +1,158 @@
+import numpy as np
+
+# Maximum deviation (mg/l of Ca-equivalents) from the 'odeint' reference
+# solution accepted by the fast solver. Months where the estimated deviation
+# is larger are re-solved with 'odeint'
+FAST_SOLVER_TOL = 1e-4
+
+# Maximum internal step (months) used to evaluate the lake-bottom source term
+FAST_SOLVER_MAX_STEP = 0.01
+
+# Flushing rates (months^-1) above which a month is always re-solved with
+# 'odeint' to avoid overflow in the exponential weights
+MAX_FLUSHING_RATE = 500
+
+
+def _phi1(z):
+    """(exp(z) - 1) / z, evaluated stably near z = 0."""
+    small = np.abs(z) < 1e-8
+    z_safe = np.where(small, 1, z)
+    return np.where(small, 1 + z / 2, np.expm1(z_safe) / z_safe)
+
+
+def bottom_lime_exposure(t, rate_const, activity_const):
+    """Integral of the lake-bottom rate constant, k(u) = rate_const * exp(-activity_const * u),
+    from u = 0 to u = t. Far from saturation, the lake-bottom lime remaining at
+    time t is C_bott0 * exp(-exposure).
+
+    Args
+        t:              Array. Time since liming (months)
+        rate_const:     Array. Initial dissolution rate of lake-bottom lime (months^-1)
+        activity_const: Array. Rate at which lake-bottom lime becomes inactive (months^-1)
+
+    Returns
+        Array broadcast from the inputs.
+    """
+    active = activity_const > 0
+    a_safe = np.where(active, activity_const, 1)
+    return rate_const * np.where(active, -np.expm1(-a_safe * t) / a_safe, t)
+
+
+def _integrate(months, u, r, C_in, rate_const, activity_const, C_lake0, C_bott0):
+    """Exponential integrator for consecutive months on a uniform grid of
+    offsets 'u' within each month.
+
+    The lake-bottom store is solved exactly. The total store S = C_lake + C_bott
+    obeys dS/dt = r * (C_in + C_bott - S), which is integrated exactly assuming
+    C_bott decays exponentially within each step (exact at the step end points).
+
+    Returns
+        Tuple of arrays (C_lake, C_bott), each of shape (M, len(u), N).
+    """
+    h = u[1] - u[0]
+    u = u[np.newaxis, :, np.newaxis]
+    r = r[:, np.newaxis, :]
+    exposure = bottom_lime_exposure(
+        months[:, np.newaxis, np.newaxis] + u, rate_const, activity_const
+    )
+    C_bott = C_bott0 * np.exp(-(exposure - exposure[0, 0]))
+
+    # Contribution of lake-bottom dissolution over each step, discounted by
+    # flushing to the end of the step
+    kappa = np.diff(exposure, axis=1) / h
+    w = C_bott[:, :-1] * h * np.exp(-kappa * h) * _phi1((kappa - r) * h)
+
+    # Accumulate steps within each month, starting from zero:
+    # J_n = sum_i w_i * exp(-r * (u_n - u_(i+1)))
+    J = np.zeros_like(C_bott)
+    J[:, 1:] = np.exp(-r * u[:, 1:]) * np.cumsum(w * np.exp(r * u[:, 1:]), axis=1)
+
+    # Chain the months together. D is the excess of S over the inflow
+    # concentration at the start of each month
+    decay = np.exp(-r[:, 0])
+    D = np.empty((len(months), len(C_in)))
+    D[0] = C_lake0 + C_bott0 - C_in
+    for idx in range(1, len(months)):
+        D[idx] = decay[idx - 1] * D[idx - 1] + r[idx - 1, 0] * J[idx - 1, -1]
+
+    S = C_in + np.exp(-r * u) * D[:, np.newaxis, :] + r * J
+    C_lake = S - C_bott
+
+    return C_lake, C_bott
+
+
+def solve_months(
+    months,
+    n_out,
+    Q,
+    V,
+    C_in,
+    rate_const,
+    activity_const,
+    ca_aq_sat,
+    C_lake0,
+    C_bott0,
+    tol=FAST_SOLVER_TOL,
+):
+    """Semi-analytic solution of the lake ODE system (see 'Model.run') over
+    consecutive months with constant flow in each month, for N scenarios at once.
+
+    The solution neglects the saturation terms in the ODEs, so it is only valid
+    while the lake is well below 'ca_aq_sat'. Validity is checked along the
+    computed trajectory, and the deviation from the exact solution is estimated
+    by step doubling. Once a month is invalid, results for later months of that
+    scenario are meaningless and must be recomputed from a valid state.
+
+    Args
+        months:         Array of length M. Consecutive month start times (months
+                        since liming)
+        n_out:          Int. Number of output steps per month
+        Q:              Array of shape (M, N). Flow in each month (litres/month)
+        V:              Array of length N. Lake volume (litres)
+        C_in:           Array of length N. Inflow Ca concentration (mg/l)
+        rate_const:     Array of length N. See 'Model'
+        activity_const: Array of length N. See 'Model'
+        ca_aq_sat:      Array of length N. See 'Model'
+        C_lake0:        Array of length N. Lake Ca-equivalents at months[0] (mg/l)
+        C_bott0:        Array of length N. Lake-bottom Ca-equivalents at months[0]
+                        (mg/l)
+        tol:            Float. Maximum deviation (mg/l) accepted
+
+    Returns
+        Tuple (C_lake, C_bott, max_dev, valid). 'C_lake' and 'C_bott' are arrays of
+        shape (M, n_out + 1, N) holding values at the start, the 'n_out' - 1
+        intermediate output times and the end of each month; 'max_dev' is an array
+        of shape (M, N) with the estimated maximum deviation from the exact
+        solution (mg/l); 'valid' is a boolean array of shape (M, N).
+    """
+    months = np.asarray(months, dtype=float)
+    Q = np.asarray(Q, dtype=float).reshape(len(months), -1)
+    V, C_in, rate_const, activity_const, ca_aq_sat, C_lake0, C_bott0 = (
+        np.atleast_1d(np.asarray(arr, dtype=float))
+        for arr in (V, C_in, rate_const, activity_const, ca_aq_sat, C_lake0, C_bott0)
+    )
+    r = Q / V
+
+    # Internal grid: an even number of sub-steps per output step, so that every
+    # other point can be used for the step-doubling error estimate
+    n_sub = 2 * int(np.ceil(1 / (n_out * 2 * FAST_SOLVER_MAX_STEP)))
+    u = np.linspace(0, 1, n_out * n_sub + 1)
+
+    args = (r, C_in, rate_const, activity_const, C_lake0, C_bott0)
+    C_lake, C_bott = _integrate(months, u, *args)
+    C_lake_2h, _ = _integrate(months, u[::2], *args)
+    max_dev = np.abs(C_lake[:, ::2] - C_lake_2h).max(axis=1)
+
+    # The exact solution assumes (i) the saturation sigmoid in the ODEs is
+    # effectively 1 and (ii) dissolution is limited by C_bott, not by the
+    # distance from saturation. Add a bound on the error from (i)
+    max_dev = max_dev + rate_const * C_bott[:, 0] * np.exp(
+        np.minimum(10 * (C_lake.max(axis=1) - ca_aq_sat), 0)
+    )
+    valid = (
+        (max_dev <= tol)
+        & ((C_lake + C_bott).max(axis=1) <= ca_aq_sat)
+        & (r <= MAX_FLUSHING_RATE)
+    )
+
+    return C_lake[:, ::n_sub], C_bott[:, ::n_sub], max_dev, valid
@@ -1,4 +1,3 @@
-import os
 from datetime import datetime, timedelta
 
 import altair as alt
@@ -7,20 +6,77 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 from scipy.integrate import odeint
-from scipy.interpolate import interp1d
+from scipy.optimize import brentq
+
+from src.lake_modelling.utils.fast_solver import solve_months
+from src.lake_modelling.utils.reference_data import (
+    ID_PHS,
+    MONTHS,
+    OD_DOSES,
+    flow_typologies,
+    lime_product_table,
+)
+from src.lake_modelling.utils.result_cache import model_key
+from src.lake_modelling.utils.timing import span
+from src.lake_modelling.utils.titration import caco3_to_ph, ph_to_caco3
 
 plt.style.use("ggplot")
 
-LIME_PRODUCTS_DATA = "data/lime_products.xlsx"
-FLOW_TYPES_DATA = "data/flow_typologies.xlsx"
-TITRATION_CURVE_DATA = "data/titration_curves_interpolated.xlsx"
-
 # Molar masses (g/mol)
 MM_MgCO3 = 84.31
 MM_CaCO3 = 100.09
 MM_Mg = 24.31
 MM_Ca = 40.08
 
+# Column test breakpoints as floats: pH for the ID values and lime dose (mg/l)
+# for the overdosing factors
+ID_PH_BREAKS = np.array(ID_PHS) / 10
+OD_DOSE_BREAKS = np.array(OD_DOSES, dtype=float)
+
+# Parameters that can be varied in 'Model.run_ensemble'. 'id_scale' and
+# 'od_scale' are multipliers applied to the column-test 'id_list' and 'od_list'
+ENSEMBLE_PARAMS = (
+    "rate_const",
+    "activity_const",
+    "F_sol",
+    "ca_aq_sat",
+    "id_scale",
+    "od_scale",
+)
+
+
+def batch_dCdt(y, t, Q, V, C_in, rate_const, activity_const, ca_aq_sat):
+    """Vectorised version of the ODE system in 'Model.run' for N scenarios.
+
+    Args
+        y:              Array of length 2N. Interleaved state
+                        [C_lake_1, C_bott_1, ..., C_lake_N, C_bott_N] in mg/l
+                        of Ca-equivalents
+        t:              Float. Time since liming (months)
+        Q:              Array of length N. Flow this month (litres/month)
+        V:              Array of length N. Lake volume (litres)
+        C_in:           Array of length N. Inflow Ca concentration (mg/l)
+        rate_const:     Array of length N. Initial dissolution rate of
+                        lake-bottom lime (months^-1)
+        activity_const: Array of length N. Rate at which lake-bottom lime
+                        becomes inactive (months^-1)
+        ca_aq_sat:      Array of length N. Maximum Ca concentration (mg-Ca/l)
+                        for a saturated solution
+
+    Returns
+        Array of length 2N with the same layout as 'y'.
+    """
+    y = y.reshape(-1, 2)
+    C_lake = y[:, 0]
+    C_bott = y[:, 1]
+
+    k = rate_const * np.exp(-activity_const * t)
+    rate_factor = 1 / (1 + np.exp(10 * (C_lake - ca_aq_sat)))
+    dCbott_dt = -k * rate_factor * np.minimum(C_bott, ca_aq_sat - C_lake)
+    dClake_dt = Q * (C_in - C_lake) / V - dCbott_dt
+
+    return np.column_stack((dClake_dt, dCbott_dt)).ravel()
+
 
 class Lake:
     def __init__(
@@ -86,11 +142,9 @@ class Lake:
     @property
     def monthly_flows(self):
         """Monthly flows (in litres/month) based on mean annual flow and flow typology."""
-        xl_path = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)), f"../../../{FLOW_TYPES_DATA}"
-        )
-        q_df = (pd.read_excel(xl_path, index_col=0) * self.mean_annual_flow).round(0)
-        q_dict = q_df[self.flow_prof].to_dict()
+        with span("Lake.monthly_flows"):
+            q_arr = np.round(flow_typologies()[self.flow_prof] * self.mean_annual_flow, 0)
+            q_dict = dict(zip(MONTHS.tolist(), q_arr.tolist()))
 
         return q_dict
 
@@ -106,7 +160,8 @@ class Lake:
         """
 
         months = range(1, 13)
-        q_lpmon = np.array([self.monthly_flows[i] for i in months])
+        q_dict = self.monthly_flows
+        q_lpmon = np.array([q_dict[i] for i in months])
         q_m3ps = q_lpmon / (1000 * 60 * 60 * 24 * 30)
         q_mean = self.mean_annual_flow / (1000 * 60 * 60 * 24 * 30)
 
@@ -226,6 +281,11 @@ class LimeProduct:
                     )
         self._validate_input()
 
+        # Column test values used by 'get_instantaneous_dissolution'. Precomputed
+        # once, so 'id_list' and 'od_list' should not be changed after this
+        self._id_arr = np.asarray(self.id_list, dtype=float)
+        self._od_arr = np.asarray(self.od_list, dtype=float)
+
     def _validate_input(self):
         """Check user-supplied values are reasonable."""
         assert (
@@ -248,20 +308,17 @@ class LimeProduct:
         Returns
             None. Attributes are updated
         """
-        xl_path = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)),
-            f"../../../{LIME_PRODUCTS_DATA}",
-        )
-        df = pd.read_excel(xl_path, index_col=0)
-        if name not in df.columns:
-            raise KeyError(f"Lime product '{name}' not found in database.")
-
-        self.ca_pct = df.loc["CaPct", name]
-        self.mg_pct = df.loc["MgPct", name]
-        self.dry_fac = df.loc["DryFac", name]
-        self.col_depth = df.loc["ColDepth", name]
-        self.id_list = [df.loc[f"IDph{ph}", name] for ph in (40, 45, 50, 55, 60)]
-        self.od_list = [df.loc[f"OD{dose}", name] for dose in (10, 20, 35, 50, 85)]
+        with span("LimeProduct.load"):
+            table = lime_product_table()
+            if name not in table:
+                raise KeyError(f"Lime product '{name}' not found in database.")
+
+            self.ca_pct = table.value("CaPct", name)
+            self.mg_pct = table.value("MgPct", name)
+            self.dry_fac = table.value("DryFac", name)
+            self.col_depth = table.value("ColDepth", name)
+            self.id_list = [table.value(f"IDph{ph}", name) for ph in ID_PHS]
+            self.od_list = [table.value(f"OD{dose}", name) for dose in OD_DOSES]
 
     def get_instantaneous_dissolution(self, pH, dose):
         """Interpolates column test data to estimate the instantaneous dissolution (ID)
@@ -274,23 +331,17 @@ class LimeProduct:
         will return ID values for the nearest boundary.
 
         Args
-            pH:   Float. pH at which ID is to be estimated
-            dose: Float. Lime dose (in mg/l) at which ID is to be estimated
+            pH:   Float or array. pH at which ID is to be estimated
+            dose: Float or array broadcastable with 'pH'. Lime dose (in mg/l) at which
+                  ID is to be estimated
 
         Returns
-            Float. Estimated instananeous dissolution in percent.
+            Float or array. Estimated instananeous dissolution in percent.
         """
-        # Clip data to interpolation range
-        pH = max(min(pH, 6), 4)
-        dose = max(min(dose, 85), 10)
-
-        # Interpolate ID at dose = 10 mg/l
-        interp_ph = interp1d([4, 4.5, 5, 5.5, 6], self.id_list)
-        id_d10 = interp_ph(pH)
-
-        # Interpolate OD at pH = 4.6
-        interp_od = interp1d([10, 20, 35, 50, 85], self.od_list)
-        od_ph46 = interp_od(dose)
+        # np.interp returns the boundary values outside the breakpoints, which
+        # clips to the interpolation range
+        id_d10 = np.interp(pH, ID_PH_BREAKS, self._id_arr)
+        od_ph46 = np.interp(dose, OD_DOSE_BREAKS, self._od_arr)
 
         return id_d10 / od_ph46
 
@@ -373,6 +424,110 @@ class LimeProduct:
             return chart
 
 
+class ModelResult:
+    __slots__ = ("time_months", "ca_mgpl", "ph")
+
+    def __init__(self, time_months, ca_mgpl, ph):
+        """Results of a model run, held as contiguous float arrays. Pandas views
+        of the results are only built when requested.
+
+        Args
+            time_months: Array. Time in decimal months from the start of the
+                         year, starting at 'lime_month' - 1
+            ca_mgpl:     Array. Lake Ca concentration (mg/l of Ca-equivalents)
+            ph:          Array. Lake pH
+        """
+        self.time_months = np.ascontiguousarray(time_months, dtype=float)
+        self.ca_mgpl = np.ascontiguousarray(ca_mgpl, dtype=float)
+        self.ph = np.ascontiguousarray(ph, dtype=float)
+
+    def __len__(self):
+        return len(self.time_months)
+
+    def dates(self):
+        """DatetimeIndex. Decimal months converted to dates. 2000 is used as an
+        arbitrary start year i.e. only month and day have any meaning.
+        """
+        return datetime(2000, 1, 1) + pd.to_timedelta(
+            self.time_months * 365 / 12, unit="D"
+        )
+
+    def to_frame(self):
+        """Dataframe with columns 'date', 'Ca (mg/l)' and 'pH', indexed by
+        decimal month. A new dataframe is built on every call.
+        """
+        with span("ModelResult.to_frame"):
+            df = pd.DataFrame(
+                {"date": self.dates(), "Ca (mg/l)": self.ca_mgpl, "pH": self.ph},
+                index=self.time_months,
+            )
+
+        return df
+
+    def daily(self):
+        """Daily mean results. Equivalent to
+        'to_frame().set_index("date").resample("D").mean().reset_index()', but
+        without building the full-resolution dataframe.
+
+        Returns
+            Dataframe with columns 'date', 'Ca (mg/l)' and 'pH'. Days without
+            any model output are NaN.
+        """
+        with span("ModelResult.daily"):
+            days = self.dates().values.astype("datetime64[D]")
+            day_idx = (days - days[0]).astype(int)
+            counts = np.bincount(day_idx)
+            with np.errstate(invalid="ignore"):
+                ca = np.bincount(day_idx, weights=self.ca_mgpl) / counts
+                ph = np.bincount(day_idx, weights=self.ph) / counts
+            df = pd.DataFrame(
+                {
+                    "date": pd.to_datetime(days[0] + np.arange(len(counts))),
+                    "Ca (mg/l)": ca,
+                    "pH": ph,
+                }
+            )
+
+        return df
+
+
+class EnsembleResult:
+    __slots__ = ("time_months", "percentiles", "ca_mgpl", "ph", "n")
+
+    def __init__(self, time_months, percentiles, ca_mgpl, ph, n):
+        """Percentiles of an ensemble of model runs. See 'Model.run_ensemble'.
+
+        Args
+            time_months: Array of length T. Time in decimal months from the start
+                         of the year, starting at 'lime_month' - 1
+            percentiles: Tuple of length P. Percentiles (0 to 100)
+            ca_mgpl:     Array of shape (P, T). Percentiles of lake Ca
+                         concentration (mg/l of Ca-equivalents)
+            ph:          Array of shape (P, T). Percentiles of lake pH
+            n:           Int. Number of ensemble members
+        """
+        self.time_months = time_months
+        self.percentiles = tuple(percentiles)
+        self.ca_mgpl = ca_mgpl
+        self.ph = ph
+        self.n = n
+
+    def to_frame(self):
+        """Dataframe indexed by decimal month with a 'date' column and columns
+        'Ca (mg/l) P<p>' and 'pH P<p>' for each percentile p.
+        """
+        dates = datetime(2000, 1, 1) + pd.to_timedelta(
+            self.time_months * 365 / 12, unit="D"
+        )
+        data = {"date": dates}
+        for idx, pct in enumerate(self.percentiles):
+            data[f"Ca (mg/l) P{pct:g}"] = self.ca_mgpl[idx]
+        for idx, pct in enumerate(self.percentiles):
+            data[f"pH P{pct:g}"] = self.ph[idx]
+
+        return pd.DataFrame(data, index=self.time_months)
+
+
 class Model:
     def __init__(
         self,
@@ -419,9 +574,14 @@ class Model:
         self._validate_input()
 
         # Derived attributes
-        interp = self._interp_caco3_from_ph()
-        self.C_lake0 = interp(self.lake.pH_lake0) * MM_Ca / MM_CaCO3
-        self.C_in0 = interp(self.lake.pH_inflow) * MM_Ca / MM_CaCO3
+        caco3_lake0, caco3_in0 = ph_to_caco3(
+            [self.lake.pH_lake0, self.lake.pH_inflow], self.lake.toc_lake0
+        )
+        self.C_lake0 = caco3_lake0 * MM_Ca / MM_CaCO3
+        self.C_in0 = caco3_in0 * MM_Ca / MM_CaCO3
+
+        # Last scalar result of '_partition_lime_equivalents'
+        self._partition_cache = None
 
     def _validate_input(self):
         """Check user-supplied values are reasonable."""
@@ -493,35 +653,57 @@ class Model:
         else:
             return self.lake.pH_lake0 - 0.5 * depth_corr
 
-    def _partition_lime_equivalents(self):
+    def _partition_lime_equivalents(self, lime_dose=None):
         """Estimate the instantaneous dissolution of the Ca and Mg componets.
         Convert Mg to Ca-equivalents and partition into two fractions: one that
         dissolves "instantly" and another that sinks to the bottom but remains
         available for slow dissolution.
 
         Args
-            None
+            lime_dose: Float or array. Lime dose(s) (in mg/l) to partition. Default
+                       None uses 'lime_dose'
 
         Returns
-            Tuple of floats (C_inst, C_bott). C_inst is the "instantaneous" increase
-            in lake Ca concentration (in mg/l of Ca-equivalents) due to rapid
-            dissolution of CaCO3 and MgCO3; C_bott is the remainder of the lime
-            (also in mg/l of Ca-equivalents) that sinks to the bottom of the lake
-            and remains available for dissolution.
+            Tuple (C_inst, C_bott) of floats, or arrays of the same shape as
+            'lime_dose'. C_inst is the "instantaneous" increase in lake Ca
+            concentration (in mg/l of Ca-equivalents) due to rapid dissolution of
+            CaCO3 and MgCO3; C_bott is the remainder of the lime (also in mg/l of
+            Ca-equivalents) that sinks to the bottom of the lake and remains
+            available for dissolution.
         """
+        if lime_dose is None:
+            lime_dose = self.lime_dose
+
+        # The partition for a single dose is read repeatedly (e.g. via 'C_inst0'
+        # and 'C_bott0'), so the last result is kept. The key covers every input,
+        # since attributes such as 'lime_dose' may be changed after creation
+        scalar = np.ndim(lime_dose) == 0
+        if scalar:
+            key = (
+                lime_dose,
+                self.spr_meth,
+                self.F_sol,
+                self.lake.depth,
+                self.lake.pH_lake0,
+                id(self.lime_product),
+            )
+            cache = self._partition_cache
+            if cache is not None and cache[0] == key:
+                return cache[1]
+
         # Get dose of Ca and Mg
-        ca_dose = self.lime_product.ca_pct * self.lime_dose / 100
-        mg_dose = self.lime_product.mg_pct * self.lime_dose / 100
-
-        # Get instantaneous dissolution
-        eff_ph_ca = self._get_effective_ph_for_depth("Ca")
-        eff_ph_mg = self._get_effective_ph_for_depth("Mg")
-        id_ca_pct = self.method_fac * self.lime_product.get_instantaneous_dissolution(
-            eff_ph_ca, self.lime_dose
-        )
-        id_mg_pct = self.method_fac * self.lime_product.get_instantaneous_dissolution(
-            eff_ph_mg, self.lime_dose
-        )
+        ca_dose = self.lime_product.ca_pct * lime_dose / 100
+        mg_dose = self.lime_product.mg_pct * lime_dose / 100
+
+        # Get instantaneous dissolution for Ca and Mg in one call
+        eff_phs = np.array(
+            [
+                self._get_effective_ph_for_depth("Ca"),
+                self._get_effective_ph_for_depth("Mg"),
+            ]
+        ).reshape((2,) + (1,) * np.ndim(lime_dose))
+        id_pct = self.lime_product.get_instantaneous_dissolution(eff_phs, lime_dose)
+        id_ca_pct, id_mg_pct = self.method_fac * id_pct
 
         # Partition between water column and lake bottom
         id_ca = id_ca_pct * ca_dose / 100
@@ -533,75 +715,304 @@ class Model:
         C_inst0 = id_ca + (id_mg * MM_Ca / MM_Mg)
         C_bott0 = self.F_sol * (bott_ca + (bott_mg * MM_Ca / MM_Mg))
 
+        if scalar:
+            C_inst0, C_bott0 = float(C_inst0), float(C_bott0)
+            self._partition_cache = (key, (C_inst0, C_bott0))
+
         return (C_inst0, C_bott0)
 
-    def _interp_ph_from_caco3(self):
-        """Estimate pH from on CaCO3 concentration based on titration curves."""
-        # Get TOC class
-        if self.lake.toc_lake0 <= 3:
-            toc_class = "TOC ≤ 3"
-        elif 3 < self.lake.toc_lake0 <= 5:
-            toc_class = "3 < TOC ≤ 5"
-        else:
-            toc_class = "TOC > 5"
+    def _pH_from_delta_Ca(self):
+        """Build a titration curve linking change in Ca-equivalents to lake pH."""
+        # Convert modelled Ca to CaCO3
+        caco3_mod = self.model_ca_mgpl * MM_CaCO3 / MM_Ca
 
-        # Build interpolator
-        xl_path = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)),
-            f"../../../{TITRATION_CURVE_DATA}",
-        )
-        df = pd.read_excel(xl_path)
-        df = df.query("`TOC class (mg/l)` == @toc_class")
-        interp = interp1d(
-            df["CaCO3 (mg/l)"].values, df["pH"].values, fill_value="extrapolate"
-        )
+        # Predict pH from modelled CaCO3
+        ph_mod = caco3_to_ph(caco3_mod, self.lake.toc_lake0)
 
-        return interp
+        return ph_mod
 
-    def _interp_caco3_from_ph(self):
-        """Estimate CaCO3 concentration from pH based on titration curves."""
-        # Get TOC class
-        if self.lake.toc_lake0 <= 3:
-            toc_class = "TOC ≤ 3"
-        elif 3 < self.lake.toc_lake0 <= 5:
-            toc_class = "3 < TOC ≤ 5"
-        else:
-            toc_class = "TOC > 5"
+    def run(self, dt=0.01, solver="odeint", cache=None):
+        """Simulate change in concentration of Ca-equivalents and pH over time.
 
-        # Build interpolator
-        xl_path = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)),
-            f"../../../{TITRATION_CURVE_DATA}",
+        Args
+            dt:     Float between 0 and 1 (months). Time resolution in decimal
+                    months for evaluating the model within each monthly time step.
+                    NOTE: This parameter does not affect how the ODEs are solved
+                    (that is handled automatically). It simply sets the level of
+                    temporal detail in the output. Larger values run faster, but
+                    give coarser output.
+            solver: Str. Either 'odeint' or 'fast'. 'odeint' is the reference
+                    numerical solver. 'fast' uses a semi-analytic solution for each
+                    month, which is accurate to within 'FAST_SOLVER_TOL' mg/l of
+                    the reference. Months where the lake approaches 'ca_aq_sat', or
+                    where the estimated deviation exceeds the tolerance, are solved
+                    with 'odeint' instead. The largest estimated deviation is
+                    stored in 'solver_max_dev' and the months (counted from 0) that
+                    fell back to 'odeint' in 'solver_fallback_months'.
+            cache:  Obj. Optional ResultCache. If the same scenario has already
+                    been run with the same 'dt' and 'solver', the stored result
+                    is used instead of solving the ODEs. Default None
+
+        Returns
+            ModelResult. Use 'to_frame' or 'daily' for dataframes.
+        """
+        assert 0 < dt < 1, "'dt' must be between 0 and 1."
+        assert solver in ("odeint", "fast"), "'solver' must be either 'odeint' or 'fast'."
+        self.dt = dt
+        self.month_ids = (list(range(1, 13)) * self.n_months)[
+            self.lime_month - 1 : self.lime_month + self.n_months
+        ]
+        if cache is not None:
+            with span("Model.run.cache"):
+                key = model_key(self, dt, solver)
+                cached = cache.get(key)
+            if cached is not None:
+                t, ca, info = cached
+                self.solver_max_dev = info["max_dev"]
+                self.solver_fallback_months = info["fallback_months"]
+                return self._set_results(t, ca)
+
+        with span("Model.run.partition"):
+            C_inst0, C_bott0 = self.C_inst0, self.C_bott0
+        with span(f"Model.run.solve[{solver}]"):
+            t, ca, self.solver_max_dev, self.solver_fallback_months = self._solve(
+                self.C_lake0 + C_inst0, C_bott0, self.n_months, dt, solver
+            )
+        if cache is not None:
+            info = {
+                "max_dev": self.solver_max_dev,
+                "fallback_months": self.solver_fallback_months,
+            }
+            with span("Model.run.cache"):
+                cache.put(key, t, ca, info)
+
+        return self._set_results(t, ca)
+
+    def find_dose(self, target_ph, at_month=None, criterion="final", dt=0.01, xtol=0.01):
+        """Find the smallest lime dose that achieves 'target_ph'. All other model
+        parameters are kept fixed, and 'lime_dose' is not changed.
+
+        Lake pH increases monotonically with dose, so the lake Ca concentration
+        equivalent to 'target_ph' is found from the titration curve, the doses
+        are scanned in steps of 5 mg/l to bracket the target and the root is
+        refined with Brent's method. Each evaluation uses the 'fast' solver (see
+        'run').
+
+        Args
+            target_ph: Float. Target lake pH
+            at_month:  Float. Months after liming at which the target must be met.
+                       Default None uses 'n_months'
+            criterion: Str. Either 'final' or 'min'. 'final' requires the target
+                       pH at 'at_month'; 'min' requires the pH to stay at or above
+                       the target for the whole period up to 'at_month'
+            dt:        Float between 0 and 1 (months). Time resolution used to
+                       evaluate the model. See 'run'
+            xtol:      Float. Tolerance (mg/l) for the dose
+
+        Returns
+            Float. Required lime dose (mg/l). 0 if the target is met without
+            liming; NaN if it cannot be met with the maximum dose of 85 mg/l.
+        """
+        if at_month is None:
+            at_month = self.n_months
+        assert criterion in ("final", "min"), "'criterion' must be either 'final' or 'min'."
+        assert 0 < at_month <= self.n_months, "'at_month' must be between 0 and 'n_months'."
+        assert 0 < dt < 1, "'dt' must be between 0 and 1."
+        n_months = int(np.ceil(at_month))
+        target_ca = ph_to_caco3(target_ph, self.lake.toc_lake0) * MM_Ca / MM_CaCO3
+
+        def ca_excess(dose):
+            with span("Model.find_dose.evaluate"):
+                C_inst, C_bott = self._partition_lime_equivalents(dose)
+                t, ca, _, _ = self._solve(
+                    self.C_lake0 + self.spr_prop * C_inst,
+                    self.spr_prop * C_bott,
+                    n_months,
+                    dt,
+                    "fast",
+                )
+            if criterion == "final":
+                ca_crit = np.interp(at_month, t, ca)
+            else:
+                ca_crit = ca[t <= at_month].min()
+
+            return ca_crit - target_ca
+
+        # Scan doses to bracket the smallest dose achieving the target
+        doses = np.linspace(0, 85, 18)
+        excess_lo = ca_excess(doses[0])
+        if excess_lo >= 0:
+            return 0.0
+        for dose_lo, dose_hi in zip(doses[:-1], doses[1:]):
+            excess_hi = ca_excess(dose_hi)
+            if excess_hi >= 0:
+                return brentq(ca_excess, dose_lo, dose_hi, xtol=xtol)
+
+        return np.nan
+
+    def run_ensemble(
+        self, n, distributions, seed=None, dt=0.01, percentiles=(5, 50, 95)
+    ):
+        """Run the model for an ensemble of 'n' parameter sets drawn at random,
+        and summarise the results as percentiles at each output time.
+
+        All ensemble members are integrated together, one month at a time,
+        using the semi-analytic solver (see 'fast_solver.solve_months'). Members
+        for which it is not valid in a given month are re-solved with 'odeint'
+        as a single stacked system. Only percentiles are kept, so memory use
+        does not grow with 'n' times the number of output times.
+
+        Args
+            n:             Int. Number of ensemble members
+            distributions: Dict {param: distribution}. 'param' must be one of
+                           'ENSEMBLE_PARAMS' and 'distribution' a frozen
+                           scipy.stats distribution (or any object with an
+                           'rvs(size, random_state)' method). Parameters not
+                           in the dict are fixed at the values for this Model
+                           ('id_scale' and 'od_scale' at 1)
+            seed:          Int. Seed for the random number generator. Default
+                           None
+            dt:            Float between 0 and 1 (months). Time resolution of the
+                           output. See 'run'
+            percentiles:   Tuple of floats between 0 and 100. Percentiles to
+                           return
+
+        Returns
+            EnsembleResult. pH percentiles are obtained by converting the Ca
+            percentiles, since pH increases monotonically with Ca.
+        """
+        assert isinstance(n, int) and n > 0, "'n' must be a positive integer."
+        for name in distributions:
+            assert name in ENSEMBLE_PARAMS, f"'{name}' must be one of {ENSEMBLE_PARAMS}."
+        assert 0 < dt < 1, "'dt' must be between 0 and 1."
+
+        # Draw parameters
+        rng = np.random.default_rng(seed)
+        params = {
+            "rate_const": self.rate_const,
+            "activity_const": self.activity_const,
+            "F_sol": self.F_sol,
+            "ca_aq_sat": self.ca_aq_sat,
+            "id_scale": 1,
+            "od_scale": 1,
+        }
+        draws = {}
+        for name in ENSEMBLE_PARAMS:
+            if name in distributions:
+                draws[name] = np.asarray(
+                    distributions[name].rvs(size=n, random_state=rng), dtype=float
+                )
+            else:
+                draws[name] = np.full(n, params[name], dtype=float)
+        assert (draws["rate_const"] >= 0).all(), "'rate_const' draws must be >= 0."
+        assert (draws["activity_const"] >= 0).all(), "'activity_const' draws must be >= 0."
+        assert ((draws["F_sol"] >= 0) & (draws["F_sol"] <= 1)).all(), (
+            "'F_sol' draws must be between 0 and 1."
         )
-        df = pd.read_excel(xl_path)
-        df = df.query("`TOC class (mg/l)` == @toc_class")
-        interp = interp1d(
-            df["pH"].values, df["CaCO3 (mg/l)"].values, fill_value="extrapolate"
+        assert (draws["ca_aq_sat"] > 0).all(), "'ca_aq_sat' draws must be > 0."
+        assert (draws["id_scale"] > 0).all() and (draws["od_scale"] > 0).all(), (
+            "'id_scale' and 'od_scale' draws must be > 0."
         )
 
-        return interp
+        n_steps = int(1 + 1 / dt) - 1
+        n_t = self.n_months * n_steps + 1
+        t_out = np.empty(n_t)
+        ca_out = np.empty((len(percentiles), n_t))
+        for month, ti, C_lakes in self._solve_draws(draws, dt):
+            seg = slice(month * n_steps, (month + 1) * n_steps + 1)
+            t_out[seg] = ti
+            ca_out[:, seg] = np.percentile(C_lakes, percentiles, axis=1)
 
-    def _pH_from_delta_Ca(self):
-        """Build a titration curve linking change in Ca-equivalents to lake pH."""
-        # Convert modelled Ca to CaCO3
-        caco3_mod = self.model_ca_mgpl * MM_CaCO3 / MM_Ca
+        ph_out = caco3_to_ph(ca_out * MM_CaCO3 / MM_Ca, self.lake.toc_lake0)
 
-        # Predict pH from modelled CaCO3
-        interp = self._interp_ph_from_caco3()
-        ph_mod = interp(caco3_mod)
+        return EnsembleResult(t_out + self.lime_month - 1, percentiles, ca_out, ph_out, n)
 
-        return ph_mod
+    def _solve_draws(self, draws, dt):
+        """Integrate the model for N parameter sets together, one month at a
+        time. See 'run_ensemble'.
 
-    def run(self, dt=0.01):
-        """Simulate change in concentration of Ca-equivalents and pH over time.
+        Args
+            draws: Dict {param: array of length N} for every param in
+                   'ENSEMBLE_PARAMS'
+            dt:    Float between 0 and 1 (months). Time resolution of the output
+
+        Returns
+            Generator of tuples (month, ti, C_lakes), one per month. 'ti' is an
+            array of time (months since liming) and 'C_lakes' an array of shape
+            (len(ti), N) of lake Ca concentrations (mg/l of Ca-equivalents). The
+            last row of 'C_lakes' is the first row for the next month.
+        """
+        # ID is proportional to the column-test ID values and inversely
+        # proportional to the overdosing factors, so only the fraction that
+        # dissolves instantly needs rescaling
+        C_inst, C_bott = self._partition_lime_equivalents()
+        C_total = (
+            self.lime_dose
+            * (self.lime_product.ca_pct + self.lime_product.mg_pct * MM_Ca / MM_Mg)
+            / 100
+        )
+        C_inst = np.minimum(C_inst * draws["id_scale"] / draws["od_scale"], C_total)
+        C_bott = draws["F_sol"] * (C_total - C_inst)
+        C_lake = self.C_lake0 + self.spr_prop * C_inst
+        C_bott = self.spr_prop * C_bott
+
+        n = len(draws["rate_const"])
+        n_steps = int(1 + 1 / dt) - 1
+        q_dict = self.lake.monthly_flows
+        month_ids = (np.arange(self.n_months) + self.lime_month - 1) % 12 + 1
+        for month in range(self.n_months):
+            q_month = q_dict[month_ids[month]]
+            ti = np.linspace(month, month + 1, num=n_steps + 1)
+            with span("Model.run_ensemble.fast"):
+                C_lakes, C_botts, _, valid = solve_months(
+                    [month],
+                    n_steps,
+                    [q_month],
+                    self.lake.volume,
+                    np.full(n, self.C_in0),
+                    draws["rate_const"],
+                    draws["activity_const"],
+                    draws["ca_aq_sat"],
+                    C_lake,
+                    C_bott,
+                )
+            C_lakes, C_botts = C_lakes[0], C_botts[0]
+            invalid = np.flatnonzero(~valid[0])
+            if len(invalid) > 0:
+                with span("Model.run_ensemble.odeint"):
+                    y0 = np.column_stack((C_lake[invalid], C_bott[invalid])).ravel()
+                    args = (
+                        q_month,
+                        self.lake.volume,
+                        self.C_in0,
+                        draws["rate_const"][invalid],
+                        draws["activity_const"][invalid],
+                        draws["ca_aq_sat"][invalid],
+                    )
+                    y = odeint(batch_dCdt, y0, ti, args=args, ml=1, mu=1)
+                    C_lakes[:, invalid] = y[:, 0::2]
+                    C_botts[:, invalid] = y[:, 1::2]
+
+            yield month, ti, C_lakes
+            C_lake, C_bott = C_lakes[-1], C_botts[-1]
+
+    def _solve(self, C_lake, C_bott, n_months, dt, solver):
+        """Solve the ODE system from the time of liming. See 'run' for details.
 
         Args
-            dt: Float between 0 and 1 (months). Time resolution in decimal
-                months for evaluating the model within each monthly time step.
-                NOTE: This parameter does not affect how the ODEs are solved
-                (that is handled automatically). It simply sets the level of
-                temporal detail in the output. Larger values run faster, but
-                give coarser output.
+            C_lake:   Float. Lake Ca concentration (mg/l of Ca-equivalents)
+                      immediately after liming
+            C_bott:   Float. Soluble lake-bottom lime (mg/l of Ca-equivalents)
+                      immediately after liming
+            n_months: Int. Number of months to simulate
+            dt:       Float between 0 and 1 (months). Time resolution of the output
+            solver:   Str. Either 'odeint' or 'fast'
+
+        Returns
+            Tuple (t, ca, max_dev, fallback_months). 't' and 'ca' are arrays of time
+            in decimal months since liming and lake Ca concentration (mg/l of
+            Ca-equivalents); 'max_dev' and 'fallback_months' are as described for
+            'solver_max_dev' and 'solver_fallback_months' in 'run'.
         """
 
         def dCdt(y, t, params):
@@ -650,24 +1061,59 @@ class Model:
 
             return dydt
 
-        # Setup time domain
-        assert 0 < dt < 1, "'dt' must be between 0 and 1."
-        months = range(self.n_months)
-        month_ids = (list(range(1, 13)) * self.n_months)[
-            self.lime_month - 1 : self.lime_month + self.n_months
-        ]
-        self.dt = dt
-        self.month_ids = month_ids
+        month_ids = (np.arange(n_months) + self.lime_month - 1) % 12 + 1
+        max_dev_all = 0
+        fallback_months = []
+
+        # Each month is solved separately, with the solver restarted at the
+        # start of each month where the flow changes. This is cheaper than a
+        # single solve across the whole period, because the solver needs many
+        # more steps to get past the discontinuities in flow. The last point of
+        # each month is the first point of the next one, so output for month m
+        # is written to t_out[m * n_steps : (m + 1) * n_steps + 1], overwriting
+        # the shared point
+        n_steps = int(1 + 1 / dt) - 1
+        t_out = np.empty(n_months * n_steps + 1)
+        ca_out = np.empty(n_months * n_steps + 1)
 
         # Loop over months
-        C_bott = self.C_bott0
-        C_lake = self.C_lake0 + self.C_inst0
-        ys = []
-        tis = []
-        for month in months:
+        q_dict = self.lake.monthly_flows
+        month = 0
+        while month < n_months:
+            ti = np.linspace(month, month + 1, num=n_steps + 1)
+            if solver == "fast":
+                # Solve up to a year at once, accepting months up to the first
+                # one where the semi-analytic solution is not valid
+                chunk = np.arange(month, min(month + 12, n_months))
+                q_months = [q_dict[month_ids[idx]] for idx in chunk]
+                C_lakes, C_botts, max_dev, valid = solve_months(
+                    chunk,
+                    n_steps,
+                    q_months,
+                    self.lake.volume,
+                    self.C_in0,
+                    self.rate_const,
+                    self.activity_const,
+                    self.ca_aq_sat,
+                    C_lake,
+                    C_bott,
+                )
+                n_valid = len(valid) if valid.all() else int(np.argmin(valid[:, 0]))
+                for idx in range(month, month + n_valid):
+                    seg = slice(idx * n_steps, (idx + 1) * n_steps + 1)
+                    t_out[seg] = np.linspace(idx, idx + 1, num=n_steps + 1)
+                    ca_out[seg] = C_lakes[idx - month, :, 0]
+                if n_valid > 0:
+                    max_dev_all = max(max_dev_all, max_dev[:n_valid, 0].max())
+                    C_lake = C_lakes[n_valid - 1, -1, 0]
+                    C_bott = C_botts[n_valid - 1, -1, 0]
+                    month += n_valid
+                    continue
+                fallback_months.append(month)
+
             # Get flow this month
             month_id = month_ids[month]
-            q_month = self.lake.monthly_flows[month_id]
+            q_month = q_dict[month_id]
 
             # Solve ODEs
             y0 = [C_lake, C_bott]
@@ -679,46 +1125,47 @@ class Model:
                 self.activity_const,
                 self.ca_aq_sat,
             ]
-            ti = np.linspace(month, month + 1, num=int(1 + 1 / dt))
             y = odeint(dCdt, y0, ti, args=(params,))
-            ys.append(y)
-            tis.append(ti)
+            seg = slice(month * n_steps, (month + 1) * n_steps + 1)
+            t_out[seg] = ti
+            ca_out[seg] = y[:, 0]
 
             # Update initial conditions for next step
             C_lake, C_bott = y[-1]
+            month += 1
 
-        # Build df from output
-        df = pd.DataFrame(
-            data=np.concatenate(ys),
-            columns=["Ca (mg/l)", "Ca bottom (mg/l)"],
-            index=np.concatenate(tis),
-        )
-        del df["Ca bottom (mg/l)"]
+        return t_out, ca_out, max_dev_all, fallback_months
+
+    def _set_results(self, t, ca):
+        """Store simulated Ca-equivalents and pH on the model.
 
-        # At each time step, the solver runs from month to (month + 1) inclusive.
-        # The first and last time points in successive segments are therefore
-        # duplicated. Remove these. Also shift month index by 'lime_month' so
-        # results start at correct month.
-        df = df[~df.index.duplicated(keep="last")]
-        df.index = df.index + self.lime_month - 1
+        Args
+            t:  Array. Time in decimal months since liming, starting at 0
+            ca: Array. Modelled lake Ca concentration (mg/l of Ca-equivalents)
+                at times 't'
 
-        self.model_time_months = df.index.values
-        self.model_ca_mgpl = df["Ca (mg/l)"].values
+        Returns
+            ModelResult. Also stored as 'result'. The arrays are shared with
+            'model_time_months', 'model_ca_mgpl' and 'model_lake_ph'.
+        """
+        # Shift month index by 'lime_month' so results start at correct month
+        self.model_time_months = t + self.lime_month - 1
+        self.model_ca_mgpl = np.ascontiguousarray(ca, dtype=float)
 
         # Convert delta Ca to pH
-        ph_mod = self._pH_from_delta_Ca()
-        df["pH"] = ph_mod
-        self.model_lake_ph = ph_mod
-
-        # Convert decimal months to dates for convenience. Use 2000 as an
-        # arbitrary start year i.e only month and day have any meaning
-        df["date"] = datetime(2000, 1, 1) + pd.to_timedelta(
-            df.index * 365 / 12, unit="D"
+        with span("Model.results.pH"):
+            self.model_lake_ph = self._pH_from_delta_Ca()
+
+        self.result = ModelResult(
+            self.model_time_months, self.model_ca_mgpl, self.model_lake_ph
         )
-        df = df[["date", "Ca (mg/l)", "pH"]]
-        self.result_df = df
 
-        return df
+        return self.result
+
+    @property
+    def result_df(self):
+        """Dataframe of the latest results. See 'ModelResult.to_frame'."""
+        return self.result.to_frame()
 
     def plot_result(self, lib):
         """Plot results.
@@ -731,9 +1178,7 @@ class Model:
             is running.
         """
         # Make sure results are up-to-date
-        df = self.run().copy()
-        df.set_index("date", inplace=True)
-        df = df.resample("D").mean()
+        df = self.run().daily().set_index("date")
 
         if lib == "Matplotlib":
             # Matplotlib charts
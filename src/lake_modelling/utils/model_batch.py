@@ -0,0 +1,153 @@
+import numpy as np
+from scipy.integrate import odeint
+
+from src.lake_modelling.utils.lake_model import Model, batch_dCdt
+from src.lake_modelling.utils.result_cache import model_key
+from src.lake_modelling.utils.timing import span
+
+
+class ModelBatch:
+    def __init__(self, models):
+        """Simulate several lake/product/liming scenarios together. The ODE
+        systems for all scenarios are stacked into a single system with 2N
+        states and solved in one 'odeint' call per month, which is much faster
+        than calling 'Model.run' for each scenario in turn.
+
+        Scenarios may have different lakes, products, liming parameters,
+        'lime_month' and 'n_months'.
+
+        Args
+            models: List of Model objects. Each defines one scenario.
+        """
+        self.models = list(models)
+        self._validate_input()
+
+    def _validate_input(self):
+        """Check user-supplied values are reasonable."""
+        assert len(self.models) > 0, "'models' must contain at least one Model."
+        for model in self.models:
+            assert isinstance(model, Model), "'models' must only contain Model objects."
+
+    def _monthly_flows(self, n_months):
+        """Array of shape (n_months, N). Flow (litres/month) in each month since
+        liming for each scenario.
+        """
+        q = np.empty((n_months, len(self.models)))
+        for idx, model in enumerate(self.models):
+            q_dict = model.lake.monthly_flows
+            month_ids = (np.arange(n_months) + model.lime_month - 1) % 12 + 1
+            q[:, idx] = [q_dict[month_id] for month_id in month_ids]
+
+        return q
+
+    def _param_arrays(self):
+        """Dict of per-scenario parameter arrays used by 'batch_dCdt' and the
+        initial state.
+        """
+        models = self.models
+        C_inst0, C_bott0 = np.array(
+            [m._partition_lime_equivalents() for m in models], dtype=float
+        ).T
+        spr_prop = np.array([m.spr_prop for m in models], dtype=float)
+        params = {
+            "V": np.array([m.lake.volume for m in models], dtype=float),
+            "C_in": np.array([m.C_in0 for m in models], dtype=float),
+            "rate_const": np.array([m.rate_const for m in models], dtype=float),
+            "activity_const": np.array(
+                [m.activity_const for m in models], dtype=float
+            ),
+            "ca_aq_sat": np.array([m.ca_aq_sat for m in models], dtype=float),
+            "C_lake": np.array([m.C_lake0 for m in models]) + spr_prop * C_inst0,
+            "C_bott": spr_prop * C_bott0,
+        }
+
+        return params
+
+    def _solve(self, dt):
+        """Solve the stacked ODE system for all scenarios.
+
+        Returns
+            Tuple (t, ca). 't' is an array of time in decimal months since liming,
+            covering the longest scenario; 'ca' is an array of shape (N, len(t))
+            of lake Ca concentrations (mg/l of Ca-equivalents).
+        """
+        n_months = max(m.n_months for m in self.models)
+        with span("ModelBatch.partition"):
+            q = self._monthly_flows(n_months)
+            p = self._param_arrays()
+
+        y = np.column_stack((p["C_lake"], p["C_bott"])).ravel()
+        ys = [y[np.newaxis, :]]
+        tis = [np.zeros(1)]
+        for month in range(n_months):
+            ti = np.linspace(month, month + 1, num=int(1 + 1 / dt))
+            args = (
+                q[month],
+                p["V"],
+                p["C_in"],
+                p["rate_const"],
+                p["activity_const"],
+                p["ca_aq_sat"],
+            )
+            # Each lake is only coupled to its own lake-bottom store, so the
+            # Jacobian is banded
+            with span("ModelBatch.odeint"):
+                y_month = odeint(batch_dCdt, y, ti, args=args, ml=1, mu=1)
+
+            # The first point of each segment duplicates the last point of the
+            # previous one
+            ys.append(y_month[1:])
+            tis.append(ti[1:])
+            y = y_month[-1]
+
+        t = np.concatenate(tis)
+        ca = np.ascontiguousarray(np.concatenate(ys)[:, 0::2].T)
+
+        return t, ca
+
+    def run(self, dt=0.01, cache=None):
+        """Simulate change in concentration of Ca-equivalents and pH over time
+        for all scenarios. Results are also stored on each Model, exactly as if
+        'Model.run' had been called.
+
+        Args
+            dt:    Float between 0 and 1 (months). Time resolution of the output.
+                   See 'Model.run' for details.
+            cache: Obj. Optional ResultCache. Scenarios found in the cache are
+                   not re-solved; the others are solved together and added to
+                   the cache. Default None
+
+        Returns
+            List of ModelResult objects, one per scenario.
+        """
+        assert 0 < dt < 1, "'dt' must be between 0 and 1."
+        results = [None] * len(self.models)
+        if cache is not None:
+            with span("ModelBatch.cache"):
+                keys = [model_key(model, dt, "batch") for model in self.models]
+                results = [cache.get(key) for key in keys]
+
+        todo = [idx for idx, res in enumerate(results) if res is None]
+        if todo:
+            if len(todo) < len(self.models):
+                batch = ModelBatch([self.models[idx] for idx in todo])
+            else:
+                batch = self
+            t, ca = batch._solve(dt)
+            n_steps = int(1 + 1 / dt) - 1
+            for col, idx in enumerate(todo):
+                n_t = self.models[idx].n_months * n_steps + 1
+                results[idx] = (t[:n_t], ca[col, :n_t])
+                if cache is not None:
+                    with span("ModelBatch.cache"):
+                        cache.put(keys[idx], *results[idx])
+
+        model_results = []
+        for model, (t, ca, *_) in zip(self.models, results):
+            model.dt = dt
+            model.month_ids = (list(range(1, 13)) * model.n_months)[
+                model.lime_month - 1 : model.lime_month + model.n_months
+            ]
+            model_results.append(model._set_results(t, ca))
+
+        return model_results
@@ -0,0 +1,409 @@
+"""Reference datasets used by the models, loaded once per process.
+
+The workbooks are slow to parse, so a compact binary snapshot of all datasets
+can be built ahead of time (e.g. when building the container image):
+
+    python -m src.lake_modelling.utils.reference_data
+
+The snapshot records the SHA-256 digest of each source file and is only used
+for datasets whose source file is unchanged. Otherwise the source file is
+parsed as before.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import warnings
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from src.lake_modelling.utils.timing import span
+
+LIME_PRODUCTS_DATA = "data/lime_products.xlsx"
+FLOW_TYPES_DATA = "data/flow_typologies.xlsx"
+TITRATION_CURVE_DATA = "data/titration_curves_interpolated.xlsx"
+COMPARISON_FACTORS_DATA = "data/omregningsfaktorer.csv"
+SNAPSHOT_DATA = "data/reference_data.npz"
+
+# Increment when the layout of the snapshot arrays changes
+SNAPSHOT_FORMAT = 1
+
+# Order of months in the flow typology arrays
+MONTHS = np.arange(1, 13)
+
+# Column test breakpoints used in the lime product database
+ID_PHS = (40, 45, 50, 55, 60)
+OD_DOSES = (10, 20, 35, 50, 85)
+
+
+def _abs_path(rel_path):
+    """Resolve a path relative to the repository root."""
+    return os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), f"../../../{rel_path}"
+    )
+
+
+def _file_signature(path):
+    """Cheap signature used to detect whether a file has changed on disk."""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_digest(path):
+    """SHA-256 hex digest of a file's contents."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class LimeProductTable:
+    def __init__(self, df):
+        """Lime product database held as NumPy arrays.
+
+        Args
+            df: Dataframe. 'lime_products.xlsx' read with 'index_col=0'. Must have
+                a 'Description' column followed by one column per product.
+        """
+        self.descriptions = df["Description"].to_dict()
+        df = df.drop(columns="Description")
+        self.names = list(df.columns)
+        self.properties = list(df.index)
+        self.values = df.values.astype(float)
+        self._col_idx = {name: idx for idx, name in enumerate(self.names)}
+        self._row_idx = {prop: idx for idx, prop in enumerate(self.properties)}
+
+    def __contains__(self, name):
+        return name in self._col_idx
+
+    def value(self, prop, name):
+        """Float. Value of property 'prop' for product 'name'."""
+        return float(self.values[self._row_idx[prop], self._col_idx[name]])
+
+    def to_dict(self):
+        """Nested dict {product: {property: value}}, excluding descriptions."""
+        return {
+            name: {
+                prop: float(self.values[row, col])
+                for row, prop in enumerate(self.properties)
+            }
+            for col, name in enumerate(self.names)
+        }
+
+
+def _read_lime_products(path):
+    return LimeProductTable(pd.read_excel(path, index_col=0))
+
+
+def _read_flow_typologies(path):
+    """Returns dict {flow_prof: array of 12 relative monthly flows}."""
+    df = pd.read_excel(path, index_col=0).reindex(MONTHS)
+    return {col: df[col].values.astype(float) for col in df.columns}
+
+
+def _read_titration_curves(path):
+    """Returns dict {toc_class: (caco3, ph)} with both arrays sorted by CaCO3."""
+    df = pd.read_excel(path)
+    curves = {}
+    for toc_class, grp in df.groupby("TOC class (mg/l)", sort=False):
+        grp = grp.sort_values("CaCO3 (mg/l)")
+        curves[toc_class] = (
+            grp["CaCO3 (mg/l)"].values.astype(float),
+            grp["pH"].values.astype(float),
+        )
+    return curves
+
+
+def _read_comparison_factors(path):
+    return pd.read_csv(path)
+
+
+# Conversion of each dataset to and from a dict of NumPy arrays for the
+# snapshot. Strings are stored as fixed-width unicode, so no pickling is needed
+def _encode_lime_products(table):
+    return {
+        "names": np.array(table.names, dtype=str),
+        "properties": np.array(table.properties, dtype=str),
+        "descriptions": np.array(
+            [str(table.descriptions[prop]) for prop in table.properties], dtype=str
+        ),
+        "values": table.values,
+    }
+
+
+def _decode_lime_products(arrays):
+    df = pd.DataFrame(
+        arrays["values"],
+        index=arrays["properties"].tolist(),
+        columns=arrays["names"].tolist(),
+    )
+    df.insert(0, "Description", arrays["descriptions"].tolist())
+    return LimeProductTable(df)
+
+
+def _encode_flow_typologies(flows):
+    return {
+        "profiles": np.array(list(flows), dtype=str),
+        "flows": np.stack(list(flows.values())),
+    }
+
+
+def _decode_flow_typologies(arrays):
+    return dict(zip(arrays["profiles"].tolist(), arrays["flows"]))
+
+
+def _encode_titration_curves(curves):
+    lengths = [len(caco3) for caco3, ph in curves.values()]
+    return {
+        "classes": np.array(list(curves)),
+        "offsets": np.cumsum([0] + lengths),
+        "caco3": np.concatenate([caco3 for caco3, ph in curves.values()]),
+        "ph": np.concatenate([ph for caco3, ph in curves.values()]),
+    }
+
+
+def _decode_titration_curves(arrays):
+    offsets = arrays["offsets"]
+    return {
+        toc_class: (
+            arrays["caco3"][offsets[idx] : offsets[idx + 1]],
+            arrays["ph"][offsets[idx] : offsets[idx + 1]],
+        )
+        for idx, toc_class in enumerate(arrays["classes"].tolist())
+    }
+
+
+def _encode_comparison_factors(df):
+    arrays = {"columns": np.array(df.columns, dtype=str)}
+    for idx, col in enumerate(df.columns):
+        values = df[col].values
+        arrays[f"col{idx}"] = values.astype(str) if values.dtype == object else values
+    return arrays
+
+
+def _decode_comparison_factors(arrays):
+    return pd.DataFrame(
+        {col: arrays[f"col{idx}"] for idx, col in enumerate(arrays["columns"].tolist())}
+    )
+
+
+def _arrays_checksum(arrays):
+    """SHA-256 hex digest of a dict of arrays, including keys, dtypes and shapes."""
+    digest = hashlib.sha256()
+    for key in sorted(arrays):
+        arr = np.ascontiguousarray(arrays[key])
+        digest.update(f"{key}:{arr.dtype.str}:{arr.shape};".encode("utf-8"))
+        digest.update(arr.tobytes())
+    return digest.hexdigest()
+
+
+class ReferenceData:
+    # name: (path relative to repo root, parser)
+    SOURCES = {
+        "lime_products": (LIME_PRODUCTS_DATA, _read_lime_products),
+        "flow_typologies": (FLOW_TYPES_DATA, _read_flow_typologies),
+        "titration_curves": (TITRATION_CURVE_DATA, _read_titration_curves),
+        "comparison_factors": (COMPARISON_FACTORS_DATA, _read_comparison_factors),
+    }
+
+    # name: (encoder, decoder) for the snapshot
+    CODECS = {
+        "lime_products": (_encode_lime_products, _decode_lime_products),
+        "flow_typologies": (_encode_flow_typologies, _decode_flow_typologies),
+        "titration_curves": (_encode_titration_curves, _decode_titration_curves),
+        "comparison_factors": (_encode_comparison_factors, _decode_comparison_factors),
+    }
+
+    def __init__(self):
+        """Process-wide store for the reference workbooks. Each workbook is parsed
+        once on first use and then served from memory. Safe to share between
+        threads (e.g. Streamlit sessions).
+
+        Cached data is only re-read after an explicit call to 'invalidate' or
+        'refresh'. Datasets are read from the snapshot at 'SNAPSHOT_DATA' if it
+        was built from the current source file (see 'build_snapshot').
+        """
+        self._lock = threading.RLock()
+        self._entries = {}
+
+    def _load(self, name):
+        rel_path, parser = self.SOURCES[name]
+        path = _abs_path(rel_path)
+        with span(f"reference_data.load[{name}]"):
+            signature = _file_signature(path)
+            version = _file_digest(path)
+            data = read_snapshot(name, version)
+            if data is None:
+                data = parser(path)
+
+        return {"data": data, "signature": signature, "version": version}
+
+    def _entry(self, name):
+        assert name in self.SOURCES, f"'name' must be one of {tuple(self.SOURCES)}."
+        entry = self._entries.get(name)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is None:
+                    entry = self._load(name)
+                    self._entries[name] = entry
+
+        return entry
+
+    def get(self, name):
+        """Parsed data for reference dataset 'name' (one of 'SOURCES')."""
+        return self._entry(name)["data"]
+
+    def version(self, name):
+        """SHA-256 digest of the file the cached data for 'name' was parsed from."""
+        return self._entry(name)["version"]
+
+    def invalidate(self, name=None):
+        """Drop cached data for 'name', or for all datasets if 'name' is None.
+        The next access re-reads the file(s) from disk.
+        """
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def refresh(self):
+        """Invalidate any cached datasets whose files have changed on disk since
+        they were loaded.
+
+        Returns
+            List of dataset names that were invalidated.
+        """
+        stale = []
+        with self._lock:
+            for name, entry in list(self._entries.items()):
+                path = _abs_path(self.SOURCES[name][0])
+                if _file_signature(path) != entry["signature"]:
+                    del self._entries[name]
+                    stale.append(name)
+
+        return stale
+
+
+REFERENCE_DATA = ReferenceData()
+
+
+def lime_product_table():
+    """LimeProductTable for 'lime_products.xlsx'."""
+    return REFERENCE_DATA.get("lime_products")
+
+
+def flow_typologies():
+    """Dict {flow_prof: array of 12 relative monthly flows (Jan to Dec)}."""
+    return REFERENCE_DATA.get("flow_typologies")
+
+
+def titration_curves():
+    """Dict {toc_class: (caco3, ph)} from 'titration_curves_interpolated.xlsx'."""
+    return REFERENCE_DATA.get("titration_curves")
+
+
+def comparison_factors():
+    """Dataframe of omregningsfaktorer from 'omregningsfaktorer.csv'."""
+    return REFERENCE_DATA.get("comparison_factors")
+
+
+def build_snapshot(path=None):
+    """Parse all reference datasets from their source files and save them to a
+    binary snapshot. The snapshot is written to a temporary file first and
+    then moved into place, so readers never see a partly written file.
+
+    Args
+        path: Str or None. Output path. Default None uses 'SNAPSHOT_DATA'
+
+    Returns
+        Dict. The snapshot manifest, with the format version and, for each
+        dataset, the digest of its source file and a checksum of its arrays.
+    """
+    path = _abs_path(SNAPSHOT_DATA) if path is None else path
+    manifest = {"format": SNAPSHOT_FORMAT, "datasets": {}}
+    arrays = {}
+    for name, (rel_path, parser) in ReferenceData.SOURCES.items():
+        source_path = _abs_path(rel_path)
+        encoded = ReferenceData.CODECS[name][0](parser(source_path))
+        manifest["datasets"][name] = {
+            "source_digest": _file_digest(source_path),
+            "checksum": _arrays_checksum(encoded),
+        }
+        arrays.update({f"{name}/{key}": arr for key, arr in encoded.items()})
+
+    # Uncompressed, so members are read without decompression
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, manifest=np.array(json.dumps(manifest)), **arrays)
+    os.replace(tmp_path, path)
+
+    return manifest
+
+
+def read_snapshot(name, source_digest, path=None):
+    """Read dataset 'name' from a snapshot written by 'build_snapshot'.
+
+    Args
+        name:          Str. Dataset name (one of 'ReferenceData.SOURCES')
+        source_digest: Str. SHA-256 digest of the current source file
+        path:          Str or None. Snapshot path. Default None uses
+                       'SNAPSHOT_DATA'
+
+    Returns
+        Parsed data as returned by the source file parser, or None if there is
+        no snapshot, or it is stale (built from a different source file or
+        snapshot format) or corrupt.
+    """
+    path = _abs_path(SNAPSHOT_DATA) if path is None else path
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            manifest = json.loads(str(npz["manifest"]))
+            entry = manifest["datasets"].get(name)
+            if (
+                manifest["format"] != SNAPSHOT_FORMAT
+                or entry is None
+                or entry["source_digest"] != source_digest
+            ):
+                return None
+            prefix = f"{name}/"
+            arrays = {
+                key[len(prefix) :]: npz[key]
+                for key in npz.files
+                if key.startswith(prefix)
+            }
+        corrupt = _arrays_checksum(arrays) != entry["checksum"]
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        # Truncated or not an npz archive, or a damaged manifest
+        corrupt = True
+
+    if corrupt:
+        warnings.warn(f"Reference data snapshot '{path}' is corrupt. Ignoring it.")
+        return None
+
+    return ReferenceData.CODECS[name][1](arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the binary snapshot of the reference datasets."
+    )
+    parser.add_argument(
+        "--path", default=None, help=f"Output path. Default '{SNAPSHOT_DATA}'."
+    )
+    args = parser.parse_args()
+
+    manifest = build_snapshot(args.path)
+    for name, entry in manifest["datasets"].items():
+        print(
+            f"{name}: source {entry['source_digest'][:12]}, "
+            f"checksum {entry['checksum'][:12]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Run the lake model for every lake in a regional dataset and every lime
+product.
+
+Usage (from the repository root):
+
+    python -m src.lake_modelling.utils.regional_run --output ./agder_results.csv
+        [--lakes ./data/agder_lake_props.csv] [--mode run|dose] [--workers N]
+
+Lakes are read in chunks from a CSV file or the 'lake_props' sheet of an Excel
+file (e.g. 'agder_liming_data_tidy.xlsx'). Each chunk is modelled on a process
+pool and its results are appended to the output CSV as soon as they are ready,
+with at most a few chunks in flight, so memory use does not grow with the number
+of lakes.
+"""
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+from src.lake_modelling.utils.reference_data import lime_product_table
+
+AGDER_LAKES = r"./data/agder_lake_props.csv"
+
+# Columns used to build 'Lake' objects
+LAKE_COLS = ("lake", "lake_area_m2", "mean_depth_m", "tau_years")
+
+# Lake and liming assumptions used for all lakes. As in
+# 'notebooks/04b_agder_liming_data.ipynb'
+LAKE_PARAMS = {
+    "flow_prof": "fjell",
+    "pH_lake0": 4.5,
+    "pH_inflow": 4.5,
+    "toc_lake0": 4,
+}
+MODEL_PARAMS = {
+    "lime_dose": 10,
+    "lime_month": 7,
+    "spr_meth": "wet",
+    "spr_prop": 0.5,
+    "F_sol": 1,
+    "rate_const": 0.1,
+    "activity_const": 0.1,
+    "ca_aq_sat": 8.5,
+    "n_months": 12,
+}
+TARGET_PARAMS = {"target_ph": 6, "criterion": "final"}
+
+# Number of lakes per task
+CHUNK_SIZE = 20
+
+# Output time resolution (months) used to find the minimum pH in 'run' mode
+RUN_DT = 0.1
+
+
+def iter_lakes(path, chunk_size=CHUNK_SIZE):
+    """Read lake properties in chunks. Rows missing any of 'LAKE_COLS', or with
+    a non-positive area, depth or residence time, are skipped.
+
+    Args
+        path:       Str. CSV file, or Excel file with a 'lake_props' sheet. Must
+                    have the columns in 'LAKE_COLS'
+        chunk_size: Int. Number of rows per chunk
+
+    Returns
+        Generator of dataframes with the columns in 'LAKE_COLS'.
+    """
+    if path.lower().endswith(".csv"):
+        chunks = pd.read_csv(path, usecols=LAKE_COLS, chunksize=chunk_size)
+    else:
+        chunks = _iter_excel(path, "lake_props", chunk_size)
+
+    for df in chunks:
+        df = df[list(LAKE_COLS)].dropna()
+        df = df[(df[list(LAKE_COLS[1:])] > 0).all(axis=1)]
+        if len(df) > 0:
+            yield df
+
+
+def _iter_excel(path, sheet_name, chunk_size):
+    """Read a worksheet in chunks without loading the whole workbook."""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        columns = next(rows)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        wb.close()
+
+
+def model_lake(name, area_m2, depth, tau, product, mode):
+    """Run the model for one lake and product.
+
+    Args
+        name:    Str. Lake name
+        area_m2: Float. Lake surface area (m2)
+        depth:   Float. Lake mean depth (m)
+        tau:     Float. Lake water residence time (years)
+        product: Obj. Instance of LimeProduct
+        mode:    Str. Either 'run' or 'dose'. See 'run_regional'
+
+    Returns
+        Dict. One row of output.
+    """
+    lake = Lake(area=area_m2 / 1e6, depth=depth, tau=tau, **LAKE_PARAMS)
+    model = Model(lake, product, **MODEL_PARAMS)
+    row = {
+        "lake": name,
+        "product": product._name,
+        "area_km2": lake.area,
+        "mean_depth_m": depth,
+        "tau_years": tau,
+    }
+    if mode == "run":
+        ph = model.run(dt=RUN_DT, solver="fast").ph
+        row.update({"final_ph": ph[-1], "min_ph": ph.min()})
+    else:
+        row["dose_mgpl"] = model.find_dose(**TARGET_PARAMS)
+
+    return row
+
+
+def _model_chunk(df, products, mode):
+    products = [LimeProduct(name) for name in products]
+    rows = []
+    for lake in df.itertuples(index=False):
+        for product in products:
+            rows.append(
+                model_lake(
+                    lake.lake,
+                    lake.lake_area_m2,
+                    lake.mean_depth_m,
+                    lake.tau_years,
+                    product,
+                    mode,
+                )
+            )
+
+    return pd.DataFrame(rows)
+
+
+def run_regional(
+    output_path,
+    lakes_path=AGDER_LAKES,
+    products=None,
+    mode="run",
+    workers=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """Model every lake in 'lakes_path' with every product and append the
+    results to 'output_path'. An existing file at 'output_path' is replaced.
+
+    Args
+        output_path: Str. Output CSV path
+        lakes_path:  Str. See 'iter_lakes'
+        products:    List of str. Product names. Default None uses all products in
+                     the database
+        mode:        Str. Either 'run' or 'dose'. 'run' simulates 'MODEL_PARAMS'
+                     and reports final and minimum pH; 'dose' reports the dose
+                     needed to meet 'TARGET_PARAMS' (see 'Model.find_dose')
+        workers:     Int. Number of worker processes. Default None uses the
+                     number of CPUs
+        chunk_size:  Int. Number of lakes per task
+
+    Returns
+        Int. Number of rows written.
+    """
+    assert mode in ("run", "dose"), "'mode' must be either 'run' or 'dose'."
+    if products is None:
+        products = lime_product_table().names
+    if os.path.isfile(output_path):
+        os.remove(output_path)
+
+    if workers is None:
+        workers = os.cpu_count()
+
+    n_rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded number of chunks in flight and write results in order
+        max_pending = 2 * workers
+        pending = deque()
+        chunks = iter_lakes(lakes_path, chunk_size)
+        while True:
+            for df in chunks:
+                pending.append(pool.submit(_model_chunk, df, products, mode))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            df = pending.popleft().result()
+            df.to_csv(output_path, mode="a", header=n_rows == 0, index=False)
+            n_rows += len(df)
+
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the lake model for all lakes in a regional dataset."
+    )
+    parser.add_argument("--output", required=True, help="Output CSV path.")
+    parser.add_argument("--lakes", default=AGDER_LAKES, help="Lake properties file.")
+    parser.add_argument("--mode", choices=("run", "dose"), default="run")
+    parser.add_argument(
+        "--products", nargs="+", default=None, help="Product names. Default all."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes."
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE, help="Number of lakes per task."
+    )
+    args = parser.parse_args()
+
+    n_rows = run_regional(
+        args.output,
+        args.lakes,
+        args.products,
+        args.mode,
+        args.workers,
+        args.chunk_size,
+    )
+    print(f"Saved {n_rows} rows to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from src.lake_modelling.utils.reference_data import REFERENCE_DATA, _abs_path
+
+# Default cache location. Can be overridden with the 'LAKE_MODEL_CACHE'
+# environment variable, e.g. to put the cache on a persistent volume
+RESULT_CACHE_DB = os.environ.get(
+    "LAKE_MODEL_CACHE", _abs_path("cache/model_results.sqlite")
+)
+
+# Default maximum total size of cached results (bytes)
+RESULT_CACHE_MAX_BYTES = 256 * 1024**2
+
+# Increment if the stored format or the model equations change, so that old
+# entries are never returned
+RESULT_CACHE_SCHEMA = 1
+
+_LAKE_ATTRS = ("area", "depth", "tau", "flow_prof", "pH_lake0", "pH_inflow", "toc_lake0")
+_PRODUCT_ATTRS = ("ca_pct", "mg_pct", "dry_fac", "col_depth", "id_list", "od_list")
+_MODEL_ATTRS = (
+    "lime_dose",
+    "lime_month",
+    "spr_meth",
+    "spr_prop",
+    "F_sol",
+    "rate_const",
+    "activity_const",
+    "ca_aq_sat",
+    "n_months",
+)
+
+
+def _canonical(value):
+    """Convert NumPy scalars/arrays to plain Python types for JSON encoding."""
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(val) for val in value]
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    return value
+
+
+def model_key(model, dt, solver):
+    """Canonical hash of everything that determines the output of a model run.
+    Lime products are identified by their properties, not their names.
+
+    Args
+        model:  Obj. Model instance
+        dt:     Float. Output time resolution (months)
+        solver: Str. Name of the solver used (e.g. 'odeint', 'fast' or 'batch')
+
+    Returns
+        Str. Hex SHA-256 digest.
+    """
+    inputs = {
+        "schema": RESULT_CACHE_SCHEMA,
+        "lake": {attr: getattr(model.lake, attr) for attr in _LAKE_ATTRS},
+        "product": {attr: getattr(model.lime_product, attr) for attr in _PRODUCT_ATTRS},
+        "model": {attr: getattr(model, attr) for attr in _MODEL_ATTRS},
+        "dt": dt,
+        "solver": solver,
+        "reference_data": {
+            name: REFERENCE_DATA.version(name)
+            for name in ("flow_typologies", "titration_curves")
+        },
+    }
+    blob = json.dumps(inputs, sort_keys=True, default=_canonical)
+
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path=RESULT_CACHE_DB, max_bytes=RESULT_CACHE_MAX_BYTES):
+        """On-disk cache of model results (time and Ca-equivalent arrays), keyed
+        by 'model_key'. Stored in SQLite in WAL mode, so it can be shared safely
+        by several threads and processes. When the total size of the stored
+        results exceeds 'max_bytes', the least recently used entries are
+        deleted.
+
+        Reads do not write to the database. Hits, misses and the time each
+        entry was last used are kept in memory and written with the next 'put',
+        before entries are evicted.
+
+        Args
+            path:      Str. Path to the SQLite database. Created if it does not
+                       exist
+            max_bytes: Int. Maximum total size of stored results (bytes)
+        """
+        assert max_bytes > 0, "'max_bytes' must be greater than 0."
+        self.path = path
+        self.max_bytes = max_bytes
+        self._init_pending()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        con = self._connect()
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    t BLOB NOT NULL,
+                    ca BLOB NOT NULL,
+                    info TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            con.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+            con.executemany(
+                "INSERT OR IGNORE INTO stats VALUES (?, 0)",
+                [("hits",), ("misses",), ("evictions",)],
+            )
+        finally:
+            con.close()
+
+    def _init_pending(self):
+        self._lock = threading.Lock()
+        self._pending = {"hits": 0, "misses": 0}
+        self._last_used = {}
+
+    def __getstate__(self):
+        # Pending reads stay with the process that made them
+        return {"path": self.path, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_pending()
+
+    def _connect(self):
+        # A new connection for each operation keeps the object safe to share
+        # between threads and to pass to worker processes
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _count(self, con, name, n=1):
+        con.execute("UPDATE stats SET value = value + ? WHERE name = ?", (n, name))
+
+    def _flush(self, con):
+        """Write the hits, misses and last-used times recorded by 'get'. Must be
+        called inside a write transaction on 'con'.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+            last_used, self._last_used = self._last_used, {}
+        for name, n in pending.items():
+            self._count(con, name, n)
+        con.executemany(
+            "UPDATE results SET last_used = MAX(last_used, ?) WHERE key = ?",
+            [(used, key) for key, used in last_used.items()],
+        )
+
+    def get(self, key):
+        """Cached result for 'key'.
+
+        Args
+            key: Str. As returned by 'model_key'
+
+        Returns
+            Tuple of (t, ca, info) or None if 'key' is not in the cache. 't' and
+            'ca' are arrays; 'info' is the dict stored by 'put'.
+        """
+        con = self._connect()
+        try:
+            row = con.execute(
+                "SELECT t, ca, info FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            con.close()
+
+        with self._lock:
+            if row is None:
+                self._pending["misses"] += 1
+            else:
+                self._pending["hits"] += 1
+                self._last_used[key] = time.time()
+
+        if row is None:
+            return None
+        t, ca, info = row
+
+        return np.frombuffer(t), np.frombuffer(ca), json.loads(info)
+
+    def put(self, key, t, ca, info=None):
+        """Store a result, then evict the least recently used entries if the
+        cache is larger than 'max_bytes'.
+
+        Args
+            key:  Str. As returned by 'model_key'
+            t:    Array. Time in decimal months since liming
+            ca:   Array. Lake Ca concentration (mg/l of Ca-equivalents)
+            info: Dict. JSON-serialisable solver diagnostics. Default None
+        """
+        t = np.ascontiguousarray(t, dtype=float)
+        ca = np.ascontiguousarray(ca, dtype=float)
+        size = t.nbytes + ca.nbytes
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            self._flush(con)
+            con.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    t.tobytes(),
+                    ca.tobytes(),
+                    json.dumps(info or {}, default=_canonical),
+                    size,
+                    time.time(),
+                ),
+            )
+            total = con.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                evicted = 0
+                rows = con.execute(
+                    "SELECT key, size FROM results ORDER BY last_used"
+                ).fetchall()
+                for old_key, old_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    con.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                    total -= old_size
+                    evicted += 1
+                self._count(con, "evictions", evicted)
+            con.execute("COMMIT")
+        finally:
+            con.close()
+
+    def stats(self):
+        """Dict of cache statistics: cumulative 'hits', 'misses' and 'evictions'
+        (across all processes using the cache), the number of 'entries' and their
+        total size in 'bytes'. Reads by other processes are included once they
+        have called 'put'.
+        """
+        con = self._connect()
+        try:
+            stats = dict(con.execute("SELECT name, value FROM stats").fetchall())
+            stats["entries"], stats["bytes"] = con.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        finally:
+            con.close()
+        with self._lock:
+            for name, n in self._pending.items():
+                stats[name] += n
+
+        return stats
+
+    def clear(self):
+        """Delete all cached results and reset the statistics."""
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute("DELETE FROM results")
+            con.execute("UPDATE stats SET value = 0")
+            con.execute("COMMIT")
+        finally:
+            con.close()
+        with self._lock:
+            self._pending = {"hits": 0, "misses": 0}
+            self._last_used = {}
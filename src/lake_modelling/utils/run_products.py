@@ -1,21 +1,40 @@
 import altair as alt
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sn
 import streamlit as st
+from scipy import stats
+from src.lake_modelling.utils.downsample import (
+    MAX_CHART_POINTS,
+    downsample_series,
+    lttb,
+)
 from src.lake_modelling.utils.lake_model import LimeProduct, Model
-from src.lake_modelling.utils.user_inputs import get_model_params
+from src.lake_modelling.utils.model_batch import ModelBatch
+from src.lake_modelling.utils.timing import span
 
 plt.style.use("ggplot")
 
+# Number of parameter sets used for the uncertainty envelopes in the app
+ENSEMBLE_SIZE = 500
 
-def run_multiple_products(lake, products):
+# Spread of the uncertain parameters used for the uncertainty envelopes.
+# Log-normal shape parameters are applied around the values chosen in the app
+ENSEMBLE_LOG_SD = {"rate_const": 0.5, "activity_const": 0.5, "id_scale": 0.1, "od_scale": 0.1}
+ENSEMBLE_F_SOL_RANGE = (0.8, 1)
+ENSEMBLE_CA_AQ_SAT_RANGE = (7, 10)
+
+
+def run_multiple_products(lake, products, model_params, cache=None):
     """Run the same model (lake and model parameters), but for multiple lime products.
     Used to compare different products in a particular situation.
 
     Args
-        lake:     Obj. lm.Lake object to model
-        products: List. Product names to consider.
+        lake:         Obj. lm.Lake object to model
+        products:     List. Product names to consider
+        model_params: Tuple. As returned by 'user_inputs.get_model_params'
+        cache:        Obj. Optional ResultCache passed to 'ModelBatch.run'
 
     Returns
         Dataframe with columns 'date', 'product', 'Delta Ca (mg/l)' and 'pH'.
@@ -30,18 +49,71 @@ def run_multiple_products(lake, products):
         activity_const,
         ca_aq_sat,
         n_months,
-    ) = get_model_params()
+    ) = model_params
+
+    models = [
+        Model(
+            lake=lake,
+            lime_product=LimeProduct(prod_name),
+            lime_dose=lime_dose,
+            lime_month=lime_month,
+            spr_meth=spr_meth,
+            spr_prop=spr_prop,
+            F_sol=F_sol,
+            rate_const=rate_const,
+            activity_const=activity_const,
+            ca_aq_sat=ca_aq_sat,
+            n_months=n_months,
+        )
+        for prod_name in products
+    ]
+    with span("run_multiple_products.run"):
+        results = ModelBatch(models).run(cache=cache)
+    with span("run_multiple_products.resample"):
+        df_list = []
+        for prod_name, result in zip(products, results):
+            df = result.daily()
+            df["product"] = prod_name
+            df_list.append(df)
+        df = pd.concat(df_list, axis="rows")
+
+    return df
+
 
-    lime_tonnes = spr_prop * lime_dose * lake.volume / 1e9
-    st.markdown(f"**Amount of product added: {lime_tonnes:.2f} tonnes.**")
+def find_required_doses(lake, products, model_params, target_ph, at_month, criterion):
+    """Find the smallest dose of each lime product needed to reach a target pH,
+    using the liming procedure in 'model_params'. See 'Model.find_dose'.
 
-    df_list = []
+    Args
+        lake:         Obj. lm.Lake object to model
+        products:     List. Product names to consider
+        model_params: Tuple. As returned by 'user_inputs.get_model_params'. The
+                      lime dose is ignored
+        target_ph:    Float. Target lake pH
+        at_month:     Float. Months after liming at which the target must be met
+        criterion:    Str. Either 'final' or 'min'
+
+    Returns
+        Dataframe with columns 'product', 'Dose (mg/l)' and 'Mengde (tonn)'. Doses
+        are NaN for products that cannot reach the target with 85 mg/l.
+    """
+    (
+        lime_dose,
+        lime_month,
+        spr_meth,
+        spr_prop,
+        F_sol,
+        rate_const,
+        activity_const,
+        ca_aq_sat,
+        n_months,
+    ) = model_params
+
+    doses = []
     for prod_name in products:
-        prod = LimeProduct(prod_name)
         model = Model(
             lake=lake,
-            lime_product=prod,
-            lime_dose=lime_dose,
+            lime_product=LimeProduct(prod_name),
             lime_month=lime_month,
             spr_meth=spr_meth,
             spr_prop=spr_prop,
@@ -49,26 +121,122 @@ def run_multiple_products(lake, products):
             rate_const=rate_const,
             activity_const=activity_const,
             ca_aq_sat=ca_aq_sat,
-            n_months=n_months,
+            n_months=max(n_months, int(np.ceil(at_month)), 2),
         )
-        df = model.run()
-        df.set_index("date", inplace=True)
-        df = df.resample("D").mean().reset_index()
-        df["product"] = prod_name
-        df_list.append(df)
-    df = pd.concat(df_list, axis="rows")
+        with span("find_required_doses.find_dose"):
+            doses.append(
+                model.find_dose(target_ph, at_month=at_month, criterion=criterion)
+            )
+    df = pd.DataFrame({"product": products, "Dose (mg/l)": doses})
+    df["Mengde (tonn)"] = spr_prop * df["Dose (mg/l)"] * lake.volume / 1e9
 
     return df
 
 
-def plot_multiple_products(df, pH_lake0, pH_inflow, lib):
+def run_product_ensemble(lake, product, model_params, n=ENSEMBLE_SIZE, seed=42):
+    """Run an ensemble of models for one lime product with uncertain parameters.
+    See 'Model.run_ensemble'.
+
+    Args
+        lake:         Obj. lm.Lake object to model
+        product:      Str. Product name
+        model_params: Tuple. As returned by 'user_inputs.get_model_params'
+        n:            Int. Number of ensemble members
+        seed:         Int. Seed for the random number generator
+
+    Returns
+        Dataframe with columns 'date', 'Ca (mg/l) P<p>' and 'pH P<p>' for the
+        5th, 50th and 95th percentiles.
+    """
+    (
+        lime_dose,
+        lime_month,
+        spr_meth,
+        spr_prop,
+        F_sol,
+        rate_const,
+        activity_const,
+        ca_aq_sat,
+        n_months,
+    ) = model_params
+
+    model = Model(
+        lake=lake,
+        lime_product=LimeProduct(product),
+        lime_dose=lime_dose,
+        lime_month=lime_month,
+        spr_meth=spr_meth,
+        spr_prop=spr_prop,
+        F_sol=F_sol,
+        rate_const=rate_const,
+        activity_const=activity_const,
+        ca_aq_sat=ca_aq_sat,
+        n_months=n_months,
+    )
+    centres = {"rate_const": rate_const, "activity_const": activity_const}
+    distributions = {
+        name: stats.lognorm(s, scale=centres.get(name, 1))
+        for name, s in ENSEMBLE_LOG_SD.items()
+    }
+    f_lo, f_hi = ENSEMBLE_F_SOL_RANGE
+    distributions["F_sol"] = stats.uniform(f_lo, f_hi - f_lo)
+    sat_lo, sat_hi = ENSEMBLE_CA_AQ_SAT_RANGE
+    distributions["ca_aq_sat"] = stats.uniform(sat_lo, sat_hi - sat_lo)
+    with span("run_product_ensemble"):
+        result = model.run_ensemble(n, distributions, seed=seed)
+
+    return result.to_frame()
+
+
+def plot_product_ensemble(df, product, max_points=MAX_CHART_POINTS):
+    """Plot the 5-95 % envelope and median pH from 'run_product_ensemble'.
+
+    Args
+        df:         Dataframe. As returned by 'run_product_ensemble'
+        product:    Str. Product name, used as the title
+        max_points: Int. Maximum number of points sent to the browser
+
+    Returns
+        Chart object. The chart is also added to the Streamlit app if Streamlit
+        is running.
+    """
+    x = df["date"].to_numpy().astype("int64")
+    df = df.iloc[lttb(x, df["pH P50"].to_numpy(), max(max_points, 3))]
+    base = alt.Chart(df).encode(
+        x=alt.X("date", axis=alt.Axis(title="Måneder", grid=True))
+    )
+    band = base.mark_area(opacity=0.3).encode(
+        y=alt.Y("pH P5", axis=alt.Axis(title="Innsjø pH (-)"), scale=alt.Scale(zero=False)),
+        y2="pH P95",
+        tooltip=[
+            "date",
+            alt.Tooltip("pH P5", format=",.2f"),
+            alt.Tooltip("pH P95", format=",.2f"),
+        ],
+    )
+    median = base.mark_line().encode(
+        y="pH P50", tooltip=["date", alt.Tooltip("pH P50", format=",.2f")]
+    )
+    chart = (
+        (band + median)
+        .properties(width=600, height=200, title=product)
+        .interactive()
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+    return chart
+
+
+def plot_multiple_products(df, pH_lake0, pH_inflow, lib, max_points=MAX_CHART_POINTS):
     """Plot results from 'run_multiple_products'.
 
     Args
-        df:        Dataframe. As returned by 'run_multiple_products'
-        pH_lake0:  Float. Lake initial pH (dimensionless)
-        pH_inflow: Float. Lake inflow pH (dimensionless)
-        lib:       Str. Plotting library to use. Either 'Altair' or 'Matplotlib'
+        df:         Dataframe. As returned by 'run_multiple_products'
+        pH_lake0:   Float. Lake initial pH (dimensionless)
+        pH_inflow:  Float. Lake inflow pH (dimensionless)
+        lib:        Str. Plotting library to use. Either 'Altair' or 'Matplotlib'
+        max_points: Int. Maximum number of points per product sent to the
+                    browser for Altair charts. See 'downsample_series'
 
     Returns
         Chart object. The chart is also added to the Streamlit app if Streamlit
@@ -102,7 +270,9 @@ def plot_multiple_products(df, pH_lake0, pH_inflow, lib):
         st.set_option("deprecation.showPyplotGlobalUse", False)
         st.pyplot()
     else:
-        # Altair charts
+        # Altair charts. Downsample before embedding the data in the chart, and
+        # attach it once to the top-level chart so both sub-charts share it
+        df = downsample_series(df, "date", ["Ca (mg/l)", "pH"], "product", max_points)
         checkbox_selection = alt.selection_point(fields=["product"], bind="legend")
         init_lake_ph = (
             alt.Chart(pd.DataFrame({"pH": [pH_lake0]}))
@@ -115,7 +285,7 @@ def plot_multiple_products(df, pH_lake0, pH_inflow, lib):
             .encode(y="pH")
         )
         ph_chart = (
-            alt.Chart(df)
+            alt.Chart()
             .mark_line()
             .encode(
                 x=alt.X("date", axis=alt.Axis(title="Måneder", grid=True)),
@@ -133,7 +303,7 @@ def plot_multiple_products(df, pH_lake0, pH_inflow, lib):
             .interactive()
         )
         ca_chart = (
-            alt.Chart(df)
+            alt.Chart()
             .mark_line()
             .encode(
                 x=alt.X(
@@ -157,7 +327,7 @@ def plot_multiple_products(df, pH_lake0, pH_inflow, lib):
             .properties(width=600, height=200)
             .interactive()
         )
-        chart = alt.vconcat(ca_chart, ph_chart + init_lake_ph + inflow_ph)
+        chart = alt.vconcat(ca_chart, ph_chart + init_lake_ph + inflow_ph, data=df)
         st.altair_chart(chart, use_container_width=True)
 
         return chart
\ No newline at end of file
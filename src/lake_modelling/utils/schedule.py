@@ -0,0 +1,614 @@
+import numpy as np
+from scipy.integrate import odeint
+
+from src.lake_modelling.utils.fast_solver import bottom_lime_exposure
+from src.lake_modelling.utils.lake_model import (
+    Lake,
+    LimeProduct,
+    Model,
+    ModelResult,
+    MM_Ca,
+    MM_CaCO3,
+)
+from src.lake_modelling.utils.timing import span
+from src.lake_modelling.utils.titration import caco3_to_ph, ph_to_caco3
+
+# Liming methods in 'agder_lime_added.csv' and the equivalent 'spr_meth'
+LIME_METHODS = {"Båt": "wet", "Helikopter": "dry"}
+
+# Default convergence tolerance (mg/l of Ca-equivalents) for
+# 'periodic_steady_state'
+PSS_TOL = 1e-6
+
+# Lake-bottom stores that can release less than this (mg/l of Ca-equivalents)
+# over the rest of the simulation are dropped
+STORE_TOL = 1e-6
+
+# Maximum number of lake-bottom stores carried between cycles by the Newton
+# iteration in 'periodic_steady_state'. Each iteration costs O(S^2), so lakes
+# with more active stores are integrated forward year by year instead
+PSS_MAX_STORES = 50
+
+
+def _store_shares(C_bott, total):
+    """Fraction of the lime in all lake-bottom stores held by each store."""
+    if total > 0:
+        return C_bott / total
+    return np.full(len(C_bott), 1 / len(C_bott))
+
+
+def schedule_dCdt(y, t, Q, V, C_in, t0, rate_const, activity_const, ca_aq_sat):
+    """ODE system in 'Model.run', with one lake-bottom store per liming event.
+
+    Args
+        y:              Array of length 1 + S. [C_lake, C_bott_1, ..., C_bott_S]
+                        in mg/l of Ca-equivalents
+        t:              Float. Time since the start of the simulation (months)
+        Q:              Float. Flow this month (litres/month)
+        V:              Float. Lake volume (litres)
+        C_in:           Float. Inflow Ca concentration (mg/l)
+        t0:             Array of length S. Time each store was added (months)
+        rate_const:     Float. See 'Model'
+        activity_const: Float. See 'Model'
+        ca_aq_sat:      Float. See 'Model'
+
+    Returns
+        Array of length 1 + S.
+    """
+    C_lake = y[0]
+    C_bott = y[1:]
+
+    k = rate_const * np.exp(-activity_const * (t - t0))
+    rate_factor = 1 / (1 + np.exp(10 * (C_lake - ca_aq_sat)))
+    # As in 'Model', dissolution is limited by the saturation deficit. The limit
+    # applies to the total in all stores, shared in proportion to their size
+    total = C_bott.sum()
+    dCbott_dt = (
+        -k * rate_factor * min(total, ca_aq_sat - C_lake) * _store_shares(C_bott, total)
+    )
+    dClake_dt = Q * (C_in - C_lake) / V - dCbott_dt.sum()
+
+    return np.concatenate(([dClake_dt], dCbott_dt))
+
+
+def schedule_jacobian(y, t, Q, V, C_in, t0, rate_const, activity_const, ca_aq_sat):
+    """Jacobian of 'schedule_dCdt' with respect to 'y'. Arguments as for
+    'schedule_dCdt'.
+
+    Returns
+        Array of shape (1 + S, 1 + S).
+    """
+    C_lake = y[0]
+    C_bott = y[1:]
+
+    k = rate_const * np.exp(-activity_const * (t - t0))
+    sat_factor = np.exp(10 * (C_lake - ca_aq_sat))
+    rate_factor = 1 / (1 + sat_factor)
+    total = C_bott.sum()
+    deficit = ca_aq_sat - C_lake
+    shares = _store_shares(C_bott, total)
+    # Dissolution limited by the saturation deficit rather than the total in stores
+    limited = total > deficit
+    dbott_dlake = (
+        -k
+        * shares
+        * (
+            -10 * sat_factor * rate_factor**2 * min(total, deficit)
+            - rate_factor * limited
+        )
+    )
+    if not limited:
+        dbott_dbott = np.diag(-k * rate_factor)
+    elif total > 0:
+        # Only the shares depend on the stores
+        dbott_dbott = (
+            -rate_factor
+            * deficit
+            / total
+            * (np.diag(k) - np.outer(k * shares, np.ones(len(C_bott))))
+        )
+    else:
+        dbott_dbott = np.zeros((len(C_bott), len(C_bott)))
+
+    jac = np.zeros((1 + len(C_bott), 1 + len(C_bott)))
+    jac[0, 0] = -Q / V - dbott_dlake.sum()
+    jac[0, 1:] = -dbott_dbott.sum(axis=0)
+    jac[1:, 0] = dbott_dlake
+    jac[1:, 1:] = dbott_dbott
+
+    return jac
+
+
+def _sensitivity_dCdt(z, t, n, *args):
+    """'schedule_dCdt' augmented with the variational equations for the
+    sensitivity matrix of the state, stored after the state in 'z'.
+    """
+    y = z[:n]
+    sens = z[n:].reshape(n, -1)
+
+    return np.concatenate(
+        (schedule_dCdt(y, t, *args), (schedule_jacobian(y, t, *args) @ sens).ravel())
+    )
+
+
+class LimingSchedule:
+    def __init__(
+        self,
+        lake,
+        events,
+        start_month=1,
+        n_months=None,
+        spr_prop=0.5,
+        F_sol=1,
+        rate_const=0.1,
+        activity_const=0.1,
+        ca_aq_sat=8.5,
+    ):
+        """Simulate a lake limed repeatedly over several years. Lake Ca and the
+        lake-bottom lime from earlier additions are carried over from one event
+        to the next, and each event is partitioned exactly as in 'Model'.
+
+        Each event adds its own lake-bottom store, with a dissolution rate that
+        declines with time since that event. Stores that can no longer release
+        a significant amount of Ca are dropped, so the cost of the simulation is
+        linear in its length.
+
+        Args
+            lake:           Obj. Instance of Lake class
+            events:         List of tuples (month, lime_dose, lime_product,
+                            spr_meth). 'month' is an int, the number of months
+                            after the start of the simulation. See 'Model' for
+                            the others
+            start_month:    Int between 1 and 12. Calendar month in which the
+                            simulation starts
+            n_months:       Int. Number of months to simulate. Default None
+                            simulates 12 months after the last event
+            spr_prop:       Float. See 'Model'. Used for all events
+            F_sol:          Float. See 'Model'
+            rate_const:     Float. See 'Model'
+            activity_const: Float. See 'Model'
+            ca_aq_sat:      Float. See 'Model'
+        """
+        self.lake = lake
+        self.events = sorted(events, key=lambda event: event[0])
+        self.start_month = start_month
+        if n_months is None:
+            n_months = self.events[-1][0] + 12 if self.events else 12
+        self.n_months = n_months
+        self.spr_prop = spr_prop
+        self.F_sol = F_sol
+        self.rate_const = rate_const
+        self.activity_const = activity_const
+        self.ca_aq_sat = ca_aq_sat
+        self._validate_input()
+
+        # Derived attributes
+        caco3_lake0, caco3_in0 = ph_to_caco3(
+            [self.lake.pH_lake0, self.lake.pH_inflow], self.lake.toc_lake0
+        )
+        self.C_lake0 = caco3_lake0 * MM_Ca / MM_CaCO3
+        self.C_in0 = caco3_in0 * MM_Ca / MM_CaCO3
+
+        # One Model per product and method, used to partition the doses
+        self._models = {}
+
+    def _validate_input(self):
+        """Check user-supplied values are reasonable."""
+        assert isinstance(self.lake, Lake), "'lake' must be a Lake object."
+        assert isinstance(self.start_month, int) and (
+            1 <= self.start_month <= 12
+        ), "'start_month' must be an integer between 1 and 12."
+        assert isinstance(self.n_months, int) and (
+            self.n_months > 1
+        ), "'n_months' must be an integer greater than 1."
+        for month, lime_dose, product, spr_meth in self.events:
+            assert isinstance(month, (int, np.integer)) and (
+                0 <= month < self.n_months
+            ), "Event months must be integers between 0 and 'n_months' - 1."
+            assert 0 <= lime_dose <= 85, "'lime_dose' must be between 0 and 85 mg/l."
+            assert isinstance(
+                product, LimeProduct
+            ), "'lime_product' must be a LimeProduct object."
+
+    def _model_kwargs(self, spr_meth):
+        return {
+            "spr_meth": spr_meth,
+            "spr_prop": self.spr_prop,
+            "F_sol": self.F_sol,
+            "rate_const": self.rate_const,
+            "activity_const": self.activity_const,
+            "ca_aq_sat": self.ca_aq_sat,
+        }
+
+    def _model(self, product, spr_meth):
+        key = (id(product), spr_meth)
+        if key not in self._models:
+            self._models[key] = Model(
+                self.lake, product, lime_dose=0, **self._model_kwargs(spr_meth)
+            )
+
+        return self._models[key]
+
+    def _remaining_release(self, C_bott, age):
+        """Upper bound on the lime each store can still release (mg/l)."""
+        if self.rate_const == 0:
+            return np.zeros_like(C_bott)
+        elif self.activity_const > 0:
+            exposure = self.rate_const / self.activity_const
+            exposure = exposure * np.exp(-self.activity_const * age)
+            return C_bott * -np.expm1(-exposure)
+        else:
+            return C_bott
+
+    def _solve_month(self, C_lake, C_bott, t0, month, n_steps, sens=None):
+        """Integrate one month with no new liming events.
+
+        Args
+            C_lake:  Float. Lake Ca concentration (mg/l of Ca-equivalents)
+            C_bott:  Array. Soluble lime in each lake-bottom store (mg/l of
+                     Ca-equivalents)
+            t0:      Array. Time each store was added (months)
+            month:   Int. Months since the start of the simulation
+            n_steps: Int. Number of output steps in the month
+            sens:    Array or None. Default None. Sensitivity of the state
+                     [C_lake, C_bott] at the start of the month to some inputs,
+                     with shape (1 + S, P). If given, it is integrated with the
+                     state
+
+        Returns
+            Tuple (ti, ca, C_lake, C_bott). Output times and lake Ca
+            concentrations, and the state at the end of the month. If 'sens'
+            is given, the sensitivity at the end of the month is appended.
+        """
+        ti = np.linspace(month, month + 1, num=n_steps + 1)
+        q_month = self.lake.monthly_flows[(month + self.start_month - 1) % 12 + 1]
+        V = self.lake.volume
+        if len(C_bott) == 0:
+            # Only flushing, which has an exact solution
+            decay = np.exp(-q_month / V * (ti - month))
+            ca = self.C_in0 + (C_lake - self.C_in0) * decay
+            if sens is None:
+                return ti, ca, ca[-1], C_bott
+            return ti, ca, ca[-1], C_bott, sens * decay[-1]
+
+        with span("LimingSchedule.odeint"):
+            args = (
+                q_month,
+                V,
+                self.C_in0,
+                t0,
+                self.rate_const,
+                self.activity_const,
+                self.ca_aq_sat,
+            )
+            y0 = np.append(C_lake, C_bott)
+            if sens is None:
+                y = odeint(schedule_dCdt, y0, ti, args=args)
+            else:
+                n = len(y0)
+                y = odeint(
+                    _sensitivity_dCdt,
+                    np.append(y0, sens.ravel()),
+                    ti,
+                    args=(n, *args),
+                )
+                return ti, y[:, 0], y[-1, 0], y[-1, 1:n], y[-1, n:].reshape(sens.shape)
+
+        return ti, y[:, 0], y[-1, 0], y[-1, 1:]
+
+    def run(self, dt=0.1):
+        """Simulate change in concentration of Ca-equivalents and pH over time.
+
+        Args
+            dt: Float between 0 and 1 (months). Time resolution of the output
+
+        Returns
+            ModelResult. Time is in decimal months from the start of the year in
+            which the simulation starts.
+        """
+        assert 0 < dt < 1, "'dt' must be between 0 and 1."
+        events = {}
+        for month, lime_dose, product, spr_meth in self.events:
+            events.setdefault(month, []).append((lime_dose, product, spr_meth))
+
+        # As in 'Model._solve', each month is solved separately and output for
+        # month m is written to t_out[m * n_steps : (m + 1) * n_steps + 1]
+        n_steps = int(1 + 1 / dt) - 1
+        t_out = np.empty(self.n_months * n_steps + 1)
+        ca_out = np.empty(self.n_months * n_steps + 1)
+
+        C_lake = self.C_lake0
+        C_bott = np.empty(0)
+        t0 = np.empty(0)
+        for month in range(self.n_months):
+            for lime_dose, product, spr_meth in events.get(month, []):
+                C_inst, C_bott_new = self._model(
+                    product, spr_meth
+                )._partition_lime_equivalents(lime_dose)
+                C_lake += self.spr_prop * C_inst
+                C_bott = np.append(C_bott, self.spr_prop * C_bott_new)
+                t0 = np.append(t0, month)
+
+            keep = self._remaining_release(C_bott, month - t0) >= STORE_TOL
+            C_bott, t0 = C_bott[keep], t0[keep]
+
+            seg = slice(month * n_steps, (month + 1) * n_steps + 1)
+            t_out[seg], ca_out[seg], C_lake, C_bott = self._solve_month(
+                C_lake, C_bott, t0, month, n_steps
+            )
+
+        ph = caco3_to_ph(ca_out * MM_CaCO3 / MM_Ca, self.lake.toc_lake0)
+
+        return ModelResult(t_out + self.start_month - 1, ca_out, ph)
+
+
+def events_from_records(df, lake, lime_product, lime_month=7, first_year=None):
+    """Build liming events from historical records, such as
+    'data/agder_lime_added.csv'.
+
+    Args
+        df:           Dataframe. Records for one lake with columns 'year',
+                      'tonnes' and 'method' (one of 'LIME_METHODS')
+        lake:         Obj. Instance of Lake class. Used to convert tonnes to mg/l
+        lime_product: Obj. Instance of LimeProduct class used for all events
+        lime_month:   Int between 1 and 12. Month in which lime is added each year
+        first_year:   Int. Year in which the simulation starts, in January.
+                      Default None uses the first year in 'df'
+
+    Returns
+        List of events for 'LimingSchedule' with 'start_month' 1.
+    """
+    if first_year is None:
+        first_year = int(df["year"].min())
+    df = df.query("tonnes > 0")
+    events = []
+    for row in df.itertuples(index=False):
+        lime_dose = row.tonnes * 1e9 / lake.volume
+        month = 12 * (int(row.year) - first_year) + lime_month - 1
+        events.append((month, lime_dose, lime_product, LIME_METHODS[row.method]))
+
+    return events
+
+
+def _n_active(release):
+    """Number of stores, ordered by age, before the first that can release
+    less than 'STORE_TOL'.
+    """
+    inactive = np.flatnonzero(release < STORE_TOL)
+
+    return inactive[0] if len(inactive) > 0 else len(release)
+
+
+def _newton_cycle(schedule, x, C_inst, C_bott_new, n_steps, tol, max_iter):
+    """Limit cycle for 'periodic_steady_state' by Newton iteration on the state
+    at the start of the cycle, 'x' = [C_lake, C_bott of ages 12, 24, ...
+    months]. The initial value of 'x' sets the number of stores carried.
+
+    Returns
+        Tuple (t, ca, info, x, C_oldest). 't', 'ca' and 'info' as for
+        'periodic_steady_state', the state at the end of the last cycle, and
+        the lime in the oldest store when it leaves the state at the end of
+        that cycle. 'C_oldest' is zero if the store was dropped during the
+        cycle, as it would be in 'LimingSchedule.run'. Iteration stops early if
+        it is within 'sqrt(tol)' of converging but 'C_oldest' is not zero.
+    """
+    n_stores = len(x) - 1
+    ages = 12.0 * np.arange(1, n_stores + 1)
+    t0 = -12.0 * np.arange(n_stores + 1)
+
+    def annual_map(x):
+        """Cycle output, the state one year later and its Jacobian with respect
+        to 'x', for a cycle starting just before liming in state 'x'. Also the
+        lime in the oldest store at the end of the cycle.
+        """
+        C_lake = x[0] + C_inst
+        C_bott = np.append(C_bott_new, x[1:])
+        # Sensitivity of [C_lake, C_bott] after liming to 'x'. The new store
+        # does not depend on 'x'
+        sens = np.insert(np.eye(n_stores + 1), 1, 0, axis=0)
+        t_out = np.empty(12 * n_steps + 1)
+        ca_out = np.empty(12 * n_steps + 1)
+        dropped = np.zeros(n_stores + 1, dtype=bool)
+        for month in range(12):
+            # Stores are dropped as in 'LimingSchedule.run'
+            dropped |= schedule._remaining_release(C_bott, month - t0) < STORE_TOL
+            C_bott = np.where(dropped, 0.0, C_bott)
+            sens[1:][dropped] = 0
+            seg = slice(month * n_steps, (month + 1) * n_steps + 1)
+            t_out[seg], ca_out[seg], C_lake, C_bott, sens = schedule._solve_month(
+                C_lake, C_bott, t0, month, n_steps, sens
+            )
+        C_oldest = 0.0 if dropped[-1] else C_bott[-1]
+
+        # The oldest store leaves the state
+        return t_out, ca_out, np.append(C_lake, C_bott[:-1]), sens[:-1], C_oldest
+
+    residuals = []
+    converged = False
+    newton_step = False
+    x_prev_end = x
+    for n_iter in range(1, max_iter + 1):
+        with span("periodic_steady_state.cycle"):
+            t, ca, x_end, jac, C_oldest = annual_map(x)
+        residuals.append(float(np.abs(x_end - x).max()))
+        if residuals[-1] <= tol:
+            converged = True
+            break
+        if C_oldest > 0 and residuals[-1] <= np.sqrt(tol):
+            # Close enough for the next step to converge, but the state is
+            # missing stores
+            break
+        if newton_step and residuals[-1] >= residuals[-2]:
+            # The Newton step made things worse. Take one year from the
+            # previous state instead, which always approaches the cycle
+            x = x_prev_end
+            newton_step = False
+            continue
+        x_prev_end = x_end
+        dx = np.linalg.solve(jac - np.eye(len(x)), x_end - x)
+        # Concentrations cannot be negative, and stores taken to zero would be
+        # dropped and could not recover
+        shrink = dx > 0.9 * x
+        x = x - np.min(np.append(1.0, 0.9 * x[shrink] / dx[shrink])) * dx
+        newton_step = True
+
+    info = {
+        "converged": converged,
+        "n_iter": n_iter,
+        "residuals": residuals,
+        "n_stores": _n_active(schedule._remaining_release(x_end[1:], ages)),
+        "method": "newton",
+    }
+
+    return t, ca, info, x_end, C_oldest
+
+
+def _forward_cycle(schedule, x, C_inst, C_bott_new, n_steps, tol, max_years):
+    """Limit cycle for 'periodic_steady_state' by integrating forward one year
+    at a time from the state 'x' (see '_newton_cycle'), as in
+    'LimingSchedule.run', until the annual cycle of lake Ca changes by at most
+    'tol'.
+
+    Returns
+        Tuple (t, ca, info). See 'periodic_steady_state'.
+    """
+    C_lake = x[0]
+    C_bott = np.asarray(x[1:], dtype=float)
+    # Store times are relative to the start of the current cycle
+    t0 = -12.0 * np.arange(1, len(C_bott) + 1)
+    t_out = np.empty(12 * n_steps + 1)
+    ca_out = np.empty(12 * n_steps + 1)
+    ca_prev = None
+    residuals = []
+    converged = False
+    for n_iter in range(1, max_years + 1):
+        C_lake += C_inst
+        C_bott = np.append(C_bott_new, C_bott)
+        t0 = np.append(0.0, t0)
+        with span("periodic_steady_state.cycle"):
+            for month in range(12):
+                keep = schedule._remaining_release(C_bott, month - t0) >= STORE_TOL
+                C_bott, t0 = C_bott[keep], t0[keep]
+                seg = slice(month * n_steps, (month + 1) * n_steps + 1)
+                t_out[seg], ca_out[seg], C_lake, C_bott = schedule._solve_month(
+                    C_lake, C_bott, t0, month, n_steps
+                )
+        t0 = t0 - 12
+        if ca_prev is not None:
+            residuals.append(float(np.abs(ca_out - ca_prev).max()))
+            if residuals[-1] <= tol:
+                converged = True
+                break
+        ca_prev = ca_out.copy()
+
+    info = {
+        "converged": converged,
+        "n_iter": n_iter,
+        "residuals": residuals,
+        "n_stores": int(np.sum(schedule._remaining_release(C_bott, -t0) >= STORE_TOL)),
+        "method": "forward",
+    }
+
+    return t_out, ca_out, info
+
+
+def periodic_steady_state(model, dt=0.01, tol=PSS_TOL, max_iter=20, max_years=500):
+    """Limit cycle of a lake limed every year as specified by 'model', i.e. the
+    annual pH cycle once the effect of lime from earlier years has settled.
+
+    The state at the start of each cycle is the lake Ca concentration and the
+    lime left in the lake-bottom stores from earlier years. Over one year, each
+    store becomes the next-oldest store and a new store is added, so the limit
+    cycle is a fixed point of this annual map. It is found by Newton iteration
+    on the full state, with the Jacobian of the annual map integrated alongside
+    the state (variational equations). Each iteration is one annual
+    integration (see 'LimingSchedule').
+
+    The stores carried are initially those that can still release at least
+    'STORE_TOL' under first-order decay of one year's lake-bottom lime. Near
+    saturation, stores last longer, and more are added until the oldest is
+    dropped within the cycle, as in 'LimingSchedule.run'. If more than
+    'PSS_MAX_STORES' stores are needed, or the iteration does not converge,
+    the lake is integrated forward one year at a time until the cycle settles.
+
+    Args
+        model:     Obj. Model defining the lake and the lime added each year in
+                   'lime_month'. 'n_months' is ignored
+        dt:        Float between 0 and 1 (months). Time resolution of the output
+        tol:       Float. Convergence tolerance (mg/l of Ca-equivalents) on the
+                   change in the cycle over one year
+        max_iter:  Int. Maximum number of Newton iterations
+        max_years: Int. Maximum number of years integrated if the lake is
+                   integrated forward
+
+    Returns
+        Tuple (result, info). 'result' is a ModelResult for one year from
+        liming, with time in decimal months from the start of the year. 'info'
+        is a dict with keys 'method' ("newton" or "forward"), 'converged'
+        (bool), 'n_iter' (int, number of annual integrations), 'residuals'
+        (list of the maximum change in the state, or in the lake Ca cycle if
+        integrated forward, for each iteration, in mg/l) and 'n_stores' (number
+        of lake-bottom stores carried from earlier years).
+    """
+    assert 0 < dt < 1, "'dt' must be between 0 and 1."
+    schedule = LimingSchedule(
+        model.lake,
+        [(0, model.lime_dose, model.lime_product, model.spr_meth)],
+        start_month=model.lime_month,
+        n_months=12,
+        spr_prop=model.spr_prop,
+        F_sol=model.F_sol,
+        rate_const=model.rate_const,
+        activity_const=model.activity_const,
+        ca_aq_sat=model.ca_aq_sat,
+    )
+    C_inst, C_bott_new = model._partition_lime_equivalents()
+    C_inst, C_bott_new = model.spr_prop * C_inst, model.spr_prop * C_bott_new
+    n_steps = int(1 + 1 / dt) - 1
+
+    # Stores of age 12, 24, ... months left from one year's lake-bottom lime
+    ages = 12.0 * np.arange(1, PSS_MAX_STORES + 2)
+    C_bott0 = C_bott_new * np.exp(
+        -bottom_lime_exposure(ages, model.rate_const, model.activity_const)
+    )
+    n_stores = _n_active(schedule._remaining_release(C_bott0, ages))
+    # Lake Ca before liming if the lime added each year, including the
+    # lake-bottom lime eventually released, were flushed at the annual rate
+    flushed = np.exp(-sum(model.lake.monthly_flows.values()) / model.lake.volume)
+    C_added = C_inst + C_bott_new - C_bott0[-1]
+    x = np.append(
+        schedule.C_in0 + C_added * flushed / (1 - flushed), C_bott0[:n_stores]
+    )
+    n_iter = 0
+    done = False
+    while n_stores <= PSS_MAX_STORES and n_iter < max_iter:
+        t, ca, info, x, C_oldest = _newton_cycle(
+            schedule, x, C_inst, C_bott_new, n_steps, tol, max_iter - n_iter
+        )
+        n_iter += info["n_iter"]
+        if C_oldest == 0 or info["residuals"][-1] > np.sqrt(tol):
+            done = info["converged"] and C_oldest == 0
+            break
+        # Near saturation, stores last longer than first-order decay implies.
+        # Also carry the oldest store, and older stores extrapolated from it
+        ratio = C_oldest / x[-1] if x[-1] > 0 else 0.0
+        x = np.append(x, C_oldest)
+        while ratio < 1 and len(x) <= PSS_MAX_STORES + 1:
+            C_next = x[-1:] * ratio
+            if schedule._remaining_release(C_next, 12.0 * len(x))[0] < STORE_TOL:
+                break
+            x = np.append(x, C_next)
+        n_stores = len(x) - 1
+
+    if done:
+        info["n_iter"] = n_iter
+    else:
+        t, ca, info = _forward_cycle(
+            schedule, x, C_inst, C_bott_new, n_steps, tol, max_years
+        )
+        info["n_iter"] += n_iter
+
+    ph = caco3_to_ph(ca * MM_CaCO3 / MM_Ca, model.lake.toc_lake0)
+    result = ModelResult(t + model.lime_month - 1, ca, ph)
+
+    return result, info
@@ -0,0 +1,408 @@
+"""Global sensitivity analysis of lake pH after liming.
+
+Usage (from the repository root):
+
+    python -m src.lake_modelling.utils.sensitivity --method morris --n 100
+        --checkpoint ./sa_morris [--workers N] [--seed 42]
+
+Designs are generated on the unit hypercube and mapped to the parameter ranges
+in a 'problem' dict. Model evaluations are split into batches, run on a process
+pool and saved to a checkpoint directory, so an interrupted analysis can be
+resumed by re-running the same command.
+"""
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+
+# Parameters varied by default, as (min, max) for continuous parameters or a
+# list of options for categorical ones
+DEFAULT_PROBLEM = {
+    "depth": (1, 30),
+    "tau": (0.1, 3),
+    "flow_prof": ["fjell", "kyst", "none"],
+    "toc_lake0": (0.5, 10),
+    "lime_dose": (5, 50),
+    "spr_meth": ["wet", "dry"],
+    "spr_prop": (0.2, 1),
+    "rate_const": (0.01, 0.5),
+    "activity_const": (0.01, 0.5),
+}
+
+# Values used for model inputs that are not varied
+FIXED_PARAMS = {
+    "product": "Standard Kalk Kat3",
+    "area": 0.2,
+    "pH_lake0": 5,
+    "pH_inflow": 5,
+    "lime_month": 7,
+    "F_sol": 1,
+    "ca_aq_sat": 8.5,
+    "n_months": 12,
+}
+
+OUTPUTS = ("final pH", "min pH")
+
+LAKE_PARAMS = ("area", "depth", "tau", "flow_prof", "pH_lake0", "pH_inflow", "toc_lake0")
+MODEL_PARAMS = (
+    "lime_dose",
+    "lime_month",
+    "spr_meth",
+    "spr_prop",
+    "F_sol",
+    "rate_const",
+    "activity_const",
+    "ca_aq_sat",
+    "n_months",
+)
+
+# Number of model evaluations per checkpointed batch
+BATCH_SIZE = 500
+
+# Output time resolution (months) used to find the minimum pH
+SA_DT = 0.1
+
+
+def scale_design(problem, X):
+    """Map unit-hypercube samples to parameter values.
+
+    Args
+        problem: Dict. {name: (min, max) or list of options}. See 'DEFAULT_PROBLEM'
+        X:       Array of shape (n, len(problem)). Values between 0 and 1
+
+    Returns
+        List of dicts {name: value}, one per row of 'X'.
+    """
+    columns = []
+    for idx, spec in enumerate(problem.values()):
+        u = X[:, idx]
+        if isinstance(spec, list):
+            codes = np.minimum((u * len(spec)).astype(int), len(spec) - 1)
+            columns.append([spec[code] for code in codes])
+        else:
+            lo, hi = spec
+            columns.append((lo + u * (hi - lo)).tolist())
+
+    return [dict(zip(problem, row)) for row in zip(*columns)]
+
+
+def morris_design(k, r, levels=4, seed=None):
+    """Morris one-at-a-time design on the unit hypercube.
+
+    Args
+        k:      Int. Number of parameters
+        r:      Int. Number of trajectories
+        levels: Int. Even number of grid levels
+        seed:   Int. Seed for the random number generator
+
+    Returns
+        Array of shape (r * (k + 1), k). Consecutive blocks of k + 1 rows are
+        trajectories in which each row differs from the previous one in a
+        single parameter.
+    """
+    assert levels % 2 == 0, "'levels' must be even."
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    starts = np.arange(levels // 2) / (levels - 1)
+    X = np.empty((r, k + 1, k))
+    for traj in range(r):
+        signs = rng.choice((-1, 1), size=k)
+        x = rng.choice(starts, size=k) + np.where(signs < 0, delta, 0)
+        X[traj, 0] = x
+        for step, param in enumerate(rng.permutation(k), start=1):
+            x = x.copy()
+            x[param] += signs[param] * delta
+            X[traj, step] = x
+
+    return X.reshape(-1, k)
+
+
+def saltelli_design(k, n, seed=None):
+    """Saltelli design for first-order and total Sobol indices.
+
+    Args
+        k:    Int. Number of parameters
+        n:    Int. Base sample size. Rounded up to a power of 2 for the scrambled
+              Sobol sequence
+        seed: Int. Seed for the random number generator
+
+    Returns
+        Array of shape (n * (k + 2), k). Blocks of n rows: A, B and then A with
+        column i taken from B, for i = 0 to k - 1.
+    """
+    m = int(np.ceil(np.log2(n)))
+    base = qmc.Sobol(d=2 * k, scramble=True, seed=seed).random_base2(m)
+    A, B = base[:, :k], base[:, k:]
+    AB = np.repeat(A[np.newaxis], k, axis=0)
+    for idx in range(k):
+        AB[idx, :, idx] = B[:, idx]
+
+    return np.concatenate([A, B, AB.reshape(-1, k)])
+
+
+_PRODUCTS = {}
+
+
+def evaluate(params):
+    """Run the model for one parameter set.
+
+    Args
+        params: Dict. Values for all keys in 'LAKE_PARAMS' and 'MODEL_PARAMS',
+                plus 'product'
+
+    Returns
+        Tuple (final_ph, min_ph).
+    """
+    name = params["product"]
+    if name not in _PRODUCTS:
+        _PRODUCTS[name] = LimeProduct(name)
+    lake = Lake(**{par: params[par] for par in LAKE_PARAMS})
+    model = Model(
+        lake, _PRODUCTS[name], **{par: params[par] for par in MODEL_PARAMS}
+    )
+    ph = model.run(dt=SA_DT, solver="fast").ph
+
+    return ph[-1], ph.min()
+
+
+def _evaluate_batch(param_sets):
+    return np.array([evaluate(params) for params in param_sets])
+
+
+def run_design(problem, X, checkpoint_dir, workers=None, batch_size=BATCH_SIZE):
+    """Evaluate the model for each row of a unit-hypercube design, in batches on
+    a process pool. Each finished batch is saved in 'checkpoint_dir' under the
+    range of rows it covers; rows already covered are not recomputed, even if
+    'batch_size' has changed.
+
+    Args
+        problem:        Dict. See 'scale_design'
+        X:              Array of shape (n, len(problem)). Design
+        checkpoint_dir: Str. Directory for the design and results. Created if it
+                        does not exist
+        workers:        Int. Number of worker processes. Default None uses the
+                        number of CPUs
+        batch_size:     Int. Number of model runs per batch
+
+    Returns
+        Array of shape (n, len(OUTPUTS)).
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    design_path = os.path.join(checkpoint_dir, "design.npy")
+    problem_path = os.path.join(checkpoint_dir, "problem.json")
+    if os.path.isfile(design_path):
+        with open(problem_path, encoding="utf-8") as f:
+            saved_problem = json.load(f)
+        assert saved_problem == json.loads(json.dumps(problem)) and np.array_equal(
+            np.load(design_path), X
+        ), f"'{checkpoint_dir}' contains results for a different design."
+    else:
+        np.save(design_path, X)
+        with open(problem_path, "w", encoding="utf-8") as f:
+            json.dump(problem, f, indent=1)
+
+    Y = np.full((len(X), len(OUTPUTS)), np.nan)
+    covered = np.zeros(len(X), dtype=bool)
+    for fname in os.listdir(checkpoint_dir):
+        match = re.fullmatch(r"results_(\d+)_(\d+)\.npy", fname)
+        if match:
+            start, stop = int(match.group(1)), int(match.group(2))
+            Y[start:stop] = np.load(os.path.join(checkpoint_dir, fname))
+            covered[start:stop] = True
+
+    # Batches of at most 'batch_size' consecutive rows not yet covered
+    missing = np.flatnonzero(~covered)
+    ranges = [
+        (int(run[idx]), int(run[min(idx + batch_size, len(run)) - 1]) + 1)
+        for run in np.split(missing, np.flatnonzero(np.diff(missing) > 1) + 1)
+        for idx in range(0, len(run), batch_size)
+    ]
+    if ranges:
+        param_sets = [
+            {**FIXED_PARAMS, **params} for params in scale_design(problem, X)
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batches = [param_sets[start:stop] for start, stop in ranges]
+            Y_batches = pool.map(_evaluate_batch, batches)
+            for (start, stop), Y_batch in zip(ranges, Y_batches):
+                # Write to a temporary file first, so an interrupted run never
+                # leaves a partial batch behind
+                fname = f"results_{start:08d}_{stop:08d}.npy"
+                path = os.path.join(checkpoint_dir, fname)
+                tmp_path = path + ".tmp.npy"
+                np.save(tmp_path, Y_batch)
+                os.replace(tmp_path, path)
+                Y[start:stop] = Y_batch
+
+    return Y
+
+
+def _confidence_interval(samples, conf_level):
+    """Half-width of the central 'conf_level' interval of bootstrap samples
+    along axis 0.
+    """
+    lo, hi = np.percentile(
+        samples, [50 * (1 - conf_level), 50 * (1 + conf_level)], axis=0
+    )
+    return (hi - lo) / 2
+
+
+def morris_indices(X, Y, names, num_resamples=1000, conf_level=0.95, seed=None):
+    """Morris elementary-effect statistics.
+
+    Args
+        X:             Array of shape (r * (k + 1), k). As returned by
+                       'morris_design'
+        Y:             Array of length r * (k + 1). Model output for each row
+        names:         List of str. Parameter names
+        num_resamples: Int. Number of bootstrap resamples of the trajectories
+        conf_level:    Float. Confidence level for the intervals
+        seed:          Int. Seed for the random number generator
+
+    Returns
+        Dataframe indexed by parameter with columns 'mu', 'mu_star',
+        'mu_star_conf' and 'sigma'.
+    """
+    k = len(names)
+    dX = np.diff(X.reshape(-1, k + 1, k), axis=1)
+    dY = np.diff(Y.reshape(-1, k + 1), axis=1)
+    param = np.argmax(np.abs(dX), axis=2)
+    step = np.take_along_axis(dX, param[..., np.newaxis], axis=2)[..., 0]
+
+    # Elementary effects of shape (r, k), ordered by parameter
+    ee = np.empty_like(dY)
+    np.put_along_axis(ee, param, dY / step, axis=1)
+
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, len(ee), size=(num_resamples, len(ee)))
+    mu_star_boot = np.abs(ee)[resamples].mean(axis=1)
+    df = pd.DataFrame(
+        {
+            "mu": ee.mean(axis=0),
+            "mu_star": np.abs(ee).mean(axis=0),
+            "mu_star_conf": _confidence_interval(mu_star_boot, conf_level),
+            "sigma": ee.std(axis=0, ddof=1),
+        },
+        index=pd.Index(names, name="parameter"),
+    )
+
+    return df
+
+
+def _sobol_estimates(YA, YB, YAB):
+    """First-order (Saltelli 2010) and total (Jansen) Sobol indices."""
+    var = np.var(np.concatenate([YA, YB], axis=-1), axis=-1)[..., np.newaxis]
+    S1 = np.mean(YB[..., np.newaxis, :] * (YAB - YA[..., np.newaxis, :]), axis=-1)
+    ST = 0.5 * np.mean((YA[..., np.newaxis, :] - YAB) ** 2, axis=-1)
+
+    return S1 / var, ST / var
+
+
+def sobol_indices(Y, names, num_resamples=1000, conf_level=0.95, seed=None):
+    """First-order and total Sobol indices.
+
+    Args
+        Y:             Array of length n * (k + 2). Model output for each row of
+                       a design from 'saltelli_design'
+        names:         List of str. Parameter names
+        num_resamples: Int. Number of bootstrap resamples
+        conf_level:    Float. Confidence level for the intervals
+        seed:          Int. Seed for the random number generator
+
+    Returns
+        Dataframe indexed by parameter with columns 'S1', 'S1_conf', 'ST' and
+        'ST_conf'.
+    """
+    k = len(names)
+    Y = Y.reshape(k + 2, -1)
+    YA, YB, YAB = Y[0], Y[1], Y[2:]
+    S1, ST = _sobol_estimates(YA, YB, YAB)
+
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, len(YA), size=(num_resamples, len(YA)))
+    S1_boot, ST_boot = _sobol_estimates(
+        YA[resamples], YB[resamples], YAB[:, resamples].transpose(1, 0, 2)
+    )
+    df = pd.DataFrame(
+        {
+            "S1": S1,
+            "S1_conf": _confidence_interval(S1_boot, conf_level),
+            "ST": ST,
+            "ST_conf": _confidence_interval(ST_boot, conf_level),
+        },
+        index=pd.Index(names, name="parameter"),
+    )
+
+    return df
+
+
+def run_analysis(
+    method, n, checkpoint_dir, problem=DEFAULT_PROBLEM, workers=None, seed=None
+):
+    """Generate a design, evaluate it and compute sensitivity indices for each
+    of 'OUTPUTS'.
+
+    Args
+        method:         Str. Either 'morris' or 'sobol'
+        n:              Int. Number of Morris trajectories, or Saltelli base
+                        sample size. The number of model runs is n * (k + 1) for
+                        'morris' and about n * (k + 2) for 'sobol'
+        checkpoint_dir: Str. See 'run_design'
+        problem:        Dict. See 'scale_design'
+        workers:        Int. See 'run_design'
+        seed:           Int. Seed for the design and bootstrap
+
+    Returns
+        Dataframe of indices with a column 'output' identifying the model output.
+    """
+    assert method in ("morris", "sobol"), "'method' must be either 'morris' or 'sobol'."
+    names = list(problem)
+    if method == "morris":
+        X = morris_design(len(names), n, seed=seed)
+    else:
+        X = saltelli_design(len(names), n, seed=seed)
+    Y = run_design(problem, X, checkpoint_dir, workers=workers)
+
+    df_list = []
+    for idx, output in enumerate(OUTPUTS):
+        if method == "morris":
+            df = morris_indices(X, Y[:, idx], names, seed=seed)
+        else:
+            df = sobol_indices(Y[:, idx], names, seed=seed)
+        df.insert(0, "output", output)
+        df_list.append(df)
+
+    return pd.concat(df_list)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Global sensitivity analysis of lake pH after liming."
+    )
+    parser.add_argument("--method", choices=("morris", "sobol"), default="morris")
+    parser.add_argument(
+        "--n", type=int, default=100, help="Morris trajectories or Saltelli base sample size."
+    )
+    parser.add_argument("--checkpoint", required=True, help="Checkpoint directory.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    parser.add_argument("--output", help="Path to save the indices as CSV.")
+    args = parser.parse_args()
+
+    df = run_analysis(
+        args.method, args.n, args.checkpoint, workers=args.workers, seed=args.seed
+    )
+    print(df.round(3).to_string())
+    if args.output:
+        df.to_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
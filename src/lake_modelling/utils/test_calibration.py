@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from src.lake_modelling.utils.calibration import build_models, calibrate, simulate_ph
+
+TRUE_PARAMS = {"rate_const": 0.3, "activity_const": 0.2, "F_sol": 0.8}
+
+LAKES_DF = pd.DataFrame(
+    {
+        "lake": ["A", "B"],
+        "product": ["Standard Kalk Kat3", "Microdol1"],
+        "lake_area_m2": [760000, 185000],
+        "mean_depth_m": [14.6, 2.7],
+        "tau_years": [2.71, 0.25],
+        "pH_lake0": [5, 4.8],
+        "pH_inflow": [5, 4.8],
+        "lime_dose": [15, 30],
+        "lime_month": [5, 9],
+        "n_months": [12, 12],
+    }
+)
+
+
+def make_observations():
+    months = np.array([0.5, 1, 2, 3.5, 5, 8, 11])
+    df_list = []
+    for lake, model in build_models(LAKES_DF).items():
+        params = {name: [value] for name, value in TRUE_PARAMS.items()}
+        ph = simulate_ph(model, params, months)[:, 0]
+        df_list.append(pd.DataFrame({"lake": lake, "months": months, "pH": ph}))
+
+    return pd.concat(df_list)
+
+
+class TestCalibration:
+    def test_simulate_ph_matches_run(self):
+        model = build_models(LAKES_DF)["B"]
+        res = model.run(dt=0.05)
+        months = np.array([0, 0.3, 1, 6.55, 12])
+        ph = simulate_ph(model, {"rate_const": [model.rate_const] * 2}, months)
+
+        assert ph.shape == (5, 2)
+        assert np.allclose(ph[:, 0], ph[:, 1])
+        ref = np.interp(months, res.time_months - model.lime_month + 1, res.ph)
+        assert np.allclose(ph[:, 0], ref, atol=1e-3)
+
+    def test_recovers_parameters(self, tmp_path):
+        diag_path = str(tmp_path / "calibration.json")
+        result = calibrate(
+            LAKES_DF, make_observations(), workers=1, diagnostics_path=diag_path
+        )
+
+        assert result["status"] == "converged"
+        assert len(result["history"]) > 1
+        for name, value in TRUE_PARAMS.items():
+            assert abs(result["params"][name] - value) < 0.02
+        assert max(result["rmse"].values()) < 1e-3
+
+        # Warm start from the fitted parameters converges immediately
+        warm = calibrate(LAKES_DF, make_observations(), result["params"], workers=1)
+        assert warm["nfev"] <= result["nfev"]
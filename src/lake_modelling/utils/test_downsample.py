@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from src.lake_modelling.utils.downsample import downsample_series, lttb
+
+
+class TestDownsample:
+    def test_lttb_keeps_ends_and_peaks(self):
+        x = np.arange(1000.0)
+        y = np.sin(x / 50)
+        y[333] = 5
+        idx = lttb(x, y, 50)
+
+        assert len(idx) == 50
+        assert idx[0] == 0 and idx[-1] == 999
+        assert np.all(np.diff(idx) > 0)
+        assert 333 in idx
+        assert np.array_equal(lttb(x[:20], y[:20], 50), np.arange(20))
+
+    def test_downsample_series_per_group(self):
+        dates = pd.date_range("2000-07-01", periods=1000, freq="D")
+        df = pd.concat(
+            [
+                pd.DataFrame(
+                    {"date": dates, "a": np.arange(1000.0) * k, "b": 1.0, "product": k}
+                )
+                for k in (1, 2)
+            ]
+        )
+        res = downsample_series(df, "date", ["a", "b"], "product", max_points=100)
+
+        assert list(res.columns) == list(df.columns)
+        assert res.groupby("product").size().max() <= 100
+        assert res.groupby("product")["date"].min().eq(dates[0]).all()
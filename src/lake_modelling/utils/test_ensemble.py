@@ -0,0 +1,38 @@
+import numpy as np
+from scipy import stats
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+
+test_product = LimeProduct("Microdol1")
+
+
+class TestEnsemble:
+    def test_fixed_parameters_match_run(self):
+        for lake, kwargs in (
+            (Lake(), {}),
+            (Lake(depth=2, tau=0.5), dict(lime_dose=40, spr_prop=1, ca_aq_sat=3)),
+        ):
+            model = Model(lake, test_product, n_months=14, **kwargs)
+            ref = model.run()
+            res = model.run_ensemble(5, {}, percentiles=(5, 95))
+
+            assert np.array_equal(res.time_months, ref.time_months)
+            assert np.allclose(res.ca_mgpl, ref.ca_mgpl, rtol=0, atol=1e-4)
+
+    def test_percentile_bands(self):
+        model = Model(Lake(), test_product, n_months=12)
+        distributions = {
+            "rate_const": stats.lognorm(0.5, scale=0.1),
+            "F_sol": stats.uniform(0.5, 0.5),
+            "id_scale": stats.lognorm(0.2),
+        }
+        res = model.run_ensemble(200, distributions, seed=1)
+        df = res.to_frame()
+
+        assert np.all(np.diff(res.ca_mgpl, axis=0) >= 0)
+        assert np.all(np.diff(res.ph, axis=0) >= 0)
+        assert res.ca_mgpl[2, 0] > res.ca_mgpl[0, 0]
+        assert list(df.columns[1:4]) == ["Ca (mg/l) P5", "Ca (mg/l) P50", "Ca (mg/l) P95"]
+        assert np.array_equal(
+            model.run_ensemble(200, distributions, seed=1).ca_mgpl, res.ca_mgpl
+        )
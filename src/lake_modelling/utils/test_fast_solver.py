@@ -0,0 +1,42 @@
+import numpy as np
+
+from src.lake_modelling.utils.fast_solver import FAST_SOLVER_TOL
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+
+test_product = LimeProduct("Microdol1")
+
+
+class TestFastSolver:
+    def test_fast_solver_matches_odeint(self):
+        lakes = (
+            Lake(),
+            Lake(depth=0.5, tau=0.1, flow_prof="kyst", pH_lake0=5.5, toc_lake0=8),
+            Lake(depth=15, tau=2, toc_lake0=1, pH_inflow=6),
+        )
+        for lake in lakes:
+            for activity_const in (0, 0.1, 1):
+                model = Model(
+                    lake,
+                    test_product,
+                    lime_dose=30,
+                    activity_const=activity_const,
+                    n_months=30,
+                )
+                ref = model.run()
+                fast = model.run(solver="fast")
+
+                assert np.array_equal(fast.time_months, ref.time_months)
+                assert model.solver_fallback_months == []
+                assert model.solver_max_dev <= FAST_SOLVER_TOL
+                assert np.allclose(
+                    fast.ca_mgpl, ref.ca_mgpl, rtol=0, atol=FAST_SOLVER_TOL
+                )
+
+    def test_fast_solver_falls_back_near_saturation(self):
+        lake = Lake(depth=2, tau=0.5)
+        model = Model(lake, test_product, lime_dose=40, spr_prop=1, ca_aq_sat=3)
+        ref = model.run()
+        fast = model.run(solver="fast")
+
+        assert len(model.solver_fallback_months) > 0
+        assert np.allclose(fast.ca_mgpl, ref.ca_mgpl, rtol=0, atol=FAST_SOLVER_TOL)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+
+test_lake = Lake(depth=10, pH_lake0=5.8, pH_inflow=5, toc_lake0=4)
+test_product = LimeProduct("Microdol1")
+
+
+class TestFindDose:
+    def test_dose_reaches_target(self):
+        for criterion, at_month in (("final", 12), ("min", 6)):
+            model = Model(test_lake, test_product, spr_prop=1, n_months=12)
+            dose = model.find_dose(6, at_month=at_month, criterion=criterion)
+            model.lime_dose = dose
+            df = model.run().to_frame()
+            ph = df["pH"][df.index <= model.lime_month - 1 + at_month]
+
+            assert model.lime_dose == dose
+            if criterion == "final":
+                assert np.isclose(ph.iloc[-1], 6, atol=0.01)
+            else:
+                assert np.isclose(ph.min(), 6, atol=0.01)
+
+    def test_partition_matches_scalar(self):
+        model = Model(test_lake, test_product)
+        doses = np.array([0, 5, 10, 27.5, 85])
+        C_inst, C_bott = model._partition_lime_equivalents(doses)
+
+        for idx, dose in enumerate(doses):
+            model.lime_dose = dose
+            assert np.isclose(C_inst[idx], model._partition_lime_equivalents()[0])
+            assert np.isclose(C_bott[idx], model._partition_lime_equivalents()[1])
+
+    def test_target_met_or_unreachable(self):
+        model = Model(test_lake, test_product)
+
+        assert model.find_dose(5) == 0
+        assert np.isnan(model.find_dose(8))
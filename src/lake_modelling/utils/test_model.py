@@ -1,7 +1,8 @@
+import numpy as np
 import pytest
 from pandas import DataFrame
 
-from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model, ModelResult
 
 LIME_PRODUCT_NAME = "SK2"
 FLOW_PROFILE = "kyst"
@@ -74,6 +75,18 @@ class TestLimeProduct:
 
         assert d == 60.0
 
+    def test_inst_dissolution_grid(self):
+        pH = np.array([3.5, 4.2, 5, 5.9, 7])[:, np.newaxis]
+        doses = np.array([5, 10, 27.5, 85, 100])
+        d = test_product.get_instantaneous_dissolution(pH, doses)
+
+        # Values outside the column test ranges are clipped to the boundary
+        id_d10 = np.interp(np.clip(pH, 4, 6), [4, 4.5, 5, 5.5, 6], test_product.id_list)
+        od = np.interp(np.clip(doses, 10, 85), [10, 20, 35, 50, 85], test_product.od_list)
+
+        assert d.shape == (5, 5)
+        assert np.allclose(d, id_d10 / od)
+
 
 class TestModel:
     def test_method_factor(self):
@@ -91,12 +104,22 @@ class TestModel:
     def test_C_bott0(self):
         assert round(test_model.C_bott0, 6) == 0.311549
 
+    def test_partition_follows_dose(self):
+        model = Model(lake=test_lake, lime_product=test_product)
+        C_inst0 = model.C_inst0
+        model.lime_dose = 20
+
+        assert model.C_inst0 != C_inst0
+        assert model.C_inst0 == model.spr_prop * model._partition_lime_equivalents(20)[0]
+
     def test_pH_from_delta_Ca(self):
         # TO DO: test this method
         pass
 
-    def test_model_returns_a_valid_dataframe(self):
-        df = test_model.run()
+    def test_model_returns_a_valid_result(self):
+        result = test_model.run()
+        df = result.to_frame()
 
+        assert isinstance(result, ModelResult)
         assert isinstance(df, DataFrame)
         assert not df.empty
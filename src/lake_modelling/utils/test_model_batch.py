@@ -0,0 +1,40 @@
+import numpy as np
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+from src.lake_modelling.utils.model_batch import ModelBatch
+
+PRODUCT_NAMES = ("Standard Kalk Kat3", "Microdol1", "Omya Hustadmarmor Biokalk")
+
+
+def make_models():
+    lakes = (
+        Lake(depth=2, tau=0.3, flow_prof="fjell"),
+        Lake(depth=10, tau=1.5, flow_prof="kyst", pH_lake0=5.5, toc_lake0=8),
+    )
+    return [
+        Model(lake, LimeProduct(name), lime_dose=30, lime_month=3 + idx, n_months=12 + idx)
+        for idx, (lake, name) in enumerate(
+            (lake, name) for lake in lakes for name in PRODUCT_NAMES
+        )
+    ]
+
+
+class TestModelBatch:
+    def test_batch_matches_model_run(self):
+        ref_dfs = [model.run().to_frame() for model in make_models()]
+        batch_dfs = [result.to_frame() for result in ModelBatch(make_models()).run()]
+
+        assert len(batch_dfs) == len(ref_dfs)
+        for ref_df, batch_df in zip(ref_dfs, batch_dfs):
+            assert list(batch_df.columns) == ["date", "Ca (mg/l)", "pH"]
+            assert np.array_equal(batch_df.index.values, ref_df.index.values)
+            assert np.allclose(batch_df["Ca (mg/l)"], ref_df["Ca (mg/l)"], atol=1e-5)
+            assert np.allclose(batch_df["pH"], ref_df["pH"], atol=1e-5)
+
+    def test_results_stored_on_models(self):
+        models = make_models()
+        ModelBatch(models).run(dt=0.1)
+
+        for model in models:
+            assert len(model.model_time_months) == 10 * model.n_months + 1
+            assert model.result_df["pH"].iloc[-1] == model.model_lake_ph[-1]
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+
+test_model = Model(Lake(), LimeProduct("Microdol1"), n_months=14)
+
+
+class TestModelResult:
+    def test_arrays_shared_with_model(self):
+        result = test_model.run()
+
+        assert result.ca_mgpl is test_model.model_ca_mgpl
+        assert result.ph is test_model.model_lake_ph
+        assert len(result) == len(test_model.result_df)
+        with pytest.raises(AttributeError):
+            result.extra = 1
+
+    def test_daily_matches_pandas_resample(self):
+        for dt in (0.01, 0.1):
+            result = test_model.run(dt=dt)
+            ref_df = (
+                result.to_frame().set_index("date").resample("D").mean().reset_index()
+            )
+            df = result.daily()
+
+            assert list(df.columns) == list(ref_df.columns)
+            assert df["date"].equals(ref_df["date"])
+            assert np.allclose(df["pH"], ref_df["pH"], equal_nan=True)
+            assert np.allclose(df["Ca (mg/l)"], ref_df["Ca (mg/l)"], equal_nan=True)
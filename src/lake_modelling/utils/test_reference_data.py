@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.lake_modelling.utils.reference_data import (
+    REFERENCE_DATA,
+    build_snapshot,
+    comparison_factors,
+    flow_typologies,
+    lime_product_table,
+    read_snapshot,
+    titration_curves,
+)
+
+
+class TestReferenceData:
+    def test_data_is_parsed_once(self):
+        REFERENCE_DATA.invalidate()
+        first = lime_product_table()
+
+        assert lime_product_table() is first
+
+    def test_invalidate_reloads(self):
+        first = flow_typologies()
+        REFERENCE_DATA.invalidate("flow_typologies")
+
+        assert flow_typologies() is not first
+        assert REFERENCE_DATA.refresh() == []
+
+    def test_flow_typologies(self):
+        flows = flow_typologies()
+
+        assert set(flows) == {"none", "fjell", "kyst"}
+        assert flows["kyst"].shape == (12,)
+        assert flows["kyst"][7] == 0.7
+
+    def test_lime_products(self):
+        table = lime_product_table()
+
+        assert "Standard Kalk Kat3" in table
+        assert "Description" not in table
+        assert table.value("CaPct", "Standard Kalk Kat3") == 39.6
+
+    def test_titration_curves_sorted(self):
+        for caco3, ph in titration_curves().values():
+            assert np.all(np.diff(caco3) >= 0)
+            assert np.all(np.diff(ph) >= 0)
+
+    def test_version_is_sha256(self):
+        assert len(REFERENCE_DATA.version("titration_curves")) == 64
+
+
+class TestSnapshot:
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "reference_data.npz")
+        datasets = build_snapshot(path)["datasets"]
+
+        def read(name):
+            return read_snapshot(name, datasets[name]["source_digest"], path)
+
+        assert read("lime_products").to_dict() == lime_product_table().to_dict()
+        flows = read("flow_typologies")
+        assert set(flows) == set(flow_typologies())
+        for prof, ref in flow_typologies().items():
+            assert np.array_equal(flows[prof], ref)
+        curves = read("titration_curves")
+        assert list(curves) == list(titration_curves())
+        for toc_class, (caco3, ph) in titration_curves().items():
+            assert np.array_equal(curves[toc_class][0], caco3)
+            assert np.array_equal(curves[toc_class][1], ph)
+        pd.testing.assert_frame_equal(read("comparison_factors"), comparison_factors())
+
+    def test_stale_or_missing_snapshot_is_ignored(self, tmp_path):
+        path = str(tmp_path / "reference_data.npz")
+        build_snapshot(path)
+
+        assert read_snapshot("flow_typologies", "0" * 64, path) is None
+        missing = str(tmp_path / "missing.npz")
+        assert read_snapshot("flow_typologies", "0" * 64, missing) is None
+
+    def test_unreadable_snapshot_is_ignored(self, tmp_path):
+        garbage = tmp_path / "garbage.npz"
+        garbage.write_bytes(b"not a snapshot")
+        truncated = tmp_path / "reference_data.npz"
+        build_snapshot(str(truncated))
+        truncated.write_bytes(truncated.read_bytes()[:200])
+
+        for path in (garbage, truncated):
+            with pytest.warns(UserWarning, match="is corrupt"):
+                assert read_snapshot("flow_typologies", "0" * 64, str(path)) is None
@@ -0,0 +1,42 @@
+import pandas as pd
+
+from src.lake_modelling.utils.regional_run import (
+    AGDER_LAKES,
+    LAKE_COLS,
+    iter_lakes,
+    run_regional,
+)
+
+PRODUCT_NAMES = ["Standard Kalk Kat3", "Microdol1"]
+
+
+class TestRegionalRun:
+    def test_iter_lakes(self):
+        ref_df = pd.read_csv(AGDER_LAKES, usecols=LAKE_COLS).dropna()
+        chunks = list(iter_lakes(AGDER_LAKES, chunk_size=7))
+        xl_chunks = list(iter_lakes("./data/agder_liming_data_tidy.xlsx", chunk_size=7))
+
+        assert max(len(df) for df in chunks) <= 7
+        assert pd.concat(chunks)["lake"].tolist() == ref_df["lake"].tolist()
+        assert list(xl_chunks[0].columns) == list(LAKE_COLS)
+        assert sum(len(df) for df in xl_chunks) > 0
+
+    def test_run_regional(self, tmp_path):
+        lakes_path = str(tmp_path / "lakes.csv")
+        out_path = str(tmp_path / "results.csv")
+        pd.read_csv(AGDER_LAKES).head(3).to_csv(lakes_path, index=False)
+
+        n_rows = run_regional(out_path, lakes_path, PRODUCT_NAMES, workers=1, chunk_size=2)
+        df = pd.read_csv(out_path)
+
+        assert n_rows == len(df) == 6
+        assert list(df.columns) == [
+            "lake",
+            "product",
+            "area_km2",
+            "mean_depth_m",
+            "tau_years",
+            "final_ph",
+            "min_ph",
+        ]
+        assert (df["min_ph"] <= df["final_ph"]).all()
@@ -0,0 +1,83 @@
+import sqlite3
+
+import numpy as np
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+from src.lake_modelling.utils.model_batch import ModelBatch
+from src.lake_modelling.utils.result_cache import ResultCache, model_key
+from src.lake_modelling.utils.test_model_batch import make_models
+
+test_product = LimeProduct("Microdol1")
+
+
+class TestResultCache:
+    def test_key_depends_on_inputs(self):
+        model = Model(Lake(), test_product)
+        key = model_key(model, 0.01, "odeint")
+
+        assert model_key(Model(Lake(), LimeProduct("Microdol1")), 0.01, "odeint") == key
+        assert model_key(model, 0.1, "odeint") != key
+        assert model_key(model, 0.01, "fast") != key
+        assert model_key(Model(Lake(depth=6), test_product), 0.01, "odeint") != key
+        assert model_key(Model(Lake(), test_product, lime_dose=11), 0.01, "odeint") != key
+
+    def test_model_run_uses_cache(self, tmp_path):
+        cache = ResultCache(str(tmp_path / "results.sqlite"))
+        ref = Model(Lake(), test_product).run(solver="fast", cache=cache)
+        model = Model(Lake(), test_product)
+        result = model.run(solver="fast", cache=cache)
+
+        assert np.array_equal(result.ca_mgpl, ref.ca_mgpl)
+        assert np.array_equal(result.ph, ref.ph)
+        assert model.solver_fallback_months == []
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_batch_solves_only_misses(self, tmp_path):
+        cache = ResultCache(str(tmp_path / "results.sqlite"))
+        refs = ModelBatch(make_models()).run()
+        ModelBatch(make_models()[::2]).run(cache=cache)
+        results = ModelBatch(make_models()).run(cache=cache)
+
+        assert cache.stats()["hits"] == 3
+        for ref, result in zip(refs, results):
+            assert np.allclose(result.ca_mgpl, ref.ca_mgpl, atol=1e-5)
+
+    def test_eviction(self, tmp_path):
+        cache = ResultCache(str(tmp_path / "results.sqlite"), max_bytes=2500)
+        for idx in range(3):
+            cache.put(str(idx), np.arange(100.0), np.arange(100.0) * idx)
+        stats = cache.stats()
+
+        assert stats["entries"] == 1
+        assert stats["evictions"] == 2
+        assert cache.get("0") is None
+        assert np.array_equal(cache.get("2")[1], np.arange(100.0) * 2)
+
+    def test_get_does_not_write(self, tmp_path):
+        cache = ResultCache(str(tmp_path / "results.sqlite"))
+        cache.put("0", np.arange(10.0), np.arange(10.0))
+
+        # Reads must not wait for another writer
+        con = sqlite3.connect(cache.path, timeout=0, isolation_level=None)
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            assert np.array_equal(cache.get("0")[1], np.arange(10.0))
+            assert cache.get("1") is None
+        finally:
+            con.execute("ROLLBACK")
+            con.close()
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    def test_eviction_uses_reads(self, tmp_path):
+        cache = ResultCache(str(tmp_path / "results.sqlite"), max_bytes=3300)
+        cache.put("0", np.arange(100.0), np.arange(100.0))
+        cache.put("1", np.arange(100.0), np.arange(100.0))
+        cache.get("0")
+        cache.put("2", np.arange(100.0), np.arange(100.0))
+
+        assert cache.get("0") is not None
+        assert cache.get("1") is None
+        assert ResultCache(cache.path).stats()["hits"] == 1
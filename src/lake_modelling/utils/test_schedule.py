@@ -0,0 +1,137 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+from src.lake_modelling.utils.schedule import (
+    PSS_MAX_STORES,
+    LimingSchedule,
+    events_from_records,
+    periodic_steady_state,
+    schedule_dCdt,
+    schedule_jacobian,
+)
+
+test_product = LimeProduct("Standard Kalk Kat3")
+
+
+class TestLimingSchedule:
+    def test_single_event_matches_model(self):
+        lake = Lake(depth=3, tau=0.5)
+        ref = Model(lake, test_product, lime_dose=20, lime_month=7, n_months=24)
+        ref_res = ref.run(dt=0.1)
+        res = LimingSchedule(
+            lake, [(0, 20, test_product, "wet")], start_month=7, n_months=24
+        ).run(dt=0.1)
+
+        assert np.allclose(res.time_months, ref_res.time_months)
+        assert np.allclose(res.ca_mgpl, ref_res.ca_mgpl, rtol=0, atol=1e-4)
+
+    def test_repeated_liming(self):
+        lake = Lake(depth=5, tau=2)
+        events = [(12 * year + 6, 15, test_product, "wet") for year in range(30)]
+        res = LimingSchedule(lake, events).run()
+        single = LimingSchedule(lake, events[:1], n_months=30 * 12 + 6).run()
+
+        assert len(res) == 10 * (30 * 12 + 6) + 1
+        # Lime carried over from earlier years raises Ca above a single event
+        assert res.ca_mgpl[-1] > single.ca_mgpl[-1]
+        assert np.all(res.ca_mgpl >= single.ca_mgpl - 1e-6)
+
+    def test_split_stores_match_single_store(self):
+        # Near saturation, so dissolution is limited by the saturation deficit
+        schedule = LimingSchedule(Lake(depth=3, tau=0.5), [], n_months=12)
+        C_lake = schedule.ca_aq_sat - 1
+        ti, ca, _, C_bott = schedule._solve_month(
+            C_lake, np.array([5.0]), np.array([0.0]), 0, 10
+        )
+        split_ti, split_ca, _, split_bott = schedule._solve_month(
+            C_lake, np.array([1.0, 1.5, 2.5]), np.zeros(3), 0, 10
+        )
+
+        assert np.allclose(split_ca, ca, rtol=0, atol=1e-6)
+        assert np.isclose(split_bott.sum(), C_bott[0], rtol=0, atol=1e-6)
+
+    def test_events_from_records(self):
+        lake = Lake(area=0.76, depth=14.6, tau=2.71)
+        df = pd.DataFrame(
+            {
+                "year": [1990, 1991, 1993],
+                "tonnes": [100, 0, 50],
+                "method": ["Båt", "Båt", "Helikopter"],
+            }
+        )
+        events = events_from_records(df, lake, test_product, lime_month=5)
+
+        assert [event[0] for event in events] == [4, 40]
+        assert [event[3] for event in events] == ["wet", "dry"]
+        assert np.isclose(events[0][1], 100e9 / lake.volume)
+
+
+class TestPeriodicSteadyState:
+    def test_jacobian_matches_finite_differences(self):
+        # The second store is limited by the saturation deficit
+        y = np.array([6.5, 1.0, 2.5])
+        args = (1e9, 5e9, 0.5, np.array([0.0, 12.0]), 0.1, 0.1, 8.5)
+        eps = 1e-6
+        fd = np.column_stack(
+            [
+                (
+                    schedule_dCdt(y + eps * e, 20.0, *args)
+                    - schedule_dCdt(y - eps * e, 20.0, *args)
+                )
+                / (2 * eps)
+                for e in np.eye(3)
+            ]
+        )
+
+        assert np.allclose(schedule_jacobian(y, 20.0, *args), fd, atol=1e-8)
+
+    def test_matches_long_schedule(self):
+        lake = Lake(depth=5, tau=2)
+        model = Model(lake, test_product, lime_dose=15, lime_month=6, spr_prop=0.8)
+        res, info = periodic_steady_state(model, dt=0.1)
+
+        events = [(12 * year, 15, test_product, "wet") for year in range(60)]
+        long_res = LimingSchedule(
+            lake, events, start_month=6, n_months=60 * 12, spr_prop=0.8
+        ).run(dt=0.1)
+
+        assert info["converged"]
+        assert info["n_iter"] <= 5
+        assert len(res) == 12 * 10 + 1
+        assert np.allclose(res.time_months, long_res.time_months[-len(res) :] - 59 * 12)
+        assert np.allclose(res.ca_mgpl, long_res.ca_mgpl[-len(res) :], atol=1e-5)
+
+    def test_store_count_is_bounded(self):
+        # Without inactivation, first-order decay is the only limit on the
+        # number of stores
+        lake = Lake(depth=5, tau=2)
+        model = Model(lake, test_product, lime_dose=5, lime_month=6, activity_const=0)
+        start = time.perf_counter()
+        res, info = periodic_steady_state(model, dt=0.1)
+        elapsed = time.perf_counter() - start
+
+        events = [(12 * year, 5, test_product, "wet") for year in range(40)]
+        long_res = LimingSchedule(
+            lake, events, start_month=6, n_months=40 * 12, activity_const=0
+        ).run(dt=0.1)
+
+        assert info["converged"]
+        assert info["method"] == "newton"
+        assert info["n_stores"] <= PSS_MAX_STORES
+        assert elapsed < 5
+        assert np.allclose(res.ca_mgpl, long_res.ca_mgpl[-len(res) :], atol=1e-5)
+
+    def test_forward_fallback(self):
+        model = Model(Lake(depth=5, tau=2), test_product, lime_dose=15, lime_month=6)
+        res, info = periodic_steady_state(model, dt=0.1)
+        # No Newton iterations allowed
+        fwd_res, fwd_info = periodic_steady_state(model, dt=0.1, max_iter=0)
+
+        assert info["method"] == "newton"
+        assert fwd_info["method"] == "forward"
+        assert fwd_info["converged"]
+        assert fwd_info["n_stores"] == info["n_stores"]
+        assert np.allclose(fwd_res.ca_mgpl, res.ca_mgpl, atol=1e-5)
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+from src.lake_modelling.utils.sensitivity import (
+    DEFAULT_PROBLEM,
+    morris_design,
+    morris_indices,
+    run_design,
+    saltelli_design,
+    scale_design,
+    sobol_indices,
+)
+
+NAMES = ["a", "b", "c"]
+
+
+def linear(X):
+    return 4 * X[:, 0] + 1 * X[:, 1]
+
+
+class TestSensitivity:
+    def test_morris_trajectories(self):
+        X = morris_design(3, 10, seed=1).reshape(10, 4, 3)
+
+        assert np.all((X >= 0) & (X <= 1))
+        assert np.all(np.count_nonzero(np.diff(X, axis=1), axis=2) == 1)
+
+        df = morris_indices(X.reshape(-1, 3), linear(X.reshape(-1, 3)), NAMES, seed=1)
+        assert np.allclose(df["mu"], [4, 1, 0])
+        assert np.allclose(df["mu_star_conf"], 0)
+
+    def test_sobol_indices(self):
+        X = saltelli_design(3, 1024, seed=1)
+        df = sobol_indices(linear(X), NAMES, seed=1)
+
+        # Variance shares 16/17 and 1/17, with no interactions
+        assert np.allclose(df["S1"], [16 / 17, 1 / 17, 0], atol=0.05)
+        assert np.allclose(df["ST"], [16 / 17, 1 / 17, 0], atol=0.05)
+        # Only the influential parameters have sampling uncertainty
+        assert np.all(df.loc[["a", "b"], "S1_conf"] > 0)
+
+    def test_scale_design(self):
+        X = np.array([[0, 0.5, 0.999], [1, 0, 0.5]])
+        params = scale_design(
+            {"depth": (1, 3), "flow_prof": ["fjell", "kyst"], "tau": (0, 1)}, X
+        )
+
+        assert params[0] == {"depth": 1, "flow_prof": "kyst", "tau": 0.999}
+        assert params[1] == {"depth": 3, "flow_prof": "fjell", "tau": 0.5}
+
+    def test_run_design_checkpoint(self, tmp_path):
+        X = morris_design(len(DEFAULT_PROBLEM), 1, seed=1)
+        Y = run_design(DEFAULT_PROBLEM, X, tmp_path, workers=1, batch_size=4)
+
+        assert Y.shape == (len(X), 2)
+        assert np.all(Y[:, 1] <= Y[:, 0])
+        assert len(list(tmp_path.glob("results_*.npy"))) == 3
+        assert np.array_equal(run_design(DEFAULT_PROBLEM, X, tmp_path), Y)
+
+        # Resuming with a different batch size only computes missing rows
+        os.remove(tmp_path / "results_00000004_00000008.npy")
+        Y_resumed = run_design(DEFAULT_PROBLEM, X, tmp_path, workers=1, batch_size=3)
+        assert np.array_equal(Y_resumed, Y)
+        assert (tmp_path / "results_00000004_00000007.npy").is_file()
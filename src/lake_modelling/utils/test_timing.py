@@ -0,0 +1,30 @@
+from src.lake_modelling.utils.lake_model import Lake, LimeProduct, Model
+from src.lake_modelling.utils.timing import record_timings, span
+
+
+class TestTiming:
+    def test_spans_recorded_only_when_enabled(self):
+        model = Model(Lake(), LimeProduct("Microdol1"))
+        model.run()
+        with record_timings() as timings:
+            model.run()
+            model.run(solver="fast")
+        model.run()
+
+        assert timings.spans["Model.run.solve[odeint]"][0] == 1
+        assert timings.spans["Model.run.solve[fast]"][0] == 1
+        assert timings.spans["Model.results.pH"][0] == 2
+        assert "Model.run.cache" not in timings.spans
+
+    def test_nested_recorders_share_spans(self):
+        with record_timings() as outer:
+            with record_timings() as inner:
+                with span("a"):
+                    pass
+            with span("a"):
+                pass
+        df = outer.to_frame()
+
+        assert inner is outer
+        assert df.loc["a", "calls"] == 2
+        assert list(df.columns) == ["calls", "total (ms)", "mean (ms)", "max (ms)"]
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from scipy.interpolate import interp1d
+
+from src.lake_modelling.utils.reference_data import titration_curves
+from src.lake_modelling.utils.titration import (
+    TOC_CLASSES,
+    caco3_to_ph,
+    ph_to_caco3,
+    toc_class_index,
+)
+
+
+class TestTitration:
+    def test_toc_class_index(self):
+        assert toc_class_index([0, 3, 3.1, 5, 5.1]).tolist() == [0, 0, 1, 1, 2]
+
+    def test_matches_interp1d(self):
+        caco3 = np.linspace(0, 120, 500)
+        for toc, label in zip((2, 4, 8), TOC_CLASSES):
+            xp, fp = titration_curves()[label]
+            interp = interp1d(xp, fp, fill_value="extrapolate")
+
+            assert np.allclose(caco3_to_ph(caco3, toc), interp(caco3))
+
+    def test_per_element_toc(self):
+        ph = np.full((2, 3), 5.5)
+        toc = np.array([[2], [8]])
+        res = ph_to_caco3(ph, toc)
+
+        assert res.shape == (2, 3)
+        assert res[0, 0] == ph_to_caco3(5.5, 2)
+        assert res[1, 0] == ph_to_caco3(5.5, 8)
+        assert res[0, 0] < res[1, 0]
+
+    def test_round_trip(self):
+        ph = np.linspace(4.5, 7, 50)
+
+        assert np.allclose(caco3_to_ph(ph_to_caco3(ph, 4), 4), ph)
+
+    def test_extrapolation_modes(self):
+        assert ph_to_caco3(4, 4, extrapolate="clip") == 0.5
+        assert np.isnan(ph_to_caco3(4, 4, extrapolate="nan"))
+        assert ph_to_caco3(4, 4, extrapolate="linear") < 0.5
+        with pytest.raises(AssertionError):
+            ph_to_caco3(4, 4, extrapolate="constant")
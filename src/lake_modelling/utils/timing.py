@@ -0,0 +1,88 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Recorder for the current context (thread, Streamlit session or asyncio task).
+# Set only while 'record_timings' is active. 'span' records timings only while a
+# recorder is installed, and is otherwise a no-op
+_RECORDER = ContextVar("timing_recorder", default=None)
+
+
+class TimingRecorder:
+    def __init__(self):
+        """Aggregates the time spent in named spans. Create with 'record_timings'."""
+        self.spans = {}
+
+    def add(self, name, elapsed):
+        """Add one call of span 'name' taking 'elapsed' seconds."""
+        count, total, longest = self.spans.get(name, (0, 0.0, 0.0))
+        self.spans[name] = (count + 1, total + elapsed, max(longest, elapsed))
+
+    def to_frame(self):
+        """Dataframe with one row per span, sorted by total time (descending).
+        Columns 'calls', 'total (ms)', 'mean (ms)' and 'max (ms)'.
+        """
+        df = pd.DataFrame(
+            [
+                (name, count, 1000 * total, 1000 * total / count, 1000 * longest)
+                for name, (count, total, longest) in self.spans.items()
+            ],
+            columns=["span", "calls", "total (ms)", "mean (ms)", "max (ms)"],
+        )
+
+        return df.set_index("span").sort_values("total (ms)", ascending=False)
+
+    def log(self, level=logging.INFO):
+        """Write a summary of the recorded spans to the module logger."""
+        for name, (count, total, longest) in sorted(
+            self.spans.items(), key=lambda item: -item[1][1]
+        ):
+            logger.log(
+                level,
+                "%s: %d calls, %.2f ms total, %.2f ms max",
+                name,
+                count,
+                1000 * total,
+                1000 * longest,
+            )
+
+
+@contextmanager
+def record_timings():
+    """Record all spans in the current context while the block runs. Nested
+    calls share the outermost recorder.
+
+    Returns
+        TimingRecorder.
+    """
+    recorder = _RECORDER.get()
+    if recorder is not None:
+        yield recorder
+        return
+
+    recorder = TimingRecorder()
+    token = _RECORDER.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _RECORDER.reset(token)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as span 'name' if timings are being recorded."""
+    recorder = _RECORDER.get()
+    if recorder is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add(name, time.perf_counter() - start)
@@ -0,0 +1,116 @@
+import numpy as np
+
+from src.lake_modelling.utils.reference_data import titration_curves
+
+# Labels used for the TOC classes in 'titration_curves_interpolated.xlsx',
+# ordered by class index (see 'toc_class_index')
+TOC_CLASSES = ("TOC ≤ 3", "3 < TOC ≤ 5", "TOC > 5")
+
+EXTRAPOLATION_MODES = ("linear", "clip", "nan")
+
+# Precomputed lookup tables. Rebuilt whenever the reference data is reloaded
+_TABLES = {"source": None}
+
+
+def toc_class_index(toc):
+    """Titration curve class for TOC concentration(s).
+
+    Args
+        toc: Float or array. TOC concentration (mg/l)
+
+    Returns
+        Int array of the same shape as 'toc'. Indices into 'TOC_CLASSES'.
+    """
+    toc = np.asarray(toc, dtype=float)
+    return np.where(toc <= 3, 0, np.where(toc <= 5, 1, 2))
+
+
+def _monotone(x, y):
+    """Drop repeated x-values (e.g. where the curves plateau at pH 7.5), keeping
+    the first, so that 'x' is strictly increasing.
+    """
+    keep = np.concatenate(([True], np.diff(x) > 0))
+    return x[keep], y[keep]
+
+
+def _tables():
+    """Dict of lookup tables {direction: [(xp, fp) for each TOC class]}."""
+    curves = titration_curves()
+    if _TABLES["source"] is not curves:
+        caco3_ph = [_monotone(*curves[label]) for label in TOC_CLASSES]
+        ph_caco3 = [_monotone(ph, caco3) for caco3, ph in map(curves.get, TOC_CLASSES)]
+        _TABLES.update(
+            {"caco3_to_ph": caco3_ph, "ph_to_caco3": ph_caco3, "source": curves}
+        )
+
+    return _TABLES
+
+
+def _interp(x, xp, fp, extrapolate):
+    """Piecewise-linear interpolation with the specified behaviour outside the
+    range of 'xp'.
+    """
+    res = np.interp(x, xp, fp)
+    if extrapolate == "linear":
+        # Same as scipy's interp1d(..., fill_value="extrapolate")
+        lo = x < xp[0]
+        hi = x > xp[-1]
+        res[lo] = fp[0] + (x[lo] - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0])
+        res[hi] = fp[-1] + (x[hi] - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+    elif extrapolate == "nan":
+        res[(x < xp[0]) | (x > xp[-1])] = np.nan
+
+    return res
+
+
+def _convert(direction, x, toc, extrapolate):
+    assert (
+        extrapolate in EXTRAPOLATION_MODES
+    ), f"'extrapolate' must be one of {EXTRAPOLATION_MODES}."
+    tables = _tables()[direction]
+    x, cls = np.broadcast_arrays(
+        np.asarray(x, dtype=float), toc_class_index(toc)
+    )
+    res = np.empty(x.shape)
+    for idx, (xp, fp) in enumerate(tables):
+        mask = cls == idx
+        if mask.all():
+            res = _interp(x.ravel(), xp, fp, extrapolate).reshape(x.shape)
+            break
+        if mask.any():
+            res[mask] = _interp(x[mask], xp, fp, extrapolate)
+
+    return res[()] if res.ndim == 0 else res
+
+
+def ph_to_caco3(ph, toc, extrapolate="linear"):
+    """Estimate CaCO3 concentration from pH based on titration curves.
+
+    Args
+        ph:          Float or array. pH (dimensionless)
+        toc:         Float or array broadcastable with 'ph'. TOC concentration
+                     (mg/l) used to choose the titration curve for each element
+        extrapolate: Str. Behaviour outside the range of the titration curves.
+                     'linear' extends the first/last segment of the curve, 'clip'
+                     returns the value at the nearest end of the curve and 'nan'
+                     returns NaN. Default 'linear'
+
+    Returns
+        Float or array. CaCO3 concentration (mg/l).
+    """
+    return _convert("ph_to_caco3", ph, toc, extrapolate)
+
+
+def caco3_to_ph(caco3, toc, extrapolate="linear"):
+    """Estimate pH from CaCO3 concentration based on titration curves.
+
+    Args
+        caco3:       Float or array. CaCO3 concentration (mg/l)
+        toc:         Float or array broadcastable with 'caco3'. TOC concentration
+                     (mg/l) used to choose the titration curve for each element
+        extrapolate: Str. See 'ph_to_caco3'
+
+    Returns
+        Float or array. pH (dimensionless).
+    """
+    return _convert("caco3_to_ph", caco3, toc, extrapolate)
@@ -129,4 +129,43 @@ def get_model_params():
         n_months,
     )
 
-    return model_params
\ No newline at end of file
+    return model_params
+
+
+def get_target_params(n_months):
+    """Widgets for the target pH used to find the required dose of each product.
+
+    Args
+        n_months: Int. Number of months simulated. Upper limit for the month the
+                  target applies to
+
+    Returns
+        Tuple (target_ph, at_month, criterion). 'criterion' is "final" if the
+        target is the pH 'at_month' months after liming, or "min" if it is the
+        lowest pH up to that month.
+    """
+    st.markdown("### Nødvendig kalkdose")
+    with st.expander("Hjelp"):
+        st.markdown(
+            """
+        For hvert produkt i databasen beregner modellen den minste kalkdosen som gir 
+        ønsket pH i innsjøen, med kalkingsparameterne angitt ovenfor. Målet kan gjelde 
+        pH ved slutten av perioden, eller laveste pH gjennom hele perioden.
+        """
+        )
+    col1, col2 = st.columns(2)
+    target_ph = col1.number_input(
+        "Ønsket pH", min_value=4.5, max_value=7.0, value=6.0, step=0.1
+    )
+    at_month = col2.number_input(
+        "Måneder etter kalking", min_value=1, max_value=n_months, value=n_months
+    )
+    criterion = col1.selectbox(
+        "Krav", ("pH ved slutten av perioden", "Laveste pH i perioden"), index=0
+    )
+    if criterion == "pH ved slutten av perioden":
+        criterion = "final"
+    else:
+        criterion = "min"
+
+    return target_ph, at_month, criterion
@@ -1,8 +1,42 @@
+import hashlib
+
 import streamlit as st
+from src.col_tests.utils.column_tests import get_all_test_results
 from src.col_tests.utils.display_results import display_results
 from src.col_tests.utils.read_input import read_template
 
 
+def _process_upload(data_file):
+    """Parse, check and integrate an uploaded template, once per file content.
+
+    The results for the most recent upload are kept in the session state under
+    the SHA-256 digest of the file, so reruns (e.g. after changing a widget or
+    returning to this page) reuse them. Only one upload is kept per session.
+
+    Args
+        data_file: UploadedFile. Completed Excel template
+
+    Returns
+        Dict with keys 'par_df', 'inst_df', 'od_df' and 'results' (see
+        'get_all_test_results').
+    """
+    digest = hashlib.sha256(data_file.getvalue()).hexdigest()
+    processed = st.session_state.get("col_test_upload")
+    if processed is None or processed["digest"] != digest:
+        par_df, inst_df, od_df = read_template(data_file)
+        results = get_all_test_results(par_df.to_dict()["Value"], inst_df, od_df)
+        processed = {
+            "digest": digest,
+            "par_df": par_df,
+            "inst_df": inst_df,
+            "od_df": od_df,
+            "results": results,
+        }
+        st.session_state["col_test_upload"] = processed
+
+    return processed
+
+
 def app():
     """Main function for the 'column_test' page."""
 
@@ -42,11 +76,12 @@ def app():
         data_file = st.session_state["data_file"]
         with st.spinner("Leser data..."):
             st.markdown(f"**Filnavn:** `{data_file.name}`")
-            read_template(data_file)
+            processed = _process_upload(data_file)
 
-            par_df = st.session_state["par_df"]
-            inst_df = st.session_state["inst_df"]
-            od_df = st.session_state["od_df"]
+            par_df = processed["par_df"]
+            inst_df = processed["inst_df"]
+            od_df = processed["od_df"]
+            results = processed["results"]
 
             # Print basic info for test as a whole
             par_val_dict = par_df.to_dict()["Value"]
@@ -75,6 +110,7 @@ def app():
                     element="Ca",
                     test_type="instantaneous",
                     method="trapezoidal",
+                    results_df=results[("Ca", "instantaneous")],
                 )
             # Overdosing test
             with right_col:
@@ -84,10 +120,11 @@ def app():
                     element="Ca",
                     test_type="overdosing",
                     method="trapezoidal",
+                    results_df=results[("Ca", "overdosing")],
                 )
 
             # Display Mg results if data present
-            if inst_df["Mg_mg/l"].sum() != 0:
+            if ("Mg", "instantaneous") in results:
                 subheader("Magnesium resultater")
                 left_col, right_col = st.columns(2)
                 with left_col:
@@ -98,6 +135,7 @@ def app():
                         element="Mg",
                         test_type="instantaneous",
                         method="trapezoidal",
+                        results_df=results[("Mg", "instantaneous")],
                     )
                 with right_col:
                     # Overdosing test
@@ -107,6 +145,7 @@ def app():
                         element="Mg",
                         test_type="overdosing",
                         method="trapezoidal",
+                        results_df=results[("Mg", "overdosing")],
                     )
 
     return None
\ No newline at end of file
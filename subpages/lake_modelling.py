@@ -1,6 +1,7 @@
+import logging
+
 import streamlit as st
 from src.lake_modelling.utils.lake_model import (
-    LIME_PRODUCTS_DATA,
     Lake,
     LimeProduct,
     MM_Ca,
@@ -9,23 +10,90 @@ from src.lake_modelling.utils.lake_model import (
     MM_MgCO3,
 )
 from src.lake_modelling.utils.read_products import lime_product_names, lime_products
+from src.lake_modelling.utils.reference_data import LIME_PRODUCTS_DATA, REFERENCE_DATA
+from src.lake_modelling.utils.result_cache import ResultCache
 from src.lake_modelling.utils.run_products import (
+    find_required_doses,
     plot_multiple_products,
+    plot_product_ensemble,
     run_multiple_products,
+    run_product_ensemble,
+)
+from src.lake_modelling.utils.timing import record_timings, span
+from src.lake_modelling.utils.user_inputs import (
+    get_lake_params,
+    get_model_params,
+    get_product,
+    get_target_params,
 )
-from src.lake_modelling.utils.user_inputs import get_lake_params, get_product
+
+# Maximum number of entries kept by each of the caches below. Entries are shared
+# between sessions
+CACHE_ENTRIES = 64
+
+
+# The cached functions take the lime product database version as an argument,
+# so that cached results are not reused after the database is reloaded
+
+
+@st.cache_data(max_entries=1)
+def _product_names(db_version):
+    return lime_product_names(lime_products(LIME_PRODUCTS_DATA))
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES)
+def _lime_product(name, db_version):
+    return LimeProduct(name)
+
+
+@st.cache_resource
+def _result_cache():
+    return ResultCache()
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def _run_products(lake_params, products, model_params, db_version):
+    lake = Lake(*lake_params)
+    return run_multiple_products(lake, products, model_params, cache=_result_cache())
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def _run_ensemble(lake_params, product, model_params, db_version):
+    lake = Lake(*lake_params)
+    return run_product_ensemble(lake, product, model_params)
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def _required_doses(lake_params, products, model_params, target_params, db_version):
+    lake = Lake(*lake_params)
+    return find_required_doses(lake, products, model_params, *target_params)
 
 
 def app():
     """Main function for the 'lake_modelling' page."""
+    with record_timings() as timings:
+        with span("lake_modelling.page"):
+            _page()
+    timings.log(logging.DEBUG)
+
+    # Add '?debug=1' to the URL to show where the time was spent
+    if st.query_params.get("debug") == "1":
+        with st.expander("Tidsbruk (debug)"):
+            st.dataframe(timings.to_frame().round(2), use_container_width=True)
+
+    return None
+
+
+def _page():
     # plot_lib = st.selectbox(
     #     "Choose a plotting library:", options=["Altair", "Matplotlib"]
     # )
     plot_lib = "Altair"
 
-    products = lime_product_names(lime_products(LIME_PRODUCTS_DATA))
+    db_version = REFERENCE_DATA.version("lime_products")
+    products = _product_names(db_version)
     name = get_product(products)
-    prod = LimeProduct(name)
+    prod = _lime_product(name, db_version)
     st.markdown(
         f"**Sammensetning etter masse:** {prod.ca_pct:.1f} % Ca ({prod.ca_pct*MM_CaCO3/MM_Ca:.1f} % CaCO3) "
         f"og {prod.mg_pct:.1f} % Mg ({prod.mg_pct*MM_MgCO3/MM_Mg:.1f} % MgCO3)."
@@ -33,14 +101,22 @@ def app():
     st.markdown(
         f"**Nøytraliserende verdi:** {prod.ca_pct*MM_CaCO3/MM_Ca + 1.19*prod.mg_pct*MM_MgCO3/MM_Mg:.1f} %."
     )
-    prod.plot_column_data(plot_lib)
+    with span("lake_modelling.plot_column_data"):
+        prod.plot_column_data(plot_lib)
 
     st.markdown("## Innsjømodellering")
-    area, depth, tau, flow_prof, pH_lake0, pH_inflow, toc_lake0 = get_lake_params()
-    lake = Lake(area, depth, tau, flow_prof, pH_lake0, pH_inflow, toc_lake0)
-    lake.plot_flow_profile(plot_lib)
+    lake_params = get_lake_params()
+    area, depth, tau, flow_prof, pH_lake0, pH_inflow, toc_lake0 = lake_params
+    lake = Lake(*lake_params)
+    with span("lake_modelling.plot_flow_profile"):
+        lake.plot_flow_profile(plot_lib)
 
-    res_df = run_multiple_products(lake, products)
+    model_params = get_model_params()
+    lime_dose, spr_prop = model_params[0], model_params[3]
+    lime_tonnes = spr_prop * lime_dose * lake.volume / 1e9
+    st.markdown(f"**Amount of product added: {lime_tonnes:.2f} tonnes.**")
+    with span("lake_modelling.run_products"):
+        res_df = _run_products(lake_params, products, model_params, db_version)
     st.markdown("### Modell resultater")
     # with st.expander("Help"):
     #     st.markdown(
@@ -68,6 +144,28 @@ def app():
         Stiplede horisontale linjer på pH-plottet markerer innsjøens start- og innløps-pH.
         """
         )
-    plot_multiple_products(res_df, pH_lake0, pH_inflow, plot_lib)
+    with span("lake_modelling.plot_multiple_products"):
+        plot_multiple_products(res_df, pH_lake0, pH_inflow, plot_lib)
+
+    if st.checkbox(f"Vis usikkerhet (5–95 %) for {name}"):
+        st.markdown(
+            "Modellen kjøres for mange kombinasjoner av usikre parametere "
+            "(oppløsningsrater, løselighet og kolonnetestdata). Det skraverte "
+            "området viser 5–95 % av resultatene, og linjen viser medianen."
+        )
+        with span("lake_modelling.ensemble"):
+            ens_df = _run_ensemble(lake_params, name, model_params, db_version)
+            plot_product_ensemble(ens_df, name)
+
+    target_params = get_target_params(model_params[-1])
+    with span("lake_modelling.required_doses"):
+        dose_df = _required_doses(
+            lake_params, products, model_params, target_params, db_version
+        )
+    st.dataframe(
+        dose_df.style.format({"Dose (mg/l)": "{:.1f}", "Mengde (tonn)": "{:.2f}"}),
+        hide_index=True,
+        use_container_width=True,
+    )
 
     return None
\ No newline at end of file